@@ -0,0 +1,54 @@
+import sys
+import os
+import math
+import time
+import multiprocessing as mp
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import kernels
+from common.backends import BACKENDS
+
+# Times each kernel on every execution backend. ``scalar_example1`` is a
+# custom operation written as a plain Python loop: it holds the GIL, so only
+# the process backend can spread it across cores.
+
+def _scalar_example1_block(x: np.ndarray, out: np.ndarray, scratch):
+    for i in range(len(x)):
+        v = float(x[i])
+        out[i] = ((math.sin(v) + math.cos(v)) ** 2) / (math.sqrt(abs(v)) + 1)
+
+SCALAR_EXAMPLE1 = kernels.register_kernel(kernels.Kernel(
+    "scalar_example1", "double", np.float64, np.float64,
+    _scalar_example1_block, lambda size: [], releases_gil=False
+))
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]
+    cores = mp.cpu_count()
+    backends = {name: backend_cls(cores) for name, backend_cls in BACKENDS.items()}
+
+    print(f"cores={cores}")
+    print(f"{'kernel':<18}{'elements':>12}" + "".join(f"{name + ' s':>12}" for name in backends))
+    for kernel in (kernels.EXAMPLE1, SCALAR_EXAMPLE1):
+        for size in sizes:
+            segment = np.random.uniform(1.0, 100.0, size=size)
+            expected = kernels.EXAMPLE1(segment)
+            row = f"{kernel.name:<18}{size:>12}"
+            for name, backend in backends.items():
+                key = f"{kernel.name}-{size}"
+                placed = backend.place(key, segment)
+                backend.run(kernel, key, placed)  # warm-up: pool start and placement
+
+                start = time.perf_counter()
+                result = backend.run(kernel, key, placed)
+                row += f"{time.perf_counter() - start:>12.4f}"
+                assert np.allclose(result, expected)
+                backend.release(key)
+            print(row)
+
+    for backend in backends.values():
+        backend.shutdown()
+
+if __name__ == "__main__":
+    main()
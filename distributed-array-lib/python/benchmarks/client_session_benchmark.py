@@ -0,0 +1,80 @@
+import socket
+import sys
+import os
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.message import Message, MessageType, MessageReader, send_message
+from common.session import ClientSession, ConnectionPool
+
+# Small-request throughput against a running cluster: a GET_RESULT for a tiny,
+# already completed job, issued with a fresh socket per request (the previous
+# client behaviour), over one session sequentially, pipelined on one session,
+# and from several threads sharing a connection pool.
+
+ARRAY_ID = "session-bench"
+
+def one_shot_request(host: str, port: int, data: dict) -> Message:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.connect((host, port))
+        send_message(sock, Message(MessageType.GET_RESULT, "bench", "master", data))
+        return MessageReader(sock).read_message()
+
+def measure(label: str, count: int, run):
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24}{count:>10}{elapsed:>10.3f}{count / elapsed:>14.0f}")
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: client_session_benchmark.py <master_host> <master_port> [requests] [threads]")
+        sys.exit(1)
+
+    host = sys.argv[1]
+    port = int(sys.argv[2])
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    threads = int(sys.argv[4]) if len(sys.argv) > 4 else 8
+
+    session = ClientSession(host, port, "bench")
+    values = np.arange(1.0, 65.0)
+    chunk = Message(MessageType.ARRAY_CHUNK, "bench", "master", {"arrayId": ARRAY_ID, "offset": 0}, payload=values)
+    session.request(MessageType.CREATE_ARRAY,
+                    {"arrayId": ARRAY_ID, "dataType": "double", "totalSize": len(values), "streaming": True},
+                    chunks=[chunk])
+    session.request(MessageType.APPLY_OPERATION, {"arrayId": ARRAY_ID, "operation": "example1"})
+    request = {"arrayId": ARRAY_ID, "timeout": 10}
+    assert session.request(MessageType.GET_RESULT, request).data['status'] == 'complete'
+
+    print(f"{'mode':<24}{'requests':>10}{'seconds':>10}{'ops/sec':>14}")
+
+    measure("one-shot sockets", count,
+            lambda: [one_shot_request(host, port, request) for _ in range(count)])
+
+    measure("session sequential", count,
+            lambda: [session.request(MessageType.GET_RESULT, request) for _ in range(count)])
+
+    def pipelined():
+        futures = [session.submit(MessageType.GET_RESULT, request) for _ in range(count)]
+        for future in futures:
+            future.result()
+    measure("session pipelined", count, pipelined)
+
+    pool = ConnectionPool(host, port, size=4, client_id="bench")
+    with ThreadPoolExecutor(max_workers=threads) as callers:
+        def pooled():
+            per_thread = count // threads
+            futures = [callers.submit(lambda: [pool.request(MessageType.GET_RESULT, request)
+                                               for _ in range(per_thread)])
+                       for _ in range(threads)]
+            for future in futures:
+                future.result()
+        measure(f"pool ({threads} threads)", count // threads * threads, pooled)
+
+    pool.close()
+    session.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+import csv
+import json
+import logging
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.message import Message, MessageType
+from common.session import ClientSession
+from common import kernels
+from common.loopback import LoopbackCluster
+
+# End-to-end benchmark of a local cluster, for tracking performance between
+# commits. For every worker count it starts a master and that many workers,
+# then for every dtype and array size measures:
+#
+#   create    streaming CREATE_ARRAY until every copy is acknowledged
+#   apply     APPLY_OPERATION plus GET_RESULT of its job (the dtype's kernel)
+#   get       GET_RESULT of a finished job, i.e. fetching the result alone
+#   recovery  apply after SIGKILLing a worker, on a fresh cluster per trial
+#             (two or more workers only)
+#
+# Each row reports latency percentiles over the trials, throughput in
+# elements and MB per second at the median, and for apply and recovery the
+# speedup over running the same kernel on the whole array in this process.
+# transport= picks how the nodes are run: "tcp" (the default) starts one
+# process per node on free ports; "unix" runs the master here and a process
+# per worker over Unix sockets; "memory" runs the whole cluster in this
+# process, which leaves out the network stack to show the compute and
+# scheduling costs. Options are name=value, e.g.
+#
+#   cluster_benchmark.py workers=1,2,4 sizes=1000000,4000000 dtypes=double,int
+#                        trials=5 json=run.json csv=run.csv compare=previous.json
+#
+# With compare=, rows are matched with those of an earlier JSON report and
+# median latencies that moved by more than tolerance= (default 0.1) are flagged.
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MASTER = os.path.join(HERE, "master", "master_node.py")
+WORKER = os.path.join(HERE, "worker", "worker_node.py")
+
+DEFAULTS = {
+    "workers": "1,2,4",
+    "sizes": "1000000,4000000",
+    "dtypes": "double,int",
+    "workloads": "create,apply,get,recovery",
+    "trials": "5",
+    "tolerance": "0.1",
+    "transport": "tcp",
+}
+OPERATIONS = {"double": kernels.EXAMPLE1.name, "int": kernels.EXAMPLE2.name}
+CHUNK_SIZE = 1 << 20
+STARTUP_TIMEOUT = 30.0
+JOB_TIMEOUT = 120.0
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+def make_array(dtype: str, size: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    if dtype == "int":
+        return rng.integers(1, 1001, size, dtype=np.int32)
+    return rng.uniform(1.0, 100.0, size)
+
+class LocalCluster:
+    """A master and ``workers`` worker processes on free local ports."""
+
+    def __init__(self, workers: int, log_dir: str):
+        self.port = free_port()
+        self.processes = [subprocess.Popen([sys.executable, MASTER, str(self.port)], cwd=log_dir,
+                                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)]
+        self.session: Optional[ClientSession] = None
+        try:
+            self.connect()
+            for i in range(workers):
+                self.processes.append(subprocess.Popen(
+                    [sys.executable, WORKER, f"worker-{i}", "localhost", str(self.port)],
+                    cwd=log_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            self.wait_for_workers(workers)
+        except BaseException:
+            self.stop()
+            raise
+
+    def connect(self):
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            try:
+                socket.create_connection(("localhost", self.port)).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Master did not start listening on port {self.port}")
+                time.sleep(0.05)
+        self.session = ClientSession("localhost", self.port, "cluster-bench")
+
+    def wait_for_workers(self, workers: int):
+        # Registered workers answer METRICS, so the reply lists them
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while len(self.session.request(MessageType.METRICS, {}).data['workers']) < workers:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{workers} workers did not register within {STARTUP_TIMEOUT}s")
+            time.sleep(0.05)
+
+    def create(self, array_id: str, dtype: str, values: np.ndarray):
+        chunks = [Message(MessageType.ARRAY_CHUNK, "cluster-bench", "master",
+                          {"arrayId": array_id, "offset": offset}, payload=values[offset:offset + CHUNK_SIZE])
+                  for offset in range(0, len(values), CHUNK_SIZE)]
+        response = self.session.request(
+            MessageType.CREATE_ARRAY,
+            {"arrayId": array_id, "dataType": dtype, "totalSize": len(values), "streaming": True},
+            chunks=chunks, timeout=JOB_TIMEOUT)
+        if response.data.get('status') != 'created':
+            raise RuntimeError(f"Could not create {array_id}: {response.data}")
+
+    def apply(self, array_id: str, operation: str) -> np.ndarray:
+        response = self.session.request(MessageType.APPLY_OPERATION,
+                                        {"arrayId": array_id, "operation": operation})
+        if response.data.get('status') != 'processing':
+            raise RuntimeError(f"Could not apply {operation} to {array_id}: {response.data}")
+        return self.get(array_id, response.data['jobId'])
+
+    def get(self, array_id: str, job_id: Optional[str] = None) -> np.ndarray:
+        response = self.session.request(
+            MessageType.GET_RESULT,
+            {"arrayId": array_id, "jobId": job_id, "timeout": JOB_TIMEOUT, "binary": True},
+            timeout=JOB_TIMEOUT + 5)
+        if response.data.get('status') != 'complete':
+            raise RuntimeError(f"Job on {array_id} did not complete: {response.data}")
+        return response.payload
+
+    def kill_worker(self, index: int):
+        self.processes[index + 1].send_signal(signal.SIGKILL)
+
+    def stop(self):
+        if self.session is not None:
+            self.session.close()
+        for process in self.processes:
+            process.kill()
+            process.wait()
+
+class LoopbackLocalCluster(LocalCluster):
+    """The same cluster without TCP, as a ``LoopbackCluster``."""
+
+    def __init__(self, workers: int, processes: bool):
+        self.cluster = LoopbackCluster(workers, processes).start()
+        self.session = self.cluster.session("cluster-bench")
+
+    def kill_worker(self, index: int):
+        self.cluster.kill_worker(index)
+
+    def stop(self):
+        self.session.close()
+        self.cluster.stop()
+
+def start_cluster(transport: str, workers: int, log_dir: str) -> LocalCluster:
+    if transport == "tcp":
+        return LocalCluster(workers, log_dir)
+    return LoopbackLocalCluster(workers, processes=transport == "unix")
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+def summarize(workload: str, transport: str, workers: int, dtype: str, size: int, times: List[float],
+              baseline: Optional[float]) -> Dict[str, Any]:
+    nbytes = size * np.dtype(np.int32 if dtype == "int" else np.float64).itemsize
+    median = float(np.median(times))
+    row = {"workload": workload, "transport": transport, "workers": workers, "dtype": dtype, "size": size,
+           "trials": len(times)}
+    for name, percentile in (("p50", 50), ("p90", 90), ("p99", 99)):
+        row[name] = float(np.percentile(times, percentile))
+    row.update({
+        "min": min(times),
+        "max": max(times),
+        "mean": float(np.mean(times)),
+        "elementsPerSecond": size / median,
+        "mbPerSecond": nbytes / median / 1e6,
+        "baseline": baseline,
+        "speedup": baseline / median if baseline is not None else None,
+    })
+    return row
+
+def numpy_baseline(dtype: str, values: np.ndarray, trials: int) -> float:
+    kernel = kernels.KERNELS[OPERATIONS[dtype]]
+    return float(np.median([timed(kernel, values) for _ in range(trials)]))
+
+def run_cluster(transport: str, workers: int, dtypes: List[str], sizes: List[int], workloads: List[str],
+                trials: int, baselines: Dict, log_dir: str) -> List[Dict[str, Any]]:
+    rows = []
+    cluster = start_cluster(transport, workers, log_dir)
+    try:
+        # The first large payloads on a cluster start pools and codec probes;
+        # keep that out of the first trial
+        warmup = make_array("double", 1 << 18, 0)
+        cluster.create("warmup", "double", warmup)
+        cluster.apply("warmup", OPERATIONS["double"])
+        for dtype in dtypes:
+            operation = OPERATIONS[dtype]
+            for size in sizes:
+                values = make_array(dtype, size, size)
+                expected = kernels.KERNELS[operation](values)
+                # The arrays of create trials stay on the workers; the last one is used below
+                array_ids = [f"{dtype}-{size}-{trial}" for trial in range(trials if "create" in workloads else 1)]
+                times = [timed(cluster.create, array_id, dtype, values) for array_id in array_ids]
+                if "create" in workloads:
+                    rows.append(summarize("create", transport, workers, dtype, size, times, None))
+
+                array_id = array_ids[-1]
+                result = cluster.apply(array_id, operation)
+                if not np.allclose(result, expected):
+                    raise RuntimeError(f"Wrong result of {operation} on {array_id}")
+                if "apply" in workloads:
+                    times = [timed(cluster.apply, array_id, operation) for _ in range(trials)]
+                    rows.append(summarize("apply", transport, workers, dtype, size, times,
+                                          baselines[(dtype, size)]))
+                if "get" in workloads:
+                    times = [timed(cluster.get, array_id) for _ in range(trials)]
+                    rows.append(summarize("get", transport, workers, dtype, size, times, None))
+    finally:
+        cluster.stop()
+    return rows
+
+def recovery_trial(transport: str, workers: int, dtype: str, size: int, values: np.ndarray, log_dir: str) -> float:
+    cluster = start_cluster(transport, workers, log_dir)
+    try:
+        operation = OPERATIONS[dtype]
+        cluster.create("recovery", dtype, values)
+        cluster.apply("recovery", operation)
+        cluster.kill_worker(workers - 1)
+        start = time.perf_counter()
+        result = cluster.apply("recovery", operation)
+        elapsed = time.perf_counter() - start
+        if len(result) != size:
+            raise RuntimeError("Recovered result has the wrong length")
+        return elapsed
+    finally:
+        cluster.stop()
+
+def git_revision() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=HERE,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+def compare(rows: List[Dict[str, Any]], previous_path: str, tolerance: float) -> List[str]:
+    """Lines comparing median latencies with an earlier report; moves beyond ``tolerance`` are flagged."""
+    def key(row):
+        return row["workload"], row.get("transport", "tcp"), row["workers"], row["dtype"], row["size"]
+
+    with open(previous_path) as f:
+        previous = {key(row): row for row in json.load(f)["results"]}
+    lines = []
+    for row in rows:
+        old = previous.get(key(row))
+        if old is None:
+            continue
+        change = row["p50"] / old["p50"] - 1
+        flag = "" if abs(change) <= tolerance else ("  SLOWER" if change > 0 else "  faster")
+        lines.append(f"{row['workload']:<10}{row['workers']:>8}{row['dtype']:>8}{row['size']:>10}"
+                     f"{old['p50'] * 1e3:>12.1f}{row['p50'] * 1e3:>12.1f}{change:>+9.1%}{flag}")
+    return lines
+
+def main():
+    options = dict(DEFAULTS, **dict(arg.split('=', 1) for arg in sys.argv[1:]))
+    worker_counts = [int(n) for n in options["workers"].split(',')]
+    sizes = [int(n) for n in options["sizes"].split(',')]
+    dtypes = options["dtypes"].split(',')
+    workloads = options["workloads"].split(',')
+    trials = int(options["trials"])
+    transport = options["transport"]
+    # In-process nodes log to the working directory, which becomes log_dir
+    for name in ("json", "csv", "compare"):
+        if name in options:
+            options[name] = os.path.abspath(options[name])
+    if transport == "memory":
+        logging.disable(logging.CRITICAL)
+
+    baselines = {(dtype, size): numpy_baseline(dtype, make_array(dtype, size, size), trials)
+                 for dtype in dtypes for size in sizes}
+    rows = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as log_dir:
+        os.chdir(log_dir)
+        for workers in worker_counts:
+            rows += run_cluster(transport, workers, dtypes, sizes, workloads, trials, baselines, log_dir)
+            if "recovery" not in workloads or workers < 2:
+                continue
+            for dtype in dtypes:
+                for size in sizes:
+                    values = make_array(dtype, size, size)
+                    times = [recovery_trial(transport, workers, dtype, size, values, log_dir)
+                             for _ in range(trials)]
+                    rows.append(summarize("recovery", transport, workers, dtype, size, times,
+                                          baselines[(dtype, size)]))
+        os.chdir(cwd)
+
+    print(f"{'workload':<10}{'workers':>8}{'dtype':>8}{'size':>10}{'p50 ms':>10}{'p90 ms':>10}"
+          f"{'p99 ms':>10}{'Melem/s':>10}{'MB/s':>10}{'speedup':>9}")
+    for row in rows:
+        speedup = f"{row['speedup']:>9.2f}" if row['speedup'] is not None else f"{'-':>9}"
+        print(f"{row['workload']:<10}{row['workers']:>8}{row['dtype']:>8}{row['size']:>10}"
+              f"{row['p50'] * 1e3:>10.1f}{row['p90'] * 1e3:>10.1f}{row['p99'] * 1e3:>10.1f}"
+              f"{row['elementsPerSecond'] / 1e6:>10.2f}{row['mbPerSecond']:>10.1f}{speedup}")
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.time(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(),
+                 "numpy": np.__version__, "cpus": os.cpu_count()},
+        "options": options,
+        "results": rows,
+    }
+    if "json" in options:
+        with open(options["json"], 'w') as f:
+            json.dump(report, f, indent=2)
+    if "csv" in options:
+        with open(options["csv"], 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["workload"])
+            writer.writeheader()
+            writer.writerows(rows)
+    if "compare" in options:
+        print()
+        print(f"{'workload':<10}{'workers':>8}{'dtype':>8}{'size':>10}{'before ms':>12}{'after ms':>12}"
+              f"{'change':>9}")
+        print("\n".join(compare(rows, options["compare"], float(options["tolerance"]))))
+
+if __name__ == "__main__":
+    main()
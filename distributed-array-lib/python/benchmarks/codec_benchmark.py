@@ -0,0 +1,70 @@
+import sys
+import os
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import compression
+from common.compression import CODECS, CodecPolicy
+
+# Payload codecs on typical segment contents. The first table is each
+# codec's ratio (wire bytes / raw bytes) and its encode and decode speed on
+# one segment. The second is the effective throughput of shipping the
+# segment over links of LINK_MB_PER_S: raw bytes / (encode + wire bytes /
+# link + decode), for the codec CodecPolicy picks at that rate and for the
+# raw bytes. A codec only pays off while it runs faster than the link.
+
+SEGMENT_ELEMENTS = 1 << 22
+LINK_MB_PER_S = [50.0, 125.0, 1250.0]
+
+def payloads(rng: np.random.Generator):
+    return {
+        "int uniform 1-1000": rng.integers(1, 1001, SEGMENT_ELEMENTS).astype(np.int32),
+        "int sorted ids": np.sort(rng.integers(0, 1 << 30, SEGMENT_ELEMENTS)).astype(np.int32),
+        "int stride 3": (np.arange(SEGMENT_ELEMENTS) * 3).astype(np.int32),
+        "int full range": rng.integers(-2**31, 2**31 - 1, SEGMENT_ELEMENTS).astype(np.int32),
+        "double uniform": rng.random(SEGMENT_ELEMENTS // 2),
+        "double 1 decimal": np.round(rng.random(SEGMENT_ELEMENTS // 2) * 100, 1),
+        "double sparse": np.where(rng.random(SEGMENT_ELEMENTS // 2) < 0.05, rng.random(SEGMENT_ELEMENTS // 2), 0.0),
+    }
+
+def measure(codec: str, array: np.ndarray):
+    start = time.perf_counter()
+    data = compression.encode(codec, array)
+    encode = time.perf_counter() - start
+    start = time.perf_counter()
+    decoded = compression.decode(codec, data, array.dtype, array.shape)
+    decode = time.perf_counter() - start
+    assert np.array_equal(decoded, array)
+    return len(data), encode, decode
+
+def main():
+    rng = np.random.default_rng(int(sys.argv[1]) if len(sys.argv) > 1 else 0)
+    cases = payloads(rng)
+
+    print(f"segments of {SEGMENT_ELEMENTS * 4 >> 20} MB")
+    print(f"{'payload':<20}{'codec':>15}{'ratio':>8}{'encode MB/s':>13}{'decode MB/s':>13}")
+    results = {}
+    for name, array in cases.items():
+        for codec in CODECS:
+            if array.dtype.str not in CODECS[codec].dtypes:
+                continue
+            nbytes, encode, decode = measure(codec, array)
+            results[(name, codec)] = (nbytes, encode, decode)
+            print(f"{name:<20}{codec:>15}{nbytes / array.nbytes:>8.3f}{array.nbytes / encode / 1e6:>13.0f}"
+                  f"{array.nbytes / decode / 1e6:>13.0f}")
+
+    print()
+    print(f"{'payload':<20}{'link MB/s':>10}{'chosen':>15}{'effective MB/s':>16}{'raw MB/s':>10}")
+    for name, array in cases.items():
+        for link in LINK_MB_PER_S:
+            rate = link * 1e6
+            chosen = CodecPolicy().choose(array, rate, CODECS)
+            seconds = array.nbytes / rate
+            if chosen is not None:
+                nbytes, encode, decode = results[(name, chosen)]
+                seconds = encode + nbytes / rate + decode
+            print(f"{name:<20}{link:>10.0f}{chosen or '-':>15}{array.nbytes / seconds / 1e6:>16.0f}{link:>10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import asyncio
+import subprocess
+import sys
+import os
+import tempfile
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.message import Message, MessageType, AsyncMessageReader, write_message, MAX_HEADER_SIZE
+from common.session import ClientSession
+
+# Time to create (stream, distribute and replicate) an array against the
+# number of workers. Each simulated worker reads at most LINK_MB_PER_S, like
+# a worker behind its own network link, and acknowledges every stored copy.
+# "serial" is the time sending every copy one worker after another would take;
+# with concurrent fan-out the creation time approaches serial / workers.
+
+MASTER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "master", "master_node.py")
+LINK_MB_PER_S = 200.0
+
+class ThrottledWorker:
+    def __init__(self, worker_id: str, port: int):
+        self.worker_id = worker_id
+        self.port = port
+        self.filling = {}
+        self.received = 0
+
+    async def run(self, ready: asyncio.Event):
+        reader, self.writer = await asyncio.open_connection("localhost", self.port, limit=MAX_HEADER_SIZE)
+        self.reader = AsyncMessageReader(reader)
+        write_message(self.writer, Message(MessageType.REGISTER_WORKER, self.worker_id, "master",
+                                           {"cores": 1, "memory": 1 << 20}))
+        await self.writer.drain()
+        ready.set()
+        heartbeat_task = asyncio.create_task(self.heartbeat_loop())
+        try:
+            await self.serve()
+        finally:
+            heartbeat_task.cancel()
+
+    async def heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(2)
+            write_message(self.writer, Message(MessageType.HEARTBEAT, self.worker_id, "master",
+                                               {"status": "alive"}))
+
+    async def serve(self):
+        while True:
+            message = await self.reader.read_message()
+            if message is None:
+                return
+            data = message.data
+            if message.payload is not None:
+                self.received += message.payload.nbytes
+                await asyncio.sleep(message.payload.nbytes / (LINK_MB_PER_S * 1e6))
+            if message.type in (MessageType.DISTRIBUTE_ARRAY, MessageType.REPLICATE_DATA):
+                self.filling[(data['arrayId'], data['segmentId'])] = data['endIndex'] - data['startIndex']
+            elif message.type == MessageType.SEGMENT_CHUNK:
+                key = (data['arrayId'], data['segmentId'])
+                self.filling[key] -= len(message.payload)
+                if self.filling[key] == 0:
+                    write_message(self.writer, Message(MessageType.SEGMENT_ACK, self.worker_id, "master",
+                                                       {"arrayId": key[0], "segmentId": key[1]}))
+
+def create_array(port: int, size: int, chunk_size: int) -> float:
+    session = ClientSession("localhost", port, "distribution-bench")
+    values = np.random.default_rng(0).random(size)
+    chunks = [Message(MessageType.ARRAY_CHUNK, "distribution-bench", "master",
+                      {"arrayId": "dist", "offset": offset}, payload=values[offset:offset + chunk_size])
+              for offset in range(0, size, chunk_size)]
+    try:
+        start = time.perf_counter()
+        response = session.request(MessageType.CREATE_ARRAY,
+                                   {"arrayId": "dist", "dataType": "double", "totalSize": size, "streaming": True},
+                                   chunks=chunks, timeout=300)
+        elapsed = time.perf_counter() - start
+        assert response.data['status'] == 'created', response.data
+        return elapsed
+    finally:
+        session.close()
+
+async def run_cluster(port: int, workers: int, size: int, chunk_size: int):
+    nodes = [ThrottledWorker(f"sim-{i}", port) for i in range(workers)]
+    events = [asyncio.Event() for _ in nodes]
+    tasks = [asyncio.create_task(node.run(event)) for node, event in zip(nodes, events)]
+    await asyncio.gather(*(event.wait() for event in events))
+    await asyncio.sleep(0.2)
+
+    elapsed = await asyncio.get_running_loop().run_in_executor(None, create_array, port, size, chunk_size)
+    for task in tasks:
+        task.cancel()
+    for node in nodes:
+        node.writer.close()
+    return elapsed, sum(node.received for node in nodes)
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5900
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 8_000_000
+    chunk_size = 1 << 18
+
+    print(f"{size} doubles in chunks of {chunk_size}, {LINK_MB_PER_S:.0f} MB/s per worker link")
+    print(f"{'workers':>8}{'copies (MB)':>13}{'serial (s)':>12}{'create (s)':>12}{'speedup':>9}")
+    with tempfile.TemporaryDirectory() as log_dir:
+        for i, workers in enumerate((1, 2, 4, 8, 16)):
+            master = subprocess.Popen([sys.executable, MASTER, str(port + i)], cwd=log_dir,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                time.sleep(1.0)
+                elapsed, received = asyncio.run(run_cluster(port + i, workers, size, chunk_size))
+            finally:
+                master.terminate()
+                master.wait()
+            serial = received / (LINK_MB_PER_S * 1e6)
+            print(f"{workers:>8}{received / 1e6:>13.0f}{serial:>12.3f}{elapsed:>12.3f}{serial / elapsed:>8.2f}x")
+
+if __name__ == "__main__":
+    main()
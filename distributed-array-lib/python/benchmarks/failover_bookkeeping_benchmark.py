@@ -0,0 +1,85 @@
+import logging
+import sys
+import os
+import tempfile
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.darray import DArrayDouble
+from master.master_node import MasterNode, WorkerInfo
+
+# Master-side cost of handling one worker failure as the cluster grows,
+# driving MasterNode's bookkeeping in-process with simulated workers whose
+# messages are discarded. Each trial places streamed arrays over the
+# workers, fails one and times handle_worker_failure: promoting replicas and
+# picking new replica holders for every segment the failed worker held.
+# Segments grow with the workers, so a failure affects about as many
+# segments at every size. "scan" is only the cost of walking every segment
+# once, the floor of the per-array loop the index replaced; failover should
+# stay flat while it grows.
+
+CLUSTERS = [(32, 10_000), (64, 20_000), (128, 40_000), (256, 80_000)]
+CORES = 4
+ARRAY_SIZE = 1 << 20
+
+class NullWriter:
+    def write(self, data):
+        pass
+
+    def close(self):
+        pass
+
+def build_cluster(workers: int, segments: int) -> MasterNode:
+    # Re-replicate at once, so the new replica holders are part of the timing
+    master = MasterNode(0, rereplication_delay=0.0)
+    for i in range(workers):
+        worker_id = f"w{i}"
+        master.workers[worker_id] = WorkerInfo(worker_id, NullWriter(), ("localhost", 0), CORES, 1 << 30,
+                                               time.time(), free_memory=1 << 30, peer_port=1)
+        master.scheduler.add_worker(worker_id, CORES)
+        master.segment_index.add_worker(worker_id)
+
+    partitions = workers * CORES * master.PARTITIONS_PER_CORE
+    for a in range(segments // partitions):
+        array = DArrayDouble(f"array-{a}", None, ARRAY_SIZE)
+        master.place_array(array)
+        master.double_arrays[array.array_id] = array
+    return master
+
+def scan(master: MasterNode, worker_id: str) -> int:
+    held = 0
+    for array in master.double_arrays.values():
+        for segment in array.segments:
+            if segment.worker_id == worker_id or worker_id in segment.replicas:
+                held += 1
+    return held
+
+def main():
+    trials = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    os.chdir(tempfile.mkdtemp())
+    logging.disable(logging.ERROR)
+
+    print(f"workers with {CORES} cores, primary plus one replica, median of {trials} failures")
+    print(f"{'workers':>8}{'segments':>10}{'affected':>10}{'failover (ms)':>15}{'us/segment':>12}{'scan (ms)':>11}")
+    for workers, segments in CLUSTERS:
+        failover, scans, affected = [], [], 0
+        for t in range(trials):
+            master = build_cluster(workers, segments)
+            victim = f"w{t % workers}"
+
+            start = time.perf_counter()
+            affected = scan(master, victim)
+            scans.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            master.handle_worker_failure(victim)
+            failover.append(time.perf_counter() - start)
+            master.executor.shutdown()
+
+        failover_ms = np.median(failover) * 1000
+        print(f"{workers:>8}{segments:>10}{affected:>10}{failover_ms:>15.2f}{failover_ms * 1000 / affected:>12.1f}"
+              f"{np.median(scans) * 1000:>11.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import asyncio
+import socket
+import sys
+import os
+import threading
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.message import Message, MessageType, MessageReader, AsyncMessageReader, send_message, MAX_HEADER_SIZE
+
+# Stress test for message framing: one thread floods heartbeats while another
+# sends multi-MB SEGMENT_RESULTs (binary payloads and JSON lists) over the same
+# socket, the way a worker does. Small frames coalesce in one recv and large
+# ones are split across many, for both the blocking and the asyncio reader.
+# Every message is checked; any framing error aborts the run.
+
+def sender(sock: socket.socket, results: int, result_size: int, json_every: int, heartbeats: int):
+    lock = threading.Lock()
+    rng = np.random.default_rng(1)
+
+    def send(message: Message):
+        with lock:
+            send_message(sock, message)
+
+    def heartbeat_loop():
+        for i in range(heartbeats):
+            send(Message(MessageType.HEARTBEAT, "worker-0", "master", {"seq": i}))
+
+    heartbeat_thread = threading.Thread(target=heartbeat_loop)
+    heartbeat_thread.start()
+    for i in range(results):
+        values = rng.random(result_size)
+        data = {"arrayId": "stress", "segmentId": i, "checksum": float(values.sum())}
+        if json_every and i % json_every == 0:
+            data["data"] = values[:result_size // 16].tolist()
+            data["checksum"] = float(values[:result_size // 16].sum())
+            send(Message(MessageType.SEGMENT_RESULT, "worker-0", "master", data))
+        else:
+            send(Message(MessageType.SEGMENT_RESULT, "worker-0", "master", data, payload=values))
+    heartbeat_thread.join()
+    sock.shutdown(socket.SHUT_WR)
+
+class Tally:
+    def __init__(self):
+        self.heartbeats = 0
+        self.results = 0
+        self.nbytes = 0
+        self.last_heartbeat = -1
+
+    def add(self, message: Message):
+        if message.type == MessageType.HEARTBEAT:
+            # Frames from one thread must arrive in order
+            assert message.data["seq"] == self.last_heartbeat + 1, message.data
+            self.last_heartbeat = message.data["seq"]
+            self.heartbeats += 1
+            return
+        values = message.payload if message.payload is not None else np.array(message.data["data"])
+        assert np.isclose(values.sum(), message.data["checksum"]), message.data["segmentId"]
+        self.results += 1
+        self.nbytes += values.nbytes
+
+def read_blocking(sock: socket.socket, recv_size: int) -> Tally:
+    tally = Tally()
+    reader = MessageReader(sock, recv_size=recv_size)
+    while True:
+        message = reader.read_message()
+        if message is None:
+            return tally
+        tally.add(message)
+
+async def read_async(sock: socket.socket) -> Tally:
+    tally = Tally()
+    stream, writer = await asyncio.open_connection(sock=sock, limit=MAX_HEADER_SIZE)
+    reader = AsyncMessageReader(stream)
+    while True:
+        message = await reader.read_message()
+        if message is None:
+            writer.close()
+            return tally
+        tally.add(message)
+
+def run(label: str, read, results: int, result_size: int, json_every: int, heartbeats: int):
+    receiver, sending = socket.socketpair()
+    thread = threading.Thread(target=sender, args=(sending, results, result_size, json_every, heartbeats))
+    start = time.perf_counter()
+    thread.start()
+    tally = read(receiver)
+    thread.join()
+    elapsed = time.perf_counter() - start
+    sending.close()
+    receiver.close()
+
+    assert tally.results == results and tally.heartbeats == heartbeats, vars(tally)
+    print(f"{label:<26}{tally.results:>8}{tally.heartbeats:>12}{tally.nbytes / elapsed / 1e6:>12.1f}"
+          f"{(tally.results + tally.heartbeats) / elapsed:>12.0f}")
+
+def main():
+    results = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    result_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1 << 19
+    heartbeats = int(sys.argv[3]) if len(sys.argv) > 3 else 50000
+    json_every = 10
+
+    print(f"{result_size * 8 / 1e6:.1f} MB results, every {json_every}th as a JSON list")
+    print(f"{'reader':<26}{'results':>8}{'heartbeats':>12}{'MB/s':>12}{'msgs/s':>12}")
+    for recv_size in (4096, 65536):
+        run(f"blocking recv={recv_size}", lambda sock: read_blocking(sock, recv_size),
+            results, result_size, json_every, heartbeats)
+    run("asyncio", lambda sock: asyncio.run(read_async(sock)),
+        results, result_size, json_every, heartbeats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import sys
+import os
+import time
+import multiprocessing as mp
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import kernels
+
+# Per-kernel timings across segment sizes: the original per-element loops,
+# the blocked ufunc kernel on one thread, and the kernel split across cores.
+# Every kernel result is checked against the loop version.
+
+# The element-wise loops take ~seconds per million elements; skip them above this
+LOOP_LIMIT = 200_000
+
+def loop_example1(segment: np.ndarray) -> np.ndarray:
+    result = np.zeros(len(segment))
+    for i in range(len(segment)):
+        x = segment[i]
+        result[i] = ((np.sin(x) + np.cos(x)) ** 2) / (np.sqrt(np.abs(x)) + 1)
+    return result
+
+def loop_example2(segment: np.ndarray) -> np.ndarray:
+    result = np.zeros(len(segment), dtype=np.int32)
+    for i in range(len(segment)):
+        x = segment[i]
+        if x % 3 == 0 or (500 <= x <= 1000):
+            result[i] = int((x * np.log(x)) % 7)
+        else:
+            result[i] = x
+    return result
+
+CASES = [
+    (kernels.EXAMPLE1, loop_example1, lambda n: np.random.uniform(1.0, 100.0, size=n)),
+    (kernels.EXAMPLE2, loop_example2, lambda n: np.random.randint(1, 1001, size=n).astype(np.int32)),
+]
+
+def best_of(fn, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+    cores = mp.cpu_count()
+    pool = ThreadPoolExecutor(max_workers=cores)
+
+    print(f"cores={cores} block={kernels.BLOCK_SIZE}")
+    print(f"{'kernel':<10}{'elements':>12}{'loop s':>10}{'kernel s':>10}{'threaded s':>12}{'speedup':>10}")
+    for kernel, loop_fn, make_data in CASES:
+        for size in sizes:
+            segment = make_data(size)
+            single = best_of(lambda: kernel(segment))
+            threaded = best_of(lambda: kernel(segment, pool, cores))
+
+            if size <= LOOP_LIMIT:
+                expected = loop_fn(segment)
+                assert np.allclose(kernel(segment, pool, cores), expected)
+                loop_time = best_of(lambda: loop_fn(segment), repeat=1)
+                loop_col = f"{loop_time:>10.4f}"
+                speedup = f"{loop_time / min(single, threaded):>9.0f}x"
+            else:
+                loop_col = f"{'-':>10}"
+                speedup = f"{'-':>10}"
+
+            print(f"{kernel.name:<10}{size:>12}{loop_col}{single:>10.4f}{threaded:>12.4f}{speedup}")
+
+    pool.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import asyncio
+import subprocess
+import sys
+import os
+import tempfile
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.message import Message, MessageType, AsyncMessageReader, write_message, MAX_HEADER_SIZE
+from common.session import ClientSession
+from common import kernels
+
+# Load test for the master: starts a master process on a local port, connects
+# hundreds of simulated workers from one asyncio loop, then measures client
+# round trips while every worker sends heartbeats and answers PROCESS_SEGMENT.
+# The simulated workers keep their segments in memory and run the real kernels.
+
+MASTER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "master", "master_node.py")
+
+class SimulatedWorker:
+    def __init__(self, worker_id: str, host: str, port: int):
+        self.worker_id = worker_id
+        self.host = host
+        self.port = port
+        self.segments = {}
+        self.primaries = {}
+        self.filling = {}
+        self.writer = None
+
+    async def register(self):
+        reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=MAX_HEADER_SIZE)
+        self.reader = AsyncMessageReader(reader)
+        write_message(self.writer, Message(MessageType.REGISTER_WORKER, self.worker_id, "master",
+                                           {"cores": 1, "memory": 1 << 30}))
+        await self.writer.drain()
+
+    async def heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(2)
+            write_message(self.writer, Message(MessageType.HEARTBEAT, self.worker_id, "master",
+                                               {"status": "alive"}))
+
+    async def serve(self):
+        while True:
+            message = await self.reader.read_message()
+            if message is None:
+                return
+            data = message.data
+            if message.type in (MessageType.DISTRIBUTE_ARRAY, MessageType.REPLICATE_DATA):
+                segment = message.payload if message.payload is not None else data.get('data')
+                if segment is None:
+                    segment = np.empty(data['endIndex'] - data['startIndex'],
+                                       dtype=np.int32 if data['dataType'] == 'int' else np.float64)
+                key = (data['arrayId'], data['startIndex'])
+                self.segments[key] = np.asarray(segment)
+                if message.type == MessageType.DISTRIBUTE_ARRAY:
+                    self.primaries.setdefault(data['arrayId'], []).append(data['startIndex'])
+                if data.get('streaming'):
+                    self.filling[key] = len(segment)
+                else:
+                    self.ack(data['arrayId'], data['startIndex'])
+            elif message.type == MessageType.SEGMENT_CHUNK:
+                key = (data['arrayId'], data['segmentId'])
+                segment = self.segments[key]
+                offset = data['offset']
+                segment[offset:offset + len(message.payload)] = message.payload
+                self.filling[key] -= len(message.payload)
+                if self.filling[key] == 0:
+                    self.ack(*key)
+            elif message.type == MessageType.PROCESS_SEGMENT:
+                array_id = data['arrayId']
+                kernel = kernels.KERNELS[data['operation']]
+                for start in data.get('segmentIds', self.primaries.get(array_id, [])):
+                    segment = self.segments[(array_id, start)]
+                    result = kernel(np.asarray(segment, dtype=kernel.input_dtype))
+                    write_message(self.writer, Message(
+                        MessageType.SEGMENT_RESULT, self.worker_id, "master",
+                        {"arrayId": array_id, "segmentId": start, "jobId": data.get('jobId'),
+                         "backend": "simulated"},
+                        payload=result
+                    ))
+                await self.writer.drain()
+
+    def ack(self, array_id: str, segment_id: int):
+        write_message(self.writer, Message(MessageType.SEGMENT_ACK, self.worker_id, "master",
+                                           {"arrayId": array_id, "segmentId": segment_id}))
+
+async def run_workers(host: str, port: int, count: int, ready: asyncio.Event, stop: asyncio.Event):
+    workers = [SimulatedWorker(f"sim-{i}", host, port) for i in range(count)]
+    start = time.perf_counter()
+    await asyncio.gather(*(worker.register() for worker in workers))
+    print(f"registered {count} workers in {time.perf_counter() - start:.3f}s")
+
+    tasks = [asyncio.create_task(worker.serve()) for worker in workers]
+    tasks += [asyncio.create_task(worker.heartbeat_loop()) for worker in workers]
+    ready.set()
+    await stop.wait()
+    for task in tasks:
+        task.cancel()
+    for worker in workers:
+        worker.writer.close()
+
+def run_client(host: str, port: int, rounds: int, size: int):
+    session = ClientSession(host, port, "load-bench")
+    values = np.random.default_rng(0).random(size)
+    latencies = []
+    try:
+        for i in range(rounds):
+            array_id = f"load-{i}"
+            chunk = Message(MessageType.ARRAY_CHUNK, "load-bench", "master",
+                            {"arrayId": array_id, "offset": 0}, payload=values)
+
+            start = time.perf_counter()
+            session.request(MessageType.CREATE_ARRAY,
+                            {"arrayId": array_id, "dataType": "double", "totalSize": size, "streaming": True},
+                            chunks=[chunk], timeout=60)
+            session.request(MessageType.APPLY_OPERATION, {"arrayId": array_id, "operation": "example1"},
+                            timeout=60)
+            response = session.request(MessageType.GET_RESULT,
+                                       {"arrayId": array_id, "binary": True, "timeout": 60}, timeout=90)
+            latencies.append(time.perf_counter() - start)
+
+            assert response.data['status'] == 'complete', response.data
+            assert np.allclose(response.payload, kernels.EXAMPLE1(values), equal_nan=True)
+    finally:
+        session.close()
+    return latencies
+
+async def main_async(host: str, port: int, workers: int, rounds: int, size: int):
+    ready = asyncio.Event()
+    stop = asyncio.Event()
+    worker_task = asyncio.create_task(run_workers(host, port, workers, ready, stop))
+    await ready.wait()
+
+    loop = asyncio.get_running_loop()
+    latencies = await loop.run_in_executor(None, run_client, host, port, rounds, size)
+    stop.set()
+    await worker_task
+
+    latencies = np.array(latencies) * 1000
+    print(f"{rounds} create/apply/get rounds of {size} elements across {workers} workers: "
+          f"median {np.median(latencies):.1f} ms, max {latencies.max():.1f} ms")
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5600
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    size = int(sys.argv[4]) if len(sys.argv) > 4 else 1_000_000
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        master = subprocess.Popen([sys.executable, MASTER, str(port)], cwd=log_dir,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            time.sleep(1.0)
+            asyncio.run(main_async("localhost", port, workers, rounds, size))
+        finally:
+            master.terminate()
+            master.wait()
+
+if __name__ == "__main__":
+    main()
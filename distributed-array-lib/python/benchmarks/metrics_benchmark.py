@@ -0,0 +1,86 @@
+import socket
+import sys
+import os
+import threading
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.message import Message, MessageType, MessageReader, send_message
+from common.metrics import Histogram, MetricsRegistry
+
+# Cost of the metrics registry. The first table is the time per histogram
+# record, alone and through a registry shared by THREADS threads. The second
+# is the message rate of small (heartbeat) and large (segment) messages over
+# a socket pair, without and with the sender and receiver recording metrics,
+# and the histogram's p99 against the exact one.
+
+RECORDS = 200_000
+THREADS = 4
+SMALL_MESSAGES = 20_000
+LARGE_MESSAGES = 200
+LARGE_ELEMENTS = 1 << 17
+
+def time_records(registry: MetricsRegistry, threads: int) -> float:
+    values = np.random.default_rng(0).lognormal(-7, 1, RECORDS // threads).tolist()
+
+    def record():
+        for value in values:
+            registry.observe("latency", value)
+
+    workers = [threading.Thread(target=record) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / RECORDS
+
+def message_rate(messages, metrics: bool) -> float:
+    sender, receiver = socket.socketpair()
+    registry = MetricsRegistry() if metrics else None
+
+    def receive():
+        reader = MessageReader(receiver, metrics=registry)
+        for _ in messages:
+            reader.read_message()
+
+    thread = threading.Thread(target=receive)
+    thread.start()
+    start = time.perf_counter()
+    for message in messages:
+        send_message(sender, message, registry)
+    thread.join()
+    elapsed = time.perf_counter() - start
+    sender.close()
+    receiver.close()
+    return len(messages) / elapsed
+
+def main():
+    histogram = Histogram()
+    values = np.random.default_rng(1).lognormal(-7, 1, RECORDS)
+    start = time.perf_counter()
+    for value in values.tolist():
+        histogram.record(value)
+    single = (time.perf_counter() - start) / RECORDS
+
+    print(f"{'recording':<30}{'ns/record':>12}")
+    print(f"{'histogram':<30}{single * 1e9:>12.0f}")
+    print(f"{'registry, 1 thread':<30}{time_records(MetricsRegistry(), 1) * 1e9:>12.0f}")
+    print(f"{f'registry, {THREADS} threads':<30}{time_records(MetricsRegistry(), THREADS) * 1e9:>12.0f}")
+    print(f"p99 {histogram.percentile(99) * 1e6:.1f} us, exact {np.percentile(values, 99) * 1e6:.1f} us")
+
+    small = [Message(MessageType.HEARTBEAT, "worker-0", "master", {"freeMemory": 4096})
+             for _ in range(SMALL_MESSAGES)]
+    segment = np.random.default_rng(2).random(LARGE_ELEMENTS)
+    large = [Message(MessageType.SEGMENT_RESULT, "worker-0", "master", {"arrayId": "a", "segmentId": i},
+                     payload=segment) for i in range(LARGE_MESSAGES)]
+    print()
+    print(f"{'messages':<30}{'plain msg/s':>14}{'metrics msg/s':>15}{'overhead':>10}")
+    for name, messages in (("heartbeat", small), (f"segment {segment.nbytes >> 10} KB", large)):
+        plain = message_rate(messages, False)
+        measured = message_rate(messages, True)
+        print(f"{name:<30}{plain:>14.0f}{measured:>15.0f}{plain / measured - 1:>10.1%}")
+
+if __name__ == "__main__":
+    main()
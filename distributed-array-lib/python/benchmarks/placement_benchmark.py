@@ -0,0 +1,68 @@
+import heapq
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.placement import WorkerCapacity, PlacementError, plan_placement, MB
+
+# Simulated makespan of one elementwise operation on heterogeneous clusters.
+# "even" is the previous layout: equal partitions dealt round-robin. "capacity"
+# is plan_placement. Each worker runs its partitions on its cores, longest
+# first, at a fixed cost per element and core; the makespan is the time the
+# last worker finishes. "mem" is the highest ratio of stored primaries and
+# replicas to a worker's free memory; above 100% the worker would run out.
+
+NS_PER_ELEMENT = 5.0
+ITEMSIZE = 8
+
+CLUSTERS = {
+    "uniform 8x4 cores": [(4, 4096)] * 8,
+    "mixed 1-16 cores": [(1, 2048), (2, 4096), (4, 8192), (8, 8192), (16, 16384)],
+    "one big node": [(2, 4096)] * 6 + [(32, 65536)],
+    "low-memory node": [(8, 16384)] * 4 + [(8, 600)],
+}
+
+def worker_finish(cores: int, partitions) -> float:
+    free_at = [0.0] * cores
+    for size in sorted(partitions, reverse=True):
+        start = heapq.heappop(free_at)
+        heapq.heappush(free_at, start + size * NS_PER_ELEMENT)
+    return max(free_at) / 1e9
+
+def evaluate(workers, segments):
+    by_worker = {worker.worker_id: [] for worker in workers}
+    stored = {worker.worker_id: 0 for worker in workers}
+    for segment in segments:
+        size = segment.end_index - segment.start_index
+        by_worker[segment.worker_id].append(size)
+        for worker_id in [segment.worker_id] + segment.replicas:
+            stored[worker_id] += size * ITEMSIZE
+    makespan = max(worker_finish(worker.cores, by_worker[worker.worker_id]) for worker in workers)
+    over = max(stored[worker.worker_id] / worker.free_bytes for worker in workers)
+    return makespan, over
+
+def even_layout(total_size: int, workers, partitions_per_core: int):
+    # Equal partitions, round-robin: plan_placement for identical one-core
+    # workers with room to spare, whatever the real ones have
+    room = 2 * total_size * ITEMSIZE
+    alike = [WorkerCapacity(worker.worker_id, 1, room) for worker in workers]
+    return plan_placement(total_size, ITEMSIZE, alike, partitions_per_core, 2)
+
+def main():
+    total_size = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000_000
+    partitions_per_core = 2
+    print(f"{total_size} doubles, {NS_PER_ELEMENT} ns per element and core")
+    print(f"{'cluster':<22}{'even (s)':>10}{'mem':>8}{'capacity (s)':>14}{'mem':>8}")
+    for name, spec in CLUSTERS.items():
+        workers = [WorkerCapacity(f"w{i}", cores, memory * MB) for i, (cores, memory) in enumerate(spec)]
+        even_time, even_over = evaluate(workers, even_layout(total_size, workers, partitions_per_core))
+        try:
+            segments = plan_placement(total_size, ITEMSIZE, workers, partitions_per_core, 2)
+            capacity_time, capacity_over = evaluate(workers, segments)
+            capacity = f"{capacity_time:>14.3f}{capacity_over:>7.0%}"
+        except PlacementError as e:
+            capacity = f"  refused: {e}"
+        print(f"{name:<22}{even_time:>10.3f}{even_over:>7.0%}{capacity}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import sys
+import os
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import kernels
+from common.plan import Plan, map_step, filter_step
+
+# One worker segment through example1 -> sqrt -> *2 -> filter(> 0.5) -> sum,
+# evaluated eagerly (one full pass and one segment-sized intermediate per
+# step, as chained APPLY_OPERATIONs do) and as a single fused plan.
+
+STEPS = [map_step("example1"), map_step(np.sqrt), map_step(np.multiply, 2.0), filter_step(np.greater, 0.5)]
+
+def eager(segment: np.ndarray) -> float:
+    x = kernels.EXAMPLE1(segment)
+    x = np.sqrt(x)
+    x = np.multiply(x, 2.0)
+    x = x[np.greater(x, 0.5)]
+    return float(x.sum())
+
+def best_of(fn, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000, 10_000_000]
+    print(f"{'elements':>12}{'eager (s)':>12}{'fused (s)':>12}{'speedup':>10}")
+    for size in sizes:
+        segment = np.random.uniform(-100.0, 100.0, size=size)
+        plan = Plan(STEPS, "sum", segment.dtype)
+        assert np.isclose(plan(segment)[0], eager(segment))
+
+        eager_time = best_of(lambda: eager(segment))
+        fused_time = best_of(lambda: plan(segment))
+        print(f"{size:>12}{eager_time:>12.4f}{fused_time:>12.4f}{eager_time / fused_time:>9.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import signal
+import subprocess
+import sys
+import os
+import tempfile
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.message import Message, MessageType
+from common.session import ClientSession
+
+# Recovery time after a worker failure on a local cluster of four workers.
+# Each trial creates an array, then signals worker-1 and at once runs a sum
+# over the array. The time until the correct sum arrives covers failure
+# detection, replica promotion and re-running the lost tasks. "crash" kills
+# the worker (its socket closes, so the master notices at once); "hang"
+# stops it (SIGSTOP), so only the phi accrual detector can tell. Speculation
+# is off, so stragglers are not rescued before the failure is detected.
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MASTER = os.path.join(HERE, "master", "master_node.py")
+WORKER = os.path.join(HERE, "worker", "worker_node.py")
+WORKERS = 4
+
+def sum_job(session: ClientSession, timeout: float = 60.0):
+    response = session.request(MessageType.EXECUTE_PLAN,
+                               {"arrayId": "recovery", "plan": {"steps": [], "action": "sum"}})
+    response = session.request(MessageType.GET_RESULT,
+                               {"arrayId": "recovery", "jobId": response.data['jobId'], "timeout": timeout},
+                               timeout=timeout + 5)
+    assert response.data['status'] == 'complete', response.data
+    return response.data['value']
+
+def trial(port: int, failure: str, heartbeat_interval: float, size: int, log_dir: str) -> float:
+    processes = [subprocess.Popen([sys.executable, MASTER, str(port), "2", "nospeculate"], cwd=log_dir,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)]
+    try:
+        time.sleep(1.0)
+        for i in range(WORKERS):
+            processes.append(subprocess.Popen(
+                [sys.executable, WORKER, f"worker-{i}", "localhost", str(port), "0", str(heartbeat_interval)],
+                cwd=log_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        time.sleep(1.5)
+
+        session = ClientSession("localhost", port, "recovery-bench")
+        values = np.random.default_rng(port).random(size)
+        chunk = Message(MessageType.ARRAY_CHUNK, "recovery-bench", "master",
+                        {"arrayId": "recovery", "offset": 0}, payload=values)
+        session.request(MessageType.CREATE_ARRAY,
+                        {"arrayId": "recovery", "dataType": "double", "totalSize": size, "streaming": True},
+                        chunks=[chunk], timeout=60)
+        assert np.isclose(sum_job(session), values.sum())
+        # Let the detectors learn the heartbeat pattern
+        time.sleep(10 * heartbeat_interval)
+
+        victim = processes[2]
+        start = time.perf_counter()
+        victim.send_signal(signal.SIGKILL if failure == "crash" else signal.SIGSTOP)
+        value = sum_job(session)
+        elapsed = time.perf_counter() - start
+        assert np.isclose(value, values.sum()), (value, values.sum())
+        session.close()
+        return elapsed
+    finally:
+        for process in processes:
+            process.kill()
+            process.wait()
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 6000
+    trials = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    heartbeat_interval = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+    size = 2_000_000
+
+    print(f"{WORKERS} workers, {size} doubles, heartbeat every {heartbeat_interval}s, {trials} trials")
+    print(f"{'failure':<10}{'median (s)':>12}{'max (s)':>10}")
+    with tempfile.TemporaryDirectory() as log_dir:
+        for i, failure in enumerate(("crash", "hang")):
+            times = [trial(port + i * trials + t, failure, heartbeat_interval, size, log_dir)
+                     for t in range(trials)]
+            print(f"{failure:<10}{np.median(times):>12.3f}{max(times):>10.3f}")
+
+if __name__ == "__main__":
+    main()
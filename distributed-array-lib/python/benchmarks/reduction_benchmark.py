@@ -0,0 +1,46 @@
+import sys
+import os
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "client"))
+from distributed_array_client import DistributedArrayClient
+
+# Aggregates against a running cluster: fetching the whole array and reducing
+# it on the client versus a distributed reduction, where each worker returns
+# one partial and the master combines them.
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: reduction_benchmark.py <master_host> <master_port> [elements]")
+        sys.exit(1)
+
+    host = sys.argv[1]
+    port = int(sys.argv[2])
+    size = int(sys.argv[3]) if len(sys.argv) > 3 else 10_000_000
+
+    client = DistributedArrayClient(host, port)
+    data = np.random.uniform(-100.0, 100.0, size=size)
+    client.stream_array("reduce-bench", "double", size, [data[i:i + client.chunk_size]
+                                                         for i in range(0, size, client.chunk_size)])
+    lazy = client.lazy("reduce-bench")
+
+    # A reduction moves at most two numbers per segment instead of the array
+    print(f"{'action':<12}{'collect+local (s)':>20}{'distributed (s)':>18}{'collected bytes':>18}")
+    for action, local in [("sum", np.sum), ("min", np.min), ("max", np.max), ("mean", np.mean)]:
+        start = time.perf_counter()
+        collected = lazy.collect()
+        expected = local(collected)
+        collect_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        value = getattr(lazy, action)()
+        reduce_time = time.perf_counter() - start
+        assert np.isclose(value, expected), (action, value, expected)
+        print(f"{action:<12}{collect_time:>20.3f}{reduce_time:>18.3f}{collected.nbytes:>18}")
+
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import socket
+import sys
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.checkpoint import SegmentCheckpoint
+from common.message import Message, MessageType, MessageReader, send_message
+
+# What it costs to get a restarted worker's share of the data back. "save"
+# is the checkpoint write each worker does off the receive path, "load" the
+# read and checksum check at restart. "loopback" ships the same segments as
+# REPLICATE_DATA over a local socket, the floor of re-replicating them, and
+# "link" is the time at LINK_MB_PER_S per worker, as in
+# distribution_benchmark. Right after saving, the files are likely still in
+# the page cache; a cold load is bounded by the disk instead.
+
+SEGMENT_ELEMENTS = 1 << 20
+LINK_MB_PER_S = 200.0
+
+def ship(segments) -> float:
+    sender, receiver = socket.socketpair()
+    received = []
+
+    def receive():
+        reader = MessageReader(receiver)
+        for _ in segments:
+            received.append(reader.read_message().payload)
+
+    thread = threading.Thread(target=receive)
+    start = time.perf_counter()
+    thread.start()
+    for i, segment in enumerate(segments):
+        send_message(sender, Message(MessageType.REPLICATE_DATA, "worker-0", "worker-1",
+                                     {"arrayId": "bench", "segmentId": i * SEGMENT_ELEMENTS,
+                                      "dataType": "double", "isPrimary": False}, payload=segment))
+    thread.join()
+    elapsed = time.perf_counter() - start
+    sender.close()
+    receiver.close()
+    return elapsed
+
+def main():
+    sizes_mb = [int(arg) for arg in sys.argv[1:]] or [64, 256, 512]
+    print(f"segments of {SEGMENT_ELEMENTS * 8 >> 20} MB; link at {LINK_MB_PER_S:.0f} MB/s")
+    print(f"{'share (MB)':>11}{'save (s)':>10}{'load (s)':>10}{'loopback (s)':>14}{'link (s)':>10}")
+    for size_mb in sizes_mb:
+        count = size_mb * (1 << 20) // (SEGMENT_ELEMENTS * 8)
+        rng = np.random.default_rng(size_mb)
+        segments = [rng.random(SEGMENT_ELEMENTS) for _ in range(count)]
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = SegmentCheckpoint(directory)
+            start = time.perf_counter()
+            for i, segment in enumerate(segments):
+                checkpoint.save("bench", i * SEGMENT_ELEMENTS, segment, primary=i % 2 == 0)
+            save = time.perf_counter() - start
+
+            start = time.perf_counter()
+            loaded, corrupt = SegmentCheckpoint(directory).load()
+            load = time.perf_counter() - start
+            assert len(loaded) == count and not corrupt
+
+        loopback = ship(segments)
+        link = count * SEGMENT_ELEMENTS * 8 / (LINK_MB_PER_S * 1e6)
+        print(f"{size_mb:>11}{save:>10.3f}{load:>10.3f}{loopback:>14.3f}{link:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import heapq
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.placement import WorkerCapacity, plan_placement, MB
+from common.scheduler import Task, TaskScheduler
+
+# Simulated job latency with one slowed worker, driving the master's
+# TaskScheduler directly. Arrays are placed with plan_placement (primary plus
+# one replica); each worker runs one task per core at a fixed cost per element
+# divided by its speed. "static" runs every partition on its primary, as the
+# broadcast PROCESS_SEGMENT did; "stealing" lets idle replica holders take
+# queued partitions from busy primaries.
+
+NS_PER_ELEMENT = 5.0
+ITEMSIZE = 8
+
+CLUSTERS = {
+    "uniform 4x4 cores": [(4, 1.0)] * 4,
+    "one 4x slower": [(4, 1.0)] * 3 + [(4, 0.25)],
+    "one 10x slower": [(4, 1.0)] * 3 + [(4, 0.1)],
+    "mixed speeds": [(4, 1.0), (4, 0.8), (4, 0.5), (4, 0.3)],
+}
+
+def simulate(segments, speeds, cores, work_stealing: bool):
+    clock = [0.0]
+    scheduler = TaskScheduler(work_stealing, speculation=False, clock=lambda: clock[0])
+    for worker_id, slots in cores.items():
+        scheduler.add_worker(worker_id, slots)
+    sizes = {segment.start_index: segment.end_index - segment.start_index for segment in segments}
+    scheduler.submit([Task("job", segment.start_index, [segment.worker_id] + segment.replicas, {})
+                      for segment in segments])
+
+    events = []
+    while True:
+        for task in scheduler.assignments():
+            runtime = sizes[task.segment_id] * NS_PER_ELEMENT / speeds[task.worker_id] / 1e9
+            heapq.heappush(events, (clock[0] + runtime, task.segment_id))
+        if not events:
+            return clock[0], scheduler.stolen_count
+        clock[0], segment_id = heapq.heappop(events)
+        scheduler.complete("job", segment_id)
+
+def main():
+    total_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000_000
+    partitions_per_core = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    print(f"{total_size} doubles, {NS_PER_ELEMENT} ns per element and core, "
+          f"{partitions_per_core} partitions per core")
+    print(f"{'cluster':<22}{'static (s)':>12}{'stealing (s)':>14}{'stolen':>8}{'speedup':>9}")
+    for name, spec in CLUSTERS.items():
+        workers = [WorkerCapacity(f"w{i}", cores, 65536 * MB) for i, (cores, _) in enumerate(spec)]
+        speeds = {f"w{i}": speed for i, (_, speed) in enumerate(spec)}
+        cores = {worker.worker_id: worker.cores for worker in workers}
+        # Placement only knows cores, not speed, so the slow node gets a full share
+        segments = plan_placement(total_size, ITEMSIZE, workers, partitions_per_core)
+
+        static, _ = simulate(segments, speeds, cores, work_stealing=False)
+        stealing, stolen = simulate(segments, speeds, cores, work_stealing=True)
+        print(f"{name:<22}{static:>12.3f}{stealing:>14.3f}{stolen:>8}{static / stealing:>8.2f}x")
+
+if __name__ == "__main__":
+    main()
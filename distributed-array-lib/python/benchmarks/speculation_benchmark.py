@@ -0,0 +1,113 @@
+import random
+import subprocess
+import sys
+import os
+import tempfile
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.message import Message, MessageType
+from common.session import ClientSession
+from worker.worker_node import WorkerNode
+
+# Tail latency of small plan jobs on a local cluster with one straggler.
+# Starts a master and three workers; worker-0 stalls on a fraction of its
+# tasks. Each mode runs the same sequence of sum jobs and reports latency
+# percentiles: "static" keeps every partition on its primary, "stealing"
+# lets idle replica holders take queued partitions, and "speculation" also
+# starts backup copies of stalled tasks on replica holders.
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MASTER = os.path.join(HERE, "master", "master_node.py")
+
+MODES = {
+    "static": ["nosteal", "nospeculate"],
+    "stealing": ["nospeculate"],
+    "speculation": [],
+}
+
+class SlowWorker(WorkerNode):
+    """A worker that sleeps ``delay`` seconds before a ``slow_fraction`` of its tasks."""
+
+    def __init__(self, worker_id: str, master_host: str, master_port: int, delay: float, slow_fraction: float):
+        super().__init__(worker_id, master_host, master_port)
+        self.delay = delay
+        self.slow_fraction = slow_fraction
+
+    def run_plan(self, *args):
+        if random.random() < self.slow_fraction:
+            time.sleep(self.delay)
+        return super().run_plan(*args)
+
+def run_worker(worker_id: str, port: int, delay: float, slow_fraction: float):
+    SlowWorker(worker_id, "localhost", port, delay, slow_fraction).start()
+
+def run_jobs(port: int, jobs: int, size: int):
+    session = ClientSession("localhost", port, "speculation-bench")
+    values = np.random.default_rng(0).random(size)
+    chunk = Message(MessageType.ARRAY_CHUNK, "speculation-bench", "master",
+                    {"arrayId": "spec", "offset": 0}, payload=values)
+    latencies, speculated, wins = [], 0, 0
+    try:
+        session.request(MessageType.CREATE_ARRAY,
+                        {"arrayId": "spec", "dataType": "double", "totalSize": size, "streaming": True},
+                        chunks=[chunk], timeout=60)
+        for _ in range(jobs):
+            start = time.perf_counter()
+            response = session.request(MessageType.EXECUTE_PLAN,
+                                       {"arrayId": "spec", "plan": {"steps": [], "action": "sum"}})
+            response = session.request(MessageType.GET_RESULT,
+                                       {"arrayId": "spec", "jobId": response.data['jobId'], "timeout": 60},
+                                       timeout=90)
+            latencies.append(time.perf_counter() - start)
+
+            assert response.data['status'] == 'complete', response.data
+            assert np.isclose(response.data['value'], values.sum())
+            speculated += response.data.get('speculativeTasks', 0)
+            wins += response.data.get('speculationWins', 0)
+    finally:
+        session.close()
+    return np.array(latencies) * 1000, speculated, wins
+
+def run_mode(flags, port: int, jobs: int, size: int, delay: float, slow_fraction: float, log_dir: str):
+    processes = [subprocess.Popen([sys.executable, MASTER, str(port), "2"] + flags, cwd=log_dir,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)]
+    try:
+        time.sleep(1.0)
+        for i in range(3):
+            worker_delay = delay if i == 0 else 0.0
+            processes.append(subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--worker", f"worker-{i}", str(port),
+                 str(worker_delay), str(slow_fraction)],
+                cwd=log_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        time.sleep(1.5)
+        return run_jobs(port, jobs, size)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        run_worker(sys.argv[2], int(sys.argv[3]), float(sys.argv[4]), float(sys.argv[5]))
+        return
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5700
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    delay = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+    slow_fraction = float(sys.argv[4]) if len(sys.argv) > 4 else 0.3
+    size = 1_000_000
+
+    print(f"{jobs} sum jobs over {size} doubles; worker-0 stalls {delay}s on {slow_fraction:.0%} of its tasks")
+    print(f"{'mode':<14}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'max (ms)':>10}"
+          f"{'backups':>9}{'won':>6}")
+    with tempfile.TemporaryDirectory() as log_dir:
+        for i, (mode, flags) in enumerate(MODES.items()):
+            latencies, speculated, wins = run_mode(flags, port + i, jobs, size, delay, slow_fraction, log_dir)
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            print(f"{mode:<14}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{latencies.max():>10.1f}"
+                  f"{speculated:>9}{wins:>6}")
+
+if __name__ == "__main__":
+    main()
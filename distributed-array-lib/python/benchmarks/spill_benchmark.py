@@ -0,0 +1,56 @@
+import sys
+import os
+import tempfile
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.segment_store import SegmentStore
+
+# Throughput of a worker's SegmentStore when the held segments exceed its
+# memory budget. Half the segments are primaries, half replicas. "scan" sums
+# every primary in turn, as a job over a whole array does; "hot" sums a
+# working set of a quarter of the primaries over and over. Below the data
+# size, cold segments spill to memmap files (replicas first) and fault back
+# in when summed; "peak MB" is the most the store held in memory.
+
+SEGMENT_ELEMENTS = 1 << 20
+ROUNDS = 3
+
+def fill(store: SegmentStore, segments: int):
+    for i in range(segments):
+        values = np.full(SEGMENT_ELEMENTS, i, dtype=np.float64)
+        store.put("bench", i * SEGMENT_ELEMENTS, values, primary=i % 2 == 0)
+
+def run(store: SegmentStore, segment_ids, peak):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for segment_id in segment_ids:
+            store.lookup("bench", segment_id).sum()
+            peak[0] = max(peak[0], store.resident_bytes)
+    elapsed = time.perf_counter() - start
+    return ROUNDS * len(segment_ids) * SEGMENT_ELEMENTS * 8 / elapsed / 1e9
+
+def main():
+    segments = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    data_bytes = segments * SEGMENT_ELEMENTS * 8
+    primaries = [i * SEGMENT_ELEMENTS for i in range(0, segments, 2)]
+    hot = primaries[:max(len(primaries) // 4, 1)]
+
+    print(f"{segments} segments of {SEGMENT_ELEMENTS * 8 >> 20} MB ({data_bytes >> 20} MB), {ROUNDS} rounds")
+    print(f"{'budget':<10}{'scan GB/s':>11}{'hot GB/s':>10}{'spills':>8}{'faults':>8}{'peak MB':>9}")
+    for fraction in (None, 0.75, 0.5, 0.25):
+        with tempfile.TemporaryDirectory() as directory:
+            budget = int(data_bytes * fraction) if fraction else None
+            store = SegmentStore(directory, budget)
+            peak = [0]
+            fill(store, segments)
+            scan = run(store, primaries, peak)
+            hot_rate = run(store, hot, peak)
+            label = f"{fraction:.0%}" if fraction else "unlimited"
+            print(f"{label:<10}{scan:>11.2f}{hot_rate:>10.2f}{store.spill_count:>8}{store.fault_count:>8}"
+                  f"{peak[0] >> 20:>9}")
+            store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import socket
+import sys
+import os
+import time
+import threading
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.message import Message, MessageType, MessageReader, send_message
+
+# Compares the legacy JSON-list encoding of a DISTRIBUTE_ARRAY message with the
+# binary payload framing: bytes on the wire and end-to-end time from the
+# sender's first byte to a NumPy array on the receiving side.
+
+def _segment_message(data: np.ndarray, data_type: str, binary: bool) -> Message:
+    msg_data = {
+        "arrayId": "bench",
+        "segmentId": 0,
+        "startIndex": 0,
+        "endIndex": len(data),
+        "dataType": data_type,
+        "isPrimary": True
+    }
+    if binary:
+        return Message(MessageType.DISTRIBUTE_ARRAY, "master", "worker-0", msg_data, payload=data)
+    msg_data["data"] = data.tolist()
+    return Message(MessageType.DISTRIBUTE_ARRAY, "master", "worker-0", msg_data)
+
+def _receive_json(sock: socket.socket, dtype) -> np.ndarray:
+    buffer = b""
+    while b'\n' not in buffer:
+        chunk = sock.recv(1 << 20)
+        if not chunk:
+            raise ConnectionError("Socket closed")
+        buffer += chunk
+    line, _ = buffer.split(b'\n', 1)
+    message = Message.from_json(line.decode())
+    return np.asarray(message.data['data'], dtype=dtype)
+
+def _receive_binary(sock: socket.socket, dtype) -> np.ndarray:
+    message = MessageReader(sock).read_message()
+    return np.asarray(message.payload, dtype=dtype)
+
+class _CountingSocket:
+    """Wraps a socket and counts bytes handed to ``sendall``."""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.bytes_sent = 0
+
+    def sendall(self, data):
+        self.bytes_sent += memoryview(data).nbytes
+        self.sock.sendall(data)
+
+def run_once(data: np.ndarray, data_type: str, binary: bool):
+    sender, receiver = socket.socketpair()
+    counting = _CountingSocket(sender)
+    result = {}
+
+    def receive():
+        receive_fn = _receive_binary if binary else _receive_json
+        result['array'] = receive_fn(receiver, data.dtype)
+        result['end'] = time.perf_counter()
+
+    receiver_thread = threading.Thread(target=receive)
+    receiver_thread.start()
+
+    start = time.perf_counter()
+    message = _segment_message(data, data_type, binary)
+    if binary:
+        send_message(counting, message)
+    else:
+        counting.sendall(message.to_json().encode() + b'\n')
+    receiver_thread.join()
+
+    sender.close()
+    receiver.close()
+
+    assert np.array_equal(result['array'], data)
+    return counting.bytes_sent, result['end'] - start
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000, 10_000_000]
+
+    print(f"{'dtype':<8}{'elements':>12}{'json bytes':>16}{'binary bytes':>16}"
+          f"{'json s':>10}{'binary s':>10}{'speedup':>10}")
+    for size in sizes:
+        for data_type, data in (("int", np.random.randint(1, 1001, size=size).astype(np.int32)),
+                                ("double", np.random.uniform(1.0, 100.0, size=size))):
+            json_bytes, json_time = run_once(data, data_type, binary=False)
+            binary_bytes, binary_time = run_once(data, data_type, binary=True)
+            print(f"{data_type:<8}{size:>12}{json_bytes:>16}{binary_bytes:>16}"
+                  f"{json_time:>10.3f}{binary_time:>10.3f}{json_time / binary_time:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
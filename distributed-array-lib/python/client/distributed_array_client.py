@@ -1,96 +1,215 @@
-import socket
 import sys
 import os
 import json
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from common.message import Message, MessageType
+from common.session import ClientSession
+from common.plan import map_step, filter_step
+from common.metrics import format_snapshot
+
+class LazyArray:
+    """A chain of operations on a distributed array, evaluated on the workers.
+
+    ``map`` and ``filter`` only record steps; actions (``collect`` and the
+    reductions ``sum``, ``count``, ``min``, ``max``, ``mean``, ``histogram``)
+    ship the whole chain to the workers as one plan, which each worker runs in
+    a single fused pass over its segment. Reductions only move one small
+    partial per segment over the network::
+
+        client.lazy("a").map("example1").map(np.sqrt).filter(np.greater, 0.5).sum()
+    """
+
+    def __init__(self, client: 'DistributedArrayClient', array_id: str, steps: List[Dict[str, Any]] = None):
+        self.client = client
+        self.array_id = array_id
+        self.steps = steps or []
+
+    def map(self, fn, operand=None) -> 'LazyArray':
+        return LazyArray(self.client, self.array_id, self.steps + [map_step(fn, operand)])
+
+    def filter(self, fn, operand=None) -> 'LazyArray':
+        return LazyArray(self.client, self.array_id, self.steps + [filter_step(fn, operand)])
+
+    def collect(self, backend: str = "thread") -> np.ndarray:
+        return self.client.execute_plan(self.array_id, self.steps, "collect", backend)
+
+    def sum(self, backend: str = "thread"):
+        return self.client.execute_plan(self.array_id, self.steps, "sum", backend)
+
+    def count(self, backend: str = "thread") -> int:
+        return self.client.execute_plan(self.array_id, self.steps, "count", backend)
+
+    def min(self, backend: str = "thread"):
+        return self.client.execute_plan(self.array_id, self.steps, "min", backend)
+
+    def max(self, backend: str = "thread"):
+        return self.client.execute_plan(self.array_id, self.steps, "max", backend)
+
+    def mean(self, backend: str = "thread") -> float:
+        return self.client.execute_plan(self.array_id, self.steps, "mean", backend)
+
+    def histogram(self, bins: int, hist_range: Tuple[float, float], backend: str = "thread"):
+        """Return ``(counts, edges)`` like ``np.histogram`` with a fixed range."""
+        counts = self.client.execute_plan(self.array_id, self.steps, "histogram", backend,
+                                          options={"bins": bins, "range": list(hist_range)})
+        return np.array(counts), np.linspace(hist_range[0], hist_range[1], bins + 1)
 
 class DistributedArrayClient:
-    def __init__(self, master_host: str, master_port: int):
+    # Elements per ARRAY_CHUNK when uploading
+    STREAM_CHUNK_SIZE = 1 << 20
+    
+    def __init__(self, master_host: str, master_port: int, chunk_size: int = STREAM_CHUNK_SIZE, transport=None):
         self.master_host = master_host
         self.master_port = master_port
+        self.chunk_size = chunk_size
+        # One connection for every request of this client
+        self.session = ClientSession(master_host, master_port, "client", transport)
     
     def create_int_array(self, array_id: str, size: int):
-        # Generate random integer array
-        data = np.random.randint(1, 1001, size=size).tolist()
-        
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.connect((self.master_host, self.master_port))
-            
-            msg = Message(
-                MessageType.CREATE_ARRAY,
-                "client",
-                "master",
-                {
-                    "arrayId": array_id,
-                    "dataType": "int",
-                    "values": data
-                }
-            )
-            
-            sock.send(msg.to_json().encode() + b'\n')
-            response = sock.recv(8192).decode()
-            print(f"Create array response: {response}")
+        # Generate random integer array one chunk at a time
+        chunks = (np.random.randint(1, 1001, size=n).astype(np.int32) for n in self._chunk_sizes(size))
+        self.stream_array(array_id, "int", size, chunks)
     
     def create_double_array(self, array_id: str, size: int):
-        # Generate random double array
-        data = np.random.uniform(1.0, 100.0, size=size).tolist()
-        
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.connect((self.master_host, self.master_port))
-            
-            msg = Message(
-                MessageType.CREATE_ARRAY,
-                "client",
-                "master",
-                {
-                    "arrayId": array_id,
-                    "dataType": "double",
-                    "values": data
-                }
-            )
-            
-            sock.send(msg.to_json().encode() + b'\n')
-            response = sock.recv(8192).decode()
-            print(f"Create array response: {response}")
+        # Generate random double array one chunk at a time
+        chunks = (np.random.uniform(1.0, 100.0, size=n) for n in self._chunk_sizes(size))
+        self.stream_array(array_id, "double", size, chunks)
     
-    def apply_operation(self, array_id: str, operation: str):
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.connect((self.master_host, self.master_port))
-            
-            msg = Message(
-                MessageType.APPLY_OPERATION,
-                "client",
-                "master",
-                {
-                    "arrayId": array_id,
-                    "operation": operation
-                }
-            )
-            
-            sock.send(msg.to_json().encode() + b'\n')
-            response = sock.recv(8192).decode()
-            print(f"Apply operation response: {response}")
+    def _chunk_sizes(self, size: int) -> Iterator[int]:
+        for offset in range(0, size, self.chunk_size):
+            yield min(self.chunk_size, size - offset)
     
-    def get_result(self, array_id: str):
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.connect((self.master_host, self.master_port))
-            
-            msg = Message(
-                MessageType.GET_RESULT,
+    def stream_array(self, array_id: str, data_type: str, total_size: int, chunks: Iterable[np.ndarray]):
+        """Upload an array as a sequence of ARRAY_CHUNK messages.
+
+        Neither the client nor the master ever holds the whole array; the
+        master forwards each chunk to the workers owning that range.
+        """
+        chunk_msgs = self._chunk_messages(array_id, chunks)
+        response = self.session.request(
+            MessageType.CREATE_ARRAY,
+            {
+                "arrayId": array_id,
+                "dataType": data_type,
+                "totalSize": total_size,
+                "streaming": True
+            },
+            chunks=chunk_msgs
+        )
+        print(f"Create array response: {response.to_json()}")
+    
+    def _chunk_messages(self, array_id: str, chunks: Iterable[np.ndarray]) -> Iterator[Message]:
+        offset = 0
+        for chunk in chunks:
+            yield Message(
+                MessageType.ARRAY_CHUNK,
                 "client",
                 "master",
-                {
-                    "arrayId": array_id
-                }
+                {"arrayId": array_id, "offset": offset},
+                payload=chunk
             )
-            
-            sock.send(msg.to_json().encode() + b'\n')
-            response = sock.recv(8192).decode()
-            print(f"Get result response: {response}")
+            offset += len(chunk)
+    
+    def apply_operation(self, array_id: str, operation: str, backend: str = "thread",
+                        trace_id: Optional[str] = None):
+        response = self.session.request(
+            MessageType.APPLY_OPERATION,
+            {
+                "arrayId": array_id,
+                "operation": operation,
+                "backend": backend
+            },
+            trace_id=trace_id
+        )
+        print(f"Apply operation response: {response.to_json()}")
+    
+    def get_result(self, array_id: str, timeout: float = 30.0):
+        response = self.session.request(
+            MessageType.GET_RESULT,
+            {
+                "arrayId": array_id,
+                "timeout": timeout,
+                "binary": True
+            }
+        )
+        
+        if response.payload is None:
+            print(f"Get result response: {response.data}")
+            return None
+        
+        result = response.payload
+        print(f"Get result response: {response.data['status']} "
+              f"({len(result)} elements, {response.data['elapsed']:.3f}s) "
+              f"{np.array2string(result, threshold=10)}")
+        return result
+    
+    def lazy(self, array_id: str) -> LazyArray:
+        return LazyArray(self, array_id)
+    
+    def execute_plan(self, array_id: str, steps: List[Dict[str, Any]], action: str,
+                     backend: str = "thread", timeout: float = 30.0, options: Optional[Dict[str, Any]] = None):
+        # The result request names the plan's job, so other operations on the
+        # array cannot interfere
+        response = self.session.request(
+            MessageType.EXECUTE_PLAN,
+            {
+                "arrayId": array_id,
+                "plan": {"steps": steps, "action": action, **(options or {})},
+                "backend": backend
+            }
+        )
+        if response.data.get('status') != 'processing':
+            raise RuntimeError(f"Plan rejected: {response.data.get('error')}")
+        
+        response = self.session.request(
+            MessageType.GET_RESULT,
+            {
+                "arrayId": array_id,
+                "jobId": response.data['jobId'],
+                "timeout": timeout,
+                "binary": True
+            }
+        )
+        if response.data.get('status') != 'complete':
+            raise RuntimeError(f"Plan did not complete: {response.data}")
+        if 'value' in response.data:
+            return response.data['value']
+        return response.payload
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Metrics snapshots of the master (``master``), of each worker
+        (``workers``) and of all workers merged (``cluster``)."""
+        return self.session.request(MessageType.METRICS, {}).data
+    
+    def get_trace(self, array_id: str, job_id: Optional[str] = None, trace_id: Optional[str] = None,
+                  chrome_path: Optional[str] = None) -> Dict[str, Any]:
+        """Spans and per-stage totals of the latest job on ``array_id`` (or of
+        ``job_id``/``trace_id``); with ``chrome_path`` the trace is also written
+        there as Chrome trace JSON."""
+        request = {"arrayId": array_id, "jobId": job_id, "traceId": trace_id}
+        trace = self.session.request(MessageType.GET_TRACE, request).data
+        if trace.get('status') != 'ok':
+            raise RuntimeError(f"No trace: {trace.get('error')}")
+        if chrome_path is not None:
+            chrome = self.session.request(MessageType.GET_TRACE, dict(request, format="chrome")).data
+            with open(chrome_path, 'w') as f:
+                json.dump(chrome['trace'], f)
+        return trace
+    
+    def close(self):
+        self.session.close()
+
+def parse_plan_steps(tokens: List[str]) -> List[Dict[str, Any]]:
+    # "name" or "name:operand" maps; a leading "?" makes the step a filter
+    steps = []
+    for token in tokens:
+        step = filter_step if token.startswith('?') else map_step
+        name, _, operand = token.lstrip('?').partition(':')
+        steps.append(step(name, float(operand) if operand else None))
+    return steps
 
 def main():
     if len(sys.argv) < 3:
@@ -98,8 +217,11 @@ def main():
         print("\nCommands:")
         print("  create-int <array_id> <size>")
         print("  create-double <array_id> <size>")
-        print("  apply <array_id> <operation>")
+        print("  apply <array_id> <operation> [thread|process]")
         print("  get <array_id>")
+        print("  plan <array_id> <action> [step ...]")
+        print("  metrics [master|cluster|<worker_id>]")
+        print("  trace <array_id> [chrome_trace.json]")
         sys.exit(1)
     
     master_host = sys.argv[1]
@@ -130,10 +252,12 @@ def main():
                     print("Usage: create-double <array_id> <size>")
             
             elif command[0] == "apply":
-                if len(command) >= 3:
+                if len(command) >= 4:
+                    client.apply_operation(command[1], command[2], command[3])
+                elif len(command) >= 3:
                     client.apply_operation(command[1], command[2])
                 else:
-                    print("Usage: apply <array_id> <operation>")
+                    print("Usage: apply <array_id> <operation> [thread|process]")
             
             elif command[0] == "get":
                 if len(command) >= 2:
@@ -141,16 +265,66 @@ def main():
                 else:
                     print("Usage: get <array_id>")
             
+            elif command[0] == "plan":
+                if len(command) >= 3:
+                    # histogram:<bins>:<low>:<high>
+                    action, *params = command[2].split(':')
+                    options = None
+                    if params:
+                        options = {"bins": int(params[0]), "range": [float(params[1]), float(params[2])]}
+                    result = client.execute_plan(command[1], parse_plan_steps(command[3:]), action, options=options)
+                    if isinstance(result, np.ndarray):
+                        print(f"Plan result: {len(result)} elements {np.array2string(result, threshold=10)}")
+                    else:
+                        print(f"Plan result: {result}")
+                else:
+                    print("Usage: plan <array_id> <action> [step ...]")
+            
+            elif command[0] == "metrics":
+                metrics = client.get_metrics()
+                scope = command[1] if len(command) >= 2 else "cluster"
+                snapshot = metrics["workers"].get(scope) or metrics.get(scope)
+                if snapshot is None:
+                    print(f"No metrics for {scope}")
+                else:
+                    print("\n".join(format_snapshot(snapshot)))
+                if metrics["missing"]:
+                    print(f"No answer from: {', '.join(metrics['missing'])}")
+            
+            elif command[0] == "trace":
+                if len(command) >= 2:
+                    path = command[2] if len(command) >= 3 else None
+                    trace = client.get_trace(command[1], chrome_path=path)
+                    print(f"Trace {trace['traceId']} of {trace['jobId']} ({trace['operation']}, "
+                          f"{len(trace['spans'])} spans)")
+                    print(f"{'stage':<12}{'count':>7}{'mean ms':>10}{'max ms':>10}{'total ms':>10}")
+                    for name, stage in trace['stages'].items():
+                        print(f"{name:<12}{stage['count']:>7}{stage['mean'] * 1e3:>10.3f}"
+                              f"{stage['max'] * 1e3:>10.3f}{stage['total'] * 1e3:>10.3f}")
+                    if path:
+                        print(f"Chrome trace written to {path}")
+                else:
+                    print("Usage: trace <array_id> [chrome_trace.json]")
+            
             elif command[0] == "help":
                 print("\nCommands:")
                 print("  create-int <array_id> <size> - Create integer array")
                 print("  create-double <array_id> <size> - Create double array")
-                print("  apply <array_id> <operation> - Apply operation (example1 or example2)")
+                print("  apply <array_id> <operation> [backend] - Apply operation (example1 or example2)")
+                print("      on the thread (default) or process execution backend")
                 print("  get <array_id> - Get result")
+                print("  plan <array_id> <action> [step ...] - Run fused steps and an action: collect, sum,")
+                print("      count, min, max, mean or histogram:<bins>:<low>:<high>;")
+                print("      a step is a kernel or ufunc name, optionally name:operand,")
+                print("      prefixed with ? to filter (e.g. plan a sum example1 sqrt ?greater:0.5)")
+                print("  metrics [master|cluster|<worker_id>] - Latency histograms, counters and queue depths")
+                print("  trace <array_id> [file] - Stage timeline of the array's latest job, optionally")
+                print("      written to file as Chrome trace JSON (chrome://tracing, Perfetto)")
                 print("  exit - Quit")
             
             elif command[0] == "exit":
                 print("Goodbye!")
+                client.close()
                 break
             
             else:
@@ -1,4 +1,3 @@
-import socket
 import sys
 import os
 import json
@@ -9,27 +8,17 @@ from typing import List, Dict, Any
 # Add project root to path to import common modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from common.message import Message, MessageType
+from common.session import ClientSession
 
 class InteropClient:
     def __init__(self, master_host: str, master_port: int):
         self.master_host = master_host
         self.master_port = master_port
+        self.session = ClientSession(master_host, master_port, "interop-client")
 
     def _send_and_receive(self, msg: Message) -> Dict[str, Any]:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.connect((self.master_host, self.master_port))
-            sock.send(msg.to_json().encode() + b'\n')
-            
-            # Read response, handling potential fragmentation
-            buffer = ""
-            while '\n' not in buffer:
-                chunk = sock.recv(4096).decode()
-                if not chunk:
-                    raise ConnectionError("Socket closed before full response was received.")
-                buffer += chunk
-            
-            response_str, _ = buffer.split('\n', 1)
-            return json.loads(response_str)
+        response = self.session.request(msg.type, msg.data)
+        return response.to_dict()
 
     def create_double_array(self, array_id: str, values: List[float]):
         msg = Message(
@@ -49,12 +38,12 @@ class InteropClient:
         )
         return self._send_and_receive(msg)
 
-    def get_result(self, array_id: str):
+    def get_result(self, array_id: str, timeout: float = 30.0):
         msg = Message(
             MessageType.GET_RESULT,
             "interop-client",
             "master",
-            {"arrayId": array_id}
+            {"arrayId": array_id, "timeout": timeout}
         )
         return self._send_and_receive(msg)
 
@@ -98,9 +87,7 @@ def main():
         if response.get('data', {}).get('status') != 'processing':
             raise RuntimeError("Apply operation failed to start.")
 
-        time.sleep(3) # Give time for processing
-
-        # 3. Get Result
+        # 3. Get Result (the master blocks until all segment results are in)
         print(f"\n3. Getting result for array '{array_id}'...")
         response = client.get_result(array_id)
         
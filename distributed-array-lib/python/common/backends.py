@@ -0,0 +1,174 @@
+import importlib
+import multiprocessing as mp
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict
+
+from common import kernels
+from common.kernels import Kernel
+from common.plan import Plan, combine
+
+class ExecutionBackend:
+    """Runs a kernel over a worker segment.
+
+    ``place`` is called with the stored segment before every run and returns
+    the array the worker should keep storing from then on, so a backend can
+    move a segment into memory it can share with its executors once.
+    """
+
+    name = ""
+
+    def place(self, key: str, segment: np.ndarray) -> np.ndarray:
+        return segment
+
+    def run(self, kernel: Kernel, key: str, segment: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def run_plan(self, plan: Plan, key: str, segment: np.ndarray) -> np.ndarray:
+        """Run a fused plan over the segment and return its partial result."""
+        raise NotImplementedError
+
+    def release(self, key: str):
+        pass
+
+    def shutdown(self):
+        pass
+
+class ThreadBackend(ExecutionBackend):
+    """Splits ufunc kernels across threads; the default backend."""
+
+    name = "thread"
+
+    def __init__(self, num_threads: int):
+        self.num_threads = num_threads
+        self.pool = ThreadPoolExecutor(max_workers=num_threads)
+
+    def run(self, kernel: Kernel, key: str, segment: np.ndarray) -> np.ndarray:
+        return kernel(segment, self.pool, self.num_threads)
+
+    def run_plan(self, plan: Plan, key: str, segment: np.ndarray) -> np.ndarray:
+        return plan(segment, self.pool, self.num_threads)
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+def _run_shared_chunk(module: str, kernel_name: str, in_name: str, out_name: str,
+                      length: int, start: int, end: int):
+    importlib.import_module(module)
+    kernel = kernels.KERNELS[kernel_name]
+
+    # Pool processes share the backend's resource tracker, so attaching here
+    # does not make them owners; only the backend unlinks blocks
+    in_shm = shared_memory.SharedMemory(name=in_name)
+    out_shm = shared_memory.SharedMemory(name=out_name)
+    try:
+        segment = np.ndarray((length,), dtype=kernel.input_dtype, buffer=in_shm.buf)
+        out = np.ndarray((length,), dtype=kernel.output_dtype, buffer=out_shm.buf)
+        kernel.run_range(segment, out, start, end)
+        del segment, out
+    finally:
+        in_shm.close()
+        out_shm.close()
+
+def _run_shared_plan(modules, plan_spec: dict, dtype: str, in_name: str,
+                     length: int, start: int, end: int) -> np.ndarray:
+    for module in modules:
+        importlib.import_module(module)
+    plan = Plan.from_dict(plan_spec, dtype)
+
+    in_shm = shared_memory.SharedMemory(name=in_name)
+    try:
+        segment = np.ndarray((length,), dtype=plan.input_dtype, buffer=in_shm.buf)
+        # Partials are small for aggregates; collected elements are pickled back
+        partial = plan.run_range(segment, start, end)
+        del segment
+        return partial
+    finally:
+        in_shm.close()
+
+class ProcessBackend(ExecutionBackend):
+    """Fans kernel chunks out to a persistent process pool.
+
+    Segments are moved into ``multiprocessing.shared_memory`` blocks the first
+    time they are used with this backend; pool processes map the block by name
+    and write into a shared output block, so neither the segment nor the
+    result is pickled. Suited to kernels that hold the GIL. Custom kernels
+    must be registered from an importable module so the pool can find them.
+    """
+
+    name = "process"
+
+    def __init__(self, num_processes: int):
+        self.num_processes = num_processes
+        # forkserver: forking the multi-threaded worker process is unsafe
+        self.pool = ProcessPoolExecutor(max_workers=num_processes,
+                                        mp_context=mp.get_context("forkserver"))
+        self.blocks: Dict[str, shared_memory.SharedMemory] = {}
+        self.arrays: Dict[str, np.ndarray] = {}
+
+    def place(self, key: str, segment: np.ndarray) -> np.ndarray:
+        if self.arrays.get(key) is segment:
+            return segment
+
+        self.release(key)
+        shm = shared_memory.SharedMemory(create=True, size=max(segment.nbytes, 1))
+        shared = np.ndarray(segment.shape, dtype=segment.dtype, buffer=shm.buf)
+        shared[...] = segment
+        self.blocks[key] = shm
+        self.arrays[key] = shared
+        return shared
+
+    def run(self, kernel: Kernel, key: str, segment: np.ndarray) -> np.ndarray:
+        segment = self.place(key, np.asarray(segment, dtype=kernel.input_dtype))
+        length = len(segment)
+        num_chunks = min(self.num_processes, length // kernels.MIN_PARALLEL_ELEMENTS)
+        if num_chunks < 2 and kernel.releases_gil:
+            return kernel(segment)
+
+        out_shm = shared_memory.SharedMemory(create=True, size=max(length * kernel.output_dtype.itemsize, 1))
+        try:
+            bounds = np.linspace(0, length, max(num_chunks, 1) + 1).astype(int)
+            futures = [self.pool.submit(_run_shared_chunk, kernel.module, kernel.name,
+                                        self.blocks[key].name, out_shm.name, length,
+                                        int(bounds[i]), int(bounds[i + 1]))
+                       for i in range(len(bounds) - 1)]
+            for future in futures:
+                future.result()
+            return np.ndarray((length,), dtype=kernel.output_dtype, buffer=out_shm.buf).copy()
+        finally:
+            out_shm.close()
+            out_shm.unlink()
+
+    def run_plan(self, plan: Plan, key: str, segment: np.ndarray) -> np.ndarray:
+        segment = self.place(key, segment)
+        length = len(segment)
+        num_chunks = max(min(self.num_processes, length // kernels.MIN_PARALLEL_ELEMENTS), 1)
+
+        bounds = np.linspace(0, length, num_chunks + 1).astype(int)
+        futures = [self.pool.submit(_run_shared_plan, plan.modules(), plan.to_dict(), segment.dtype.str,
+                                    self.blocks[key].name, length, int(bounds[i]), int(bounds[i + 1]))
+                   for i in range(num_chunks)]
+        return combine(plan.action, [future.result() for future in futures])
+
+    def release(self, key: str):
+        self.arrays.pop(key, None)
+        shm = self.blocks.pop(key, None)
+        if shm is not None:
+            shm.unlink()
+            try:
+                shm.close()
+            except BufferError:
+                # Still referenced by the worker's store; the mapping is
+                # dropped together with the last array view
+                pass
+
+    def shutdown(self):
+        self.pool.shutdown()
+        for key in list(self.blocks):
+            self.release(key)
+
+BACKENDS = {
+    ThreadBackend.name: ThreadBackend,
+    ProcessBackend.name: ProcessBackend,
+}
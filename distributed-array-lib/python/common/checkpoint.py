@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import threading
+import zlib
+import numpy as np
+from typing import Any, Dict, List, Tuple
+
+SegmentKey = Tuple[str, int]
+
+DTYPES = {"int": np.int32, "double": np.float64}
+
+def data_type(dtype) -> str:
+    return "int" if np.dtype(dtype) == np.int32 else "double"
+
+class SegmentCheckpoint:
+    """Segments a worker persisted to local disk, so a restart can reuse them.
+
+    Each segment is a raw file named after its key. ``manifest.jsonl`` is an
+    append-only journal of ``put``, ``role`` and ``drop`` records; a segment's
+    record carries its type, length, role and CRC32. ``load`` replays the
+    journal, verifies every file against its checksum, and rewrites the
+    journal with the surviving entries only.
+    """
+
+    MANIFEST = "manifest.jsonl"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.entries: Dict[SegmentKey, Dict[str, Any]] = {}
+
+    def _path(self, array_id: str, segment_id: int) -> str:
+        name = hashlib.sha1(f"{array_id}\0{segment_id}".encode()).hexdigest()[:20]
+        return os.path.join(self.directory, f"{name}.seg")
+
+    def _append(self, record: Dict[str, Any]):
+        with open(os.path.join(self.directory, self.MANIFEST), "a") as journal:
+            journal.write(json.dumps(record) + "\n")
+
+    def save(self, array_id: str, segment_id: int, data: np.ndarray, primary: bool):
+        data = np.ascontiguousarray(data)
+        path = self._path(array_id, segment_id)
+        with self.lock:
+            # Written aside and renamed, so a crash never leaves a torn file
+            # under a name the manifest vouches for
+            data.tofile(path + ".tmp")
+            os.replace(path + ".tmp", path)
+            entry = {"op": "put", "arrayId": array_id, "segmentId": segment_id,
+                     "dataType": data_type(data.dtype), "length": len(data), "isPrimary": primary,
+                     "checksum": zlib.crc32(memoryview(data).cast("B"))}
+            self.entries[(array_id, segment_id)] = entry
+            self._append(entry)
+
+    def set_role(self, array_id: str, segment_id: int, primary: bool):
+        with self.lock:
+            entry = self.entries.get((array_id, segment_id))
+            if entry is None or entry["isPrimary"] == primary:
+                return
+            entry["isPrimary"] = primary
+            self._append({"op": "role", "arrayId": array_id, "segmentId": segment_id, "isPrimary": primary})
+
+    def drop(self, array_id: str, segment_id: int):
+        with self.lock:
+            if self.entries.pop((array_id, segment_id), None) is None:
+                return
+            self._append({"op": "drop", "arrayId": array_id, "segmentId": segment_id})
+            path = self._path(array_id, segment_id)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def load(self) -> Tuple[List[Tuple[Dict[str, Any], np.ndarray]], List[SegmentKey]]:
+        """Return ``(entry, data)`` for every intact segment, and the keys found corrupt."""
+        manifest = os.path.join(self.directory, self.MANIFEST)
+        entries: Dict[SegmentKey, Dict[str, Any]] = {}
+        if os.path.exists(manifest):
+            with open(manifest) as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A record cut short by a crash; everything before it stands
+                        break
+                    key = (record["arrayId"], record["segmentId"])
+                    if record["op"] == "put":
+                        entries[key] = record
+                    elif record["op"] == "role" and key in entries:
+                        entries[key]["isPrimary"] = record["isPrimary"]
+                    elif record["op"] == "drop":
+                        entries.pop(key, None)
+
+        loaded, corrupt = [], []
+        for key, entry in entries.items():
+            path = self._path(*key)
+            try:
+                data = np.fromfile(path, dtype=DTYPES[entry["dataType"]])
+            except OSError:
+                corrupt.append(key)
+                continue
+            if len(data) != entry["length"] or zlib.crc32(memoryview(data).cast("B")) != entry["checksum"]:
+                corrupt.append(key)
+                os.remove(path)
+                continue
+            loaded.append((entry, data))
+
+        with self.lock:
+            self.entries = {(entry["arrayId"], entry["segmentId"]): entry for entry, _ in loaded}
+            # Files of dropped or half-written segments
+            kept = {os.path.basename(self._path(*key)) for key in self.entries}
+            for name in os.listdir(self.directory):
+                if name.endswith((".seg", ".seg.tmp")) and name not in kept:
+                    os.remove(os.path.join(self.directory, name))
+            tmp = manifest + ".tmp"
+            with open(tmp, "w") as journal:
+                for entry in self.entries.values():
+                    journal.write(json.dumps(entry) + "\n")
+            os.replace(tmp, manifest)
+        return loaded, corrupt
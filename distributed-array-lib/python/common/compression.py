@@ -0,0 +1,243 @@
+import lzma
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Payloads smaller than this are always sent as they are
+MIN_COMPRESS_BYTES = 256 * 1024
+# Elements sampled to estimate a codec's ratio and speed on a payload
+SAMPLE_ELEMENTS = 1 << 17
+SAMPLE_BLOCKS = 2
+# Assumed link rate (bytes/s) until transfers have been measured: about
+# gigabit Ethernet, so compression is tried from the first transfer on
+DEFAULT_LINK_RATE = 1e8
+
+def _shuffle(array: np.ndarray) -> bytes:
+    # Byte i of every element together: similar high bytes end up in runs
+    return array.view(np.uint8).reshape(len(array), array.dtype.itemsize).T.tobytes()
+
+def _unshuffle(data: bytes, dtype: np.dtype, count: int) -> np.ndarray:
+    planes = np.frombuffer(data, dtype=np.uint8).reshape(dtype.itemsize, count)
+    return np.ascontiguousarray(planes.T).view(dtype).reshape(count)
+
+def _inflate(decompressor, data: bytes, nbytes: int) -> bytes:
+    # Never produce more than the header promised
+    out = decompressor.decompress(data, nbytes)
+    if len(out) != nbytes:
+        raise ValueError(f"Compressed payload holds {len(out)} bytes, expected {nbytes}")
+    return out
+
+def _word_type(width: int) -> np.dtype:
+    return np.dtype("<u4") if width <= 32 else np.dtype("<u8")
+
+def _pack_bits(values: np.ndarray, width: int) -> bytes:
+    # The values are cut into as many equal lanes as a word has bits (32, or
+    # 64 if ``width`` needs them); lane j fills bits j * width onwards of
+    # every row of ``width`` little-endian words, so each lane is packed with
+    # one vectorised shift over whole words.
+    if width == 0:
+        return b""
+    word_type = _word_type(width)
+    bits = word_type.itemsize * 8
+    rows = (len(values) + bits - 1) // bits
+    lanes = np.zeros(bits * rows, dtype=word_type)
+    lanes[:len(values)] = values
+    lanes = lanes.reshape(bits, rows)
+    words = np.zeros((width, rows), dtype=word_type)
+    scratch = np.empty(rows, dtype=word_type)
+    for j in range(bits):
+        word, shift = divmod(j * width, bits)
+        np.left_shift(lanes[j], word_type.type(shift), out=scratch)
+        words[word] |= scratch
+        if shift + width > bits:
+            np.right_shift(lanes[j], word_type.type(bits - shift), out=scratch)
+            words[word + 1] |= scratch
+    return words.tobytes()
+
+def _unpack_bits(data: bytes, offset: int, width: int, count: int) -> np.ndarray:
+    if width == 0:
+        if len(data) != offset:
+            raise ValueError("Bit-packed payload has the wrong length")
+        return np.zeros(count, dtype=np.uint32)
+    word_type = _word_type(width)
+    bits = word_type.itemsize * 8
+    rows = (count + bits - 1) // bits
+    if len(data) != offset + width * rows * word_type.itemsize:
+        raise ValueError("Bit-packed payload has the wrong length")
+    words = np.frombuffer(data, dtype=word_type, count=width * rows, offset=offset).reshape(width, rows)
+    mask = word_type.type((1 << width) - 1)
+    lanes = np.empty((bits, rows), dtype=word_type)
+    scratch = np.empty(rows, dtype=word_type)
+    for j in range(bits):
+        word, shift = divmod(j * width, bits)
+        lane = lanes[j]
+        np.right_shift(words[word], word_type.type(shift), out=lane)
+        if shift + width > bits:
+            np.left_shift(words[word + 1], word_type.type(bits - shift), out=scratch)
+            lane |= scratch
+        lane &= mask
+    return lanes.reshape(-1)[:count]
+
+def _zlib_encode(array: np.ndarray) -> bytes:
+    return zlib.compress(_shuffle(array), 1)
+
+def _zlib_decode(data: bytes, dtype: np.dtype, count: int) -> np.ndarray:
+    return _unshuffle(_inflate(zlib.decompressobj(), data, count * dtype.itemsize), dtype, count)
+
+def _lzma_encode(array: np.ndarray) -> bytes:
+    return lzma.compress(_shuffle(array), preset=1)
+
+def _lzma_decode(data: bytes, dtype: np.dtype, count: int) -> np.ndarray:
+    return _unshuffle(_inflate(lzma.LZMADecompressor(), data, count * dtype.itemsize), dtype, count)
+
+# Both bit-packing codecs work modulo 2**32 on int32 data, so offsets and
+# differences always fit a uint32 and wrap back exactly when decoded
+_BITPACK_HEADER = struct.Struct("<qB")
+
+def _unpack_offsets(data: bytes, offset: int, width: int, count: int) -> np.ndarray:
+    if width > 32:
+        raise ValueError(f"Bit width {width} is too wide for int32 values")
+    return _unpack_bits(data, offset, width, count).astype(np.uint32, copy=False)
+
+def _bitpack_encode(array: np.ndarray) -> bytes:
+    # Frame of reference: offsets from the minimum in as few bits as they need
+    base = array.min() if len(array) else array.dtype.type(0)
+    offsets = (array - base).view(np.uint32)
+    width = int(offsets.max()).bit_length() if len(array) else 0
+    return _BITPACK_HEADER.pack(int(base), width) + _pack_bits(offsets, width)
+
+def _bitpack_decode(data: bytes, dtype: np.dtype, count: int) -> np.ndarray:
+    base, width = _BITPACK_HEADER.unpack_from(data)
+    offsets = _unpack_offsets(data, _BITPACK_HEADER.size, width, count)
+    offsets += np.uint32(base & 0xFFFFFFFF)
+    return offsets.view(np.int32).astype(dtype, copy=False)
+
+_DELTA_HEADER = struct.Struct("<qqB")
+
+def _delta_bitpack_encode(array: np.ndarray) -> bytes:
+    # Differences, offset from the smallest one: sorted, strided or slowly
+    # varying sequences need few bits, a constant stride none at all
+    first = int(array[0]) if len(array) else 0
+    deltas = np.diff(array)
+    base = deltas.min() if len(deltas) else array.dtype.type(0)
+    offsets = (deltas - base).view(np.uint32)
+    width = int(offsets.max()).bit_length() if len(offsets) else 0
+    return _DELTA_HEADER.pack(first, int(base), width) + _pack_bits(offsets, width)
+
+def _delta_bitpack_decode(data: bytes, dtype: np.dtype, count: int) -> np.ndarray:
+    first, base, width = _DELTA_HEADER.unpack_from(data)
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    deltas = _unpack_offsets(data, _DELTA_HEADER.size, width, count - 1)
+    deltas += np.uint32(base & 0xFFFFFFFF)
+    values = np.empty(count, dtype=np.uint32)
+    values[0] = first & 0xFFFFFFFF
+    np.cumsum(deltas, out=values[1:])
+    values[1:] += values[0]
+    return values.view(np.int32).astype(dtype, copy=False)
+
+@dataclass(frozen=True)
+class Codec:
+    name: str
+    encode: Callable[[np.ndarray], bytes]
+    decode: Callable[[bytes, np.dtype, int], np.ndarray]
+    dtypes: Tuple[str, ...]
+
+CODECS: Dict[str, Codec] = {codec.name: codec for codec in (
+    Codec("shuffle-zlib", _zlib_encode, _zlib_decode, ("<i4", "<f8")),
+    Codec("shuffle-lzma", _lzma_encode, _lzma_decode, ("<i4", "<f8")),
+    Codec("bitpack", _bitpack_encode, _bitpack_decode, ("<i4",)),
+    Codec("delta-bitpack", _delta_bitpack_encode, _delta_bitpack_decode, ("<i4",)),
+)}
+
+def encode(codec: str, array: np.ndarray) -> bytes:
+    return CODECS[codec].encode(array.reshape(-1))
+
+def decode(codec: str, data: bytes, dtype: np.dtype, shape: Tuple[int, ...]) -> np.ndarray:
+    if codec not in CODECS:
+        raise ValueError(f"Unknown payload codec: {codec}")
+    count = int(np.prod(shape, dtype=np.int64))
+    array = CODECS[codec].decode(data, dtype, count)
+    if len(array) != count:
+        raise ValueError(f"{codec} payload decoded to {len(array)} elements, expected {count}")
+    return array.reshape(shape)
+
+class LinkMeter:
+    """Exponentially weighted throughput of one link, in bytes per second.
+
+    Only transfers of at least ``min_bytes`` are sampled; smaller ones mostly
+    measure the socket buffer rather than the link.
+    """
+
+    def __init__(self, rate: float = DEFAULT_LINK_RATE, weight: float = 0.3, min_bytes: int = 1 << 20):
+        self.rate = rate
+        self.weight = weight
+        self.min_bytes = min_bytes
+
+    def observe(self, nbytes: int, seconds: float):
+        if nbytes >= self.min_bytes and seconds > 0:
+            self.rate = self.weight * (nbytes / seconds) + (1 - self.weight) * self.rate
+
+class CodecPolicy:
+    """Picks, per payload, the codec that gets it across a link fastest.
+
+    Each codec that supports the payload's dtype is run on a sample of it
+    (SAMPLE_BLOCKS evenly spaced blocks, encoded separately); the sampled
+    ratio and encode and decode speeds estimate the whole transfer as
+    encode + wire bytes / link rate + decode. A codec wins only if that beats sending the raw bytes by
+    ``margin``. A codec whose measured speed falls below the link rate cannot
+    win: its sampling stops there, and it is not sampled again while the
+    link is that fast.
+    """
+
+    def __init__(self, codecs: Optional[Iterable[str]] = None, margin: float = 0.9):
+        self.codecs = list(codecs) if codecs is not None else list(CODECS)
+        self.margin = margin
+        # Encode plus decode throughput per codec, bytes/s, as last sampled
+        self.speeds: Dict[str, float] = {}
+        self.chosen: Dict[Optional[str], int] = {}
+
+    def choose(self, array: np.ndarray, link_rate: float, accepted: Iterable[str]) -> Optional[str]:
+        array = array.reshape(-1)
+        best, best_time = None, array.nbytes / link_rate * self.margin
+        if array.nbytes >= MIN_COMPRESS_BYTES:
+            blocks = self._sample(array)
+            scale = array.nbytes / sum(block.nbytes for block in blocks)
+            accepted = set(accepted)
+            for name in self.codecs:
+                codec = CODECS[name]
+                if name not in accepted or array.dtype.str not in codec.dtypes:
+                    continue
+                if self.speeds.get(name, float("inf")) < link_rate:
+                    continue
+                # Blocks are encoded one by one: joined, their seams would
+                # look like data to the delta codecs
+                start = time.perf_counter()
+                encoded = sampled = 0
+                for block in blocks:
+                    data = codec.encode(block)
+                    codec.decode(data, block.dtype, len(block))
+                    encoded += len(data)
+                    sampled += block.nbytes
+                    elapsed = max(time.perf_counter() - start, 1e-9)
+                    self.speeds[name] = sampled / elapsed
+                    if self.speeds[name] < link_rate:
+                        break
+                else:
+                    estimate = elapsed * scale + encoded * scale / link_rate
+                    if estimate < best_time:
+                        best, best_time = name, estimate
+        self.chosen[best] = self.chosen.get(best, 0) + 1
+        return best
+
+    @staticmethod
+    def _sample(array: np.ndarray) -> List[np.ndarray]:
+        if len(array) <= SAMPLE_ELEMENTS:
+            return [np.ascontiguousarray(array)]
+        block = SAMPLE_ELEMENTS // SAMPLE_BLOCKS
+        starts = np.linspace(0, len(array) - block, SAMPLE_BLOCKS).astype(np.int64)
+        return [np.ascontiguousarray(array[start:start + block]) for start in starts]
@@ -1,5 +1,6 @@
+import bisect
 import numpy as np
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Union, Optional, Iterator, Tuple
 from dataclasses import dataclass
 
 @dataclass
@@ -9,48 +10,50 @@ class Segment:
     end_index: int
     replicas: List[str]
 
+def overlapping_segments(segments: List[Segment], start: int, end: int) -> Iterator[Tuple[Segment, int, int]]:
+    """Yield ``(segment, lo, hi)`` for each segment intersecting ``[start, end)``.
+
+    ``segments`` must be ordered by start index, as produced by ``plan_placement``.
+    """
+    starts = [segment.start_index for segment in segments]
+    index = max(bisect.bisect_right(starts, start) - 1, 0)
+    while index < len(segments) and segments[index].start_index < end:
+        segment = segments[index]
+        lo = max(start, segment.start_index)
+        hi = min(end, segment.end_index)
+        if lo < hi:
+            yield segment, lo, hi
+        index += 1
+
 class DArrayInt:
-    def __init__(self, array_id: str, data: Union[List[int], np.ndarray]):
+    dtype = np.dtype(np.int32)
+    # The "dataType" of the array in messages
+    data_type = "int"
+
+    def __init__(self, array_id: str, data: Optional[Union[List[int], np.ndarray]], total_size: int = 0):
+        # data is None for streamed arrays, which only exist on the workers
         self.array_id = array_id
-        self.data = np.array(data, dtype=np.int32)
-        self.total_size = len(self.data)
+        self.data = np.array(data, dtype=np.int32) if data is not None else None
+        self.total_size = len(self.data) if self.data is not None else total_size
         self.segments: List[Segment] = []
-    
-    def segment_array(self, num_workers: int):
-        segment_size = self.total_size // num_workers
-        remainder = self.total_size % num_workers
-        
-        current_index = 0
-        for i in range(num_workers):
-            size = segment_size + (1 if i < remainder else 0)
-            if size > 0:
-                self.segments.append(
-                    Segment(f"worker-{i}", current_index, current_index + size, [])
-                )
-                current_index += size
-    
-    def get_segment_data(self, start_index: int, end_index: int) -> np.ndarray:
+
+    def get_segment_data(self, start_index: int, end_index: int) -> Optional[np.ndarray]:
+        if self.data is None:
+            return None
         return self.data[start_index:end_index]
 
 class DArrayDouble:
-    def __init__(self, array_id: str, data: Union[List[float], np.ndarray]):
+    dtype = np.dtype(np.float64)
+    data_type = "double"
+
+    def __init__(self, array_id: str, data: Optional[Union[List[float], np.ndarray]], total_size: int = 0):
+        # data is None for streamed arrays, which only exist on the workers
         self.array_id = array_id
-        self.data = np.array(data, dtype=np.float64)
-        self.total_size = len(self.data)
+        self.data = np.array(data, dtype=np.float64) if data is not None else None
+        self.total_size = len(self.data) if self.data is not None else total_size
         self.segments: List[Segment] = []
-    
-    def segment_array(self, num_workers: int):
-        segment_size = self.total_size // num_workers
-        remainder = self.total_size % num_workers
-        
-        current_index = 0
-        for i in range(num_workers):
-            size = segment_size + (1 if i < remainder else 0)
-            if size > 0:
-                self.segments.append(
-                    Segment(f"worker-{i}", current_index, current_index + size, [])
-                )
-                current_index += size
-    
-    def get_segment_data(self, start_index: int, end_index: int) -> np.ndarray:
-        return self.data[start_index:end_index]
\ No newline at end of file
+
+    def get_segment_data(self, start_index: int, end_index: int) -> Optional[np.ndarray]:
+        if self.data is None:
+            return None
+        return self.data[start_index:end_index]
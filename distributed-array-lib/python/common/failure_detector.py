@@ -0,0 +1,70 @@
+import math
+from collections import deque
+
+class PhiAccrualFailureDetector:
+    """Phi accrual failure detector (Hayashibara et al.) for one node.
+
+    Instead of a fixed timeout, it keeps a window of recent heartbeat
+    inter-arrival times and reports ``phi``: how unlikely it is, given
+    that distribution, that nothing has arrived for so long.
+    phi = -log10(P(silence lasts this long)), so phi 8 means a chance of
+    1e-8 that a live node would be this late. Jittery links widen the
+    distribution and raise the silence needed to suspect a node, while
+    regular ones are suspected quickly.
+
+    ``heartbeat`` records an arrival as an interval sample. ``touch`` records
+    any other message: it proves the node alive but is not a sample.
+    """
+
+    def __init__(self, expected_interval: float, threshold: float = 8.0, window: int = 200,
+                 min_std_dev: float = 0.1, acceptable_pause: float = 0.0):
+        self.threshold = threshold
+        self.min_std_dev = min_std_dev
+        self.acceptable_pause = acceptable_pause
+        self.intervals = deque(maxlen=window)
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.last_heartbeat = None
+        self.last_seen = None
+        # Until real samples arrive, assume the advertised interval with some spread
+        for interval in (expected_interval * 0.75, expected_interval * 1.25):
+            self._add(interval)
+
+    def _add(self, interval: float):
+        if len(self.intervals) == self.intervals.maxlen:
+            old = self.intervals[0]
+            self.total -= old
+            self.total_squares -= old * old
+        self.intervals.append(interval)
+        self.total += interval
+        self.total_squares += interval * interval
+
+    def heartbeat(self, now: float):
+        if self.last_heartbeat is not None:
+            self._add(now - self.last_heartbeat)
+        self.last_heartbeat = now
+        self.last_seen = now
+
+    def touch(self, now: float):
+        self.last_seen = now
+
+    def phi(self, now: float) -> float:
+        if self.last_seen is None:
+            return 0.0
+        count = len(self.intervals)
+        mean = self.total / count
+        variance = max(self.total_squares / count - mean * mean, 0.0)
+        std_dev = max(math.sqrt(variance), self.min_std_dev)
+
+        # Logistic approximation of the normal CDF's tail, as in Akka/Cassandra,
+        # evaluated in log space so long silences do not underflow
+        y = (now - self.last_seen - mean - self.acceptable_pause) / std_dev
+        exponent = -y * (1.5976 + 0.070566 * y * y)
+        if exponent > 50:
+            return 0.0
+        if y > 0:
+            return -exponent / math.log(10) + math.log10(1.0 + math.exp(exponent))
+        return -math.log10(1.0 - 1.0 / (1.0 + math.exp(exponent)))
+
+    def is_available(self, now: float) -> bool:
+        return self.phi(now) < self.threshold
@@ -0,0 +1,111 @@
+import numpy as np
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional
+
+# Elements per ufunc pass. Keeps the block and its temporaries resident in
+# cache instead of streaming whole-segment intermediates through memory.
+BLOCK_SIZE = 16384
+
+# Minimum elements per thread before a kernel is split across threads. NumPy
+# ufuncs only release the GIL for the duration of the inner loop, so on small
+# inputs thread dispatch costs more than it saves.
+MIN_PARALLEL_ELEMENTS = 131072
+
+class Kernel:
+    """A whole-array operation expressed as blocked NumPy ufunc calls.
+
+    ``block_fn(x, out, scratch)`` computes one block of the result into ``out``;
+    ``scratch`` holds per-thread temporaries allocated once by ``make_scratch``
+    and reused across blocks. ``releases_gil`` marks kernels whose block
+    function is pure ufunc work and therefore benefits from threads; kernels
+    that run Python code per element should leave it unset and be executed
+    on the process backend.
+    """
+
+    def __init__(self, name: str, data_type: str, input_dtype, output_dtype,
+                 block_fn: Callable, make_scratch: Callable[[int], List[np.ndarray]],
+                 releases_gil: bool = True):
+        self.name = name
+        self.data_type = data_type
+        self.input_dtype = np.dtype(input_dtype)
+        self.output_dtype = np.dtype(output_dtype)
+        self.block_fn = block_fn
+        self.make_scratch = make_scratch
+        self.releases_gil = releases_gil
+        # Imported by process-pool children to find kernels registered outside this module
+        self.module = block_fn.__module__
+
+    def run_range(self, segment: np.ndarray, out: np.ndarray, start: int, end: int):
+        scratch = self.make_scratch(min(BLOCK_SIZE, end - start))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for block_start in range(start, end, BLOCK_SIZE):
+                block_end = min(block_start + BLOCK_SIZE, end)
+                size = block_end - block_start
+                self.block_fn(segment[block_start:block_end], out[block_start:block_end],
+                              [buf[:size] for buf in scratch])
+
+    def __call__(self, segment: np.ndarray, executor: Optional[Executor] = None,
+                 num_threads: int = 1) -> np.ndarray:
+        segment = np.ascontiguousarray(segment, dtype=self.input_dtype)
+        out = np.empty(len(segment), dtype=self.output_dtype)
+
+        num_threads = min(num_threads, len(segment) // MIN_PARALLEL_ELEMENTS)
+        if executor is None or num_threads < 2 or not self.releases_gil:
+            self.run_range(segment, out, 0, len(segment))
+            return out
+
+        # The calling thread takes the first chunk itself so a kernel invoked
+        # from inside ``executor`` can never deadlock waiting on its own pool.
+        bounds = np.linspace(0, len(segment), num_threads + 1).astype(int)
+        futures = [executor.submit(self.run_range, segment, out, bounds[i], bounds[i + 1])
+                   for i in range(1, num_threads)]
+        self.run_range(segment, out, bounds[0], bounds[1])
+        for future in futures:
+            future.result()
+        return out
+
+def _example1_block(x: np.ndarray, out: np.ndarray, scratch: List[np.ndarray]):
+    # ((sin(x) + cos(x))^2) / (sqrt(abs(x)) + 1)
+    tmp, = scratch
+    np.sin(x, out=out)
+    np.cos(x, out=tmp)
+    np.add(out, tmp, out=out)
+    np.square(out, out=out)
+    np.abs(x, out=tmp)
+    np.sqrt(tmp, out=tmp)
+    np.add(tmp, 1, out=tmp)
+    np.divide(out, tmp, out=out)
+
+def _example1_scratch(size: int) -> List[np.ndarray]:
+    return [np.empty(size, dtype=np.float64)]
+
+def _example2_block(x: np.ndarray, out: np.ndarray, scratch: List[np.ndarray]):
+    # x % 3 == 0 or 500 <= x <= 1000 ? int((x * log(x)) % 7) : x
+    value, remainder, mask, in_range = scratch
+    np.log(x, out=value)
+    np.multiply(value, x, out=value)
+    np.mod(value, 7, out=value)
+
+    np.remainder(x, 3, out=remainder)
+    np.equal(remainder, 0, out=mask)
+    np.greater_equal(x, 500, out=in_range)
+    np.logical_or(mask, in_range & (x <= 1000), out=mask)
+
+    np.copyto(out, x)
+    np.copyto(out, value, casting='unsafe', where=mask)
+
+def _example2_scratch(size: int) -> List[np.ndarray]:
+    return [np.empty(size, dtype=np.float64), np.empty(size, dtype=np.int32),
+            np.empty(size, dtype=bool), np.empty(size, dtype=bool)]
+
+EXAMPLE1 = Kernel("example1", "double", np.float64, np.float64, _example1_block, _example1_scratch)
+EXAMPLE2 = Kernel("example2", "int", np.int32, np.int32, _example2_block, _example2_scratch)
+
+KERNELS: Dict[str, Kernel] = {
+    EXAMPLE1.name: EXAMPLE1,
+    EXAMPLE2.name: EXAMPLE2,
+}
+
+def register_kernel(kernel: Kernel) -> Kernel:
+    KERNELS[kernel.name] = kernel
+    return kernel
@@ -0,0 +1,124 @@
+import multiprocessing as mp
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from common.session import ClientSession
+from common.transport import MemoryTransport, UnixTransport
+from master.master_node import MasterNode
+from worker.worker_node import WorkerNode
+
+def run_worker(worker_id: str, host: str, port: int, directory: str, options: Dict[str, Any]):
+    # Entry point of a worker process of a LoopbackCluster
+    WorkerNode(worker_id, host, port, transport=UnixTransport(directory), **options).start()
+
+class LoopbackCluster:
+    """A master and ``workers`` workers on this host that talk without TCP.
+
+    By default the whole cluster runs in this process over a
+    ``MemoryTransport`` and is up within milliseconds; the workers share the
+    interpreter, so their kernels only run in parallel where NumPy releases
+    the GIL. With ``processes`` every worker runs in a process of its own and
+    connects over Unix sockets in a temporary directory; the worker
+    processes are spawned, so a script starting them needs the usual
+    ``if __name__ == "__main__"`` guard. ``master_options`` and
+    ``worker_options`` are passed to ``MasterNode`` and ``WorkerNode``::
+
+        with LoopbackCluster(workers=3) as cluster:
+            client = cluster.client()
+            client.create_double_array("a", 1_000_000)
+    """
+
+    PORT = 5000
+    STARTUP_TIMEOUT = 30.0
+
+    def __init__(self, workers: int = 2, processes: bool = False, master_options: Optional[Dict[str, Any]] = None,
+                 worker_options: Optional[Dict[str, Any]] = None):
+        self.worker_count = workers
+        self.processes = processes
+        self.master_options = master_options or {}
+        self.worker_options = worker_options or {}
+        self.directory = tempfile.mkdtemp(prefix="darray-") if processes else None
+        self.transport = UnixTransport(self.directory) if processes else MemoryTransport()
+        self.host = self.directory if processes else MemoryTransport.HOST
+        self.port = self.PORT
+        self.master: Optional[MasterNode] = None
+        self.master_thread: Optional[threading.Thread] = None
+        # WorkerNodes, or their processes
+        self.workers: List[Any] = []
+
+    def start(self) -> 'LoopbackCluster':
+        try:
+            self.master = MasterNode(self.port, transport=self.transport, **self.master_options)
+            self.master_thread = threading.Thread(target=self.master.start, daemon=True)
+            self.master_thread.start()
+            self.wait_for(lambda: self.master.server is not None, "the master to listen")
+            for i in range(self.worker_count):
+                self.start_worker(f"worker-{i}")
+            self.wait_for(lambda: self.alive_workers() >= self.worker_count,
+                          f"{self.worker_count} workers to register")
+        except BaseException:
+            self.stop()
+            raise
+        return self
+
+    def start_worker(self, worker_id: str):
+        if self.processes:
+            # Spawned rather than forked: this process runs the master's threads
+            worker = mp.get_context("spawn").Process(
+                target=run_worker, args=(worker_id, self.host, self.port, self.directory, self.worker_options))
+            worker.start()
+        else:
+            worker = WorkerNode(worker_id, self.host, self.port, transport=self.transport, **self.worker_options)
+            threading.Thread(target=worker.start, daemon=True).start()
+        self.workers.append(worker)
+
+    def alive_workers(self) -> int:
+        return sum(worker.alive for worker in list(self.master.workers.values()))
+
+    def wait_for(self, condition: Callable[[], bool], what: str):
+        deadline = time.monotonic() + self.STARTUP_TIMEOUT
+        while not condition():
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Timed out waiting for {what}")
+            time.sleep(0.001)
+
+    def session(self, client_id: str = "client") -> ClientSession:
+        return ClientSession(self.host, self.port, client_id, self.transport)
+
+    def client(self):
+        from client.distributed_array_client import DistributedArrayClient
+        return DistributedArrayClient(self.host, self.port, transport=self.transport)
+
+    def kill_worker(self, index: int):
+        """Fail a worker the way a crash does: its connections close at once."""
+        worker = self.workers[index]
+        if self.processes:
+            worker.kill()
+            worker.join()
+        else:
+            worker.shutdown()
+
+    def stop(self):
+        # The master goes first, so it does not recover from the workers leaving
+        if self.master is not None and self.master.server is not None:
+            self.master.server.get_loop().call_soon_threadsafe(self.master.shutdown)
+            self.master_thread.join()
+        self.master = None
+        for worker in self.workers:
+            if self.processes:
+                worker.kill()
+                worker.join()
+            elif worker.running:
+                worker.shutdown()
+        self.workers = []
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self) -> 'LoopbackCluster':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -1,47 +1,367 @@
 import json
 import time
-from typing import Dict, Any
+import socket
+import asyncio
+import numpy as np
+from concurrent.futures import Executor
+from typing import Callable, Dict, Any, Optional
+
+from common import compression
+from common.metrics import MetricsRegistry
+
+# Longest header line accepted by the asyncio reader. Payloads are not bound by
+# it, but JSON-only peers still send whole arrays inside the header.
+MAX_HEADER_SIZE = 1 << 28
+
+# Headers above this size are decoded off the event loop
+LARGE_HEADER_SIZE = 1 << 20
+
+# Largest binary payload a reader will allocate for
+MAX_PAYLOAD_SIZE = 1 << 34
+
+# Payloads are read in pieces of at most this many bytes when the reader
+# reports progress
+PAYLOAD_READ_SIZE = 1 << 18
 
 class MessageType:
     REGISTER_WORKER = "REGISTER_WORKER"
     HEARTBEAT = "HEARTBEAT"
     WORKER_STATUS = "WORKER_STATUS"
     SHUTDOWN = "SHUTDOWN"
-    
+
     DISTRIBUTE_ARRAY = "DISTRIBUTE_ARRAY"
     PROCESS_SEGMENT = "PROCESS_SEGMENT"
     SEGMENT_RESULT = "SEGMENT_RESULT"
     REPLICATE_DATA = "REPLICATE_DATA"
-    
+    SEGMENT_CHUNK = "SEGMENT_CHUNK"
+    CANCEL_TASK = "CANCEL_TASK"
+    SEGMENT_ACK = "SEGMENT_ACK"
+
     NODE_FAILURE = "NODE_FAILURE"
     RECOVER_DATA = "RECOVER_DATA"
     RECOVERY_COMPLETE = "RECOVERY_COMPLETE"
-    
+    COPY_SEGMENT = "COPY_SEGMENT"
+    RECONCILE_SEGMENTS = "RECONCILE_SEGMENTS"
+    DROP_ARRAY = "DROP_ARRAY"
+    METRICS = "METRICS"
+    GET_TRACE = "GET_TRACE"
+
     CREATE_ARRAY = "CREATE_ARRAY"
+    ARRAY_CHUNK = "ARRAY_CHUNK"
     APPLY_OPERATION = "APPLY_OPERATION"
+    EXECUTE_PLAN = "EXECUTE_PLAN"
     GET_RESULT = "GET_RESULT"
     OPERATION_COMPLETE = "OPERATION_COMPLETE"
 
 class Message:
-    def __init__(self, msg_type: str, from_node: str, to_node: str, data: Dict[str, Any]):
+    """A protocol message.
+
+    On the wire every message is a single JSON header line. Messages that
+    carry bulk array data attach it as ``payload`` instead of a JSON list:
+    the header then describes the buffer (dtype, shape, byte length) and the
+    raw little-endian bytes follow immediately after the newline. A payload
+    passed through ``compress`` is sent encoded instead; the header then also
+    names the ``codec`` and the encoded length, ``wireBytes``.
+    """
+
+    def __init__(self, msg_type: str, from_node: str, to_node: str, data: Dict[str, Any],
+                 payload: Optional[np.ndarray] = None, request_id: Optional[int] = None,
+                 trace_id: Optional[str] = None):
         self.type = msg_type
         self.from_node = from_node
         self.to_node = to_node
         self.timestamp = int(time.time() * 1000)
         self.data = data
-    
-    def to_json(self) -> str:
-        return json.dumps({
+        self.payload = payload
+        self.payload_info: Optional[Dict[str, Any]] = None
+        # Codec and encoded bytes of the payload, when it travels compressed
+        self.codec: Optional[str] = None
+        self.wire: Optional[bytes] = None
+        # Correlates responses with requests pipelined on one client connection
+        self.request_id = request_id
+        # Names the job trace the message belongs to, from APPLY_OPERATION
+        # through PROCESS_SEGMENT to SEGMENT_RESULT
+        self.trace_id = trace_id
+
+    def compress(self, codec: str):
+        self.wire = compression.encode(codec, _wire_array(self.payload))
+        self.codec = codec
+
+    def wire_nbytes(self) -> int:
+        """Bytes the payload takes on the wire."""
+        if self.payload is None:
+            return 0
+        return len(self.wire) if self.codec else self.payload.nbytes
+
+    def to_dict(self) -> Dict[str, Any]:
+        obj = {
             "type": self.type,
             "from": self.from_node,
             "to": self.to_node,
             "timestamp": self.timestamp,
             "data": self.data
-        })
-    
+        }
+        if self.request_id is not None:
+            obj["requestId"] = self.request_id
+        if self.trace_id is not None:
+            obj["traceId"] = self.trace_id
+        return obj
+
+    def to_json(self) -> str:
+        obj = self.to_dict()
+        if self.payload is not None:
+            payload = _wire_array(self.payload)
+            obj["payload"] = {
+                "dtype": payload.dtype.str,
+                "shape": list(payload.shape),
+                "nbytes": payload.nbytes
+            }
+            if self.codec:
+                obj["payload"]["codec"] = self.codec
+                obj["payload"]["wireBytes"] = len(self.wire)
+        return json.dumps(obj)
+
     @staticmethod
     def from_json(json_str: str) -> 'Message':
         obj = json.loads(json_str)
         msg = Message(obj["type"], obj["from"], obj["to"], obj["data"])
         msg.timestamp = obj["timestamp"]
-        return msg
\ No newline at end of file
+        msg.payload_info = obj.get("payload")
+        msg.request_id = obj.get("requestId")
+        msg.trace_id = obj.get("traceId")
+        return msg
+
+def _wire_array(array: np.ndarray) -> np.ndarray:
+    """Return a C-contiguous little-endian view (or copy) of ``array``."""
+    dtype = array.dtype.newbyteorder('<') if array.dtype.byteorder == '>' else array.dtype
+    return np.ascontiguousarray(array, dtype=dtype)
+
+def encode_header(message: Message) -> bytes:
+    return message.to_json().encode() + b'\n'
+
+def _payload_bytes(message: Message):
+    if message.codec:
+        return message.wire
+    payload = _wire_array(message.payload)
+    return memoryview(payload).cast('B') if payload.nbytes else b''
+
+def send_message(sock: socket.socket, message: Message, metrics: Optional[MetricsRegistry] = None):
+    """Send ``message`` on ``sock``, streaming any payload without copying it.
+
+    Callers sharing a socket between threads must serialize calls themselves,
+    since header and payload are written with separate ``sendall`` calls.
+    """
+    start = time.perf_counter()
+    header = encode_header(message)
+    payload = _payload_bytes(message) if message.payload is not None else b''
+    if metrics is not None:
+        metrics.message_sent(message.type, len(header) + len(payload), time.perf_counter() - start)
+    sock.sendall(header)
+    if len(payload):
+        sock.sendall(payload)
+
+def _payload_spec(info: Dict[str, Any]):
+    """Validate a payload descriptor before any memory is allocated for it."""
+    dtype = np.dtype(info["dtype"])
+    shape = tuple(info["shape"])
+    nbytes = info["nbytes"]
+    if nbytes != int(np.prod(shape, dtype=np.int64)) * dtype.itemsize:
+        raise ValueError(f"Payload of {nbytes} bytes does not match {dtype.str}{list(shape)}")
+    if nbytes > MAX_PAYLOAD_SIZE:
+        raise ValueError(f"Payload of {nbytes} bytes exceeds the {MAX_PAYLOAD_SIZE} byte limit")
+    if "codec" in info:
+        if info["codec"] not in compression.CODECS:
+            raise ValueError(f"Unknown payload codec: {info['codec']}")
+        if not isinstance(info["wireBytes"], int) or not 0 <= info["wireBytes"] <= MAX_PAYLOAD_SIZE:
+            raise ValueError(f"Encoded payload of {info['wireBytes']} bytes exceeds the limit")
+    return dtype, shape, nbytes
+
+def _decode_payload(message: Message, data: bytes, dtype: np.dtype, shape: tuple) -> np.ndarray:
+    # The encoded bytes are kept, so the payload can be passed on without re-encoding
+    message.codec = message.payload_info["codec"]
+    message.wire = data
+    return compression.decode(message.codec, data, dtype, shape)
+
+class MessageReader:
+    """Buffered reader that yields one ``Message`` per call from a socket.
+
+    Header lines may arrive split across reads or coalesced with following
+    frames. Memory is bounded: a header longer than ``max_header_size`` is
+    rejected, and payload bytes are received directly into a preallocated
+    ``np.empty`` buffer with ``recv_into``, so large segments are never
+    materialized as text.
+    """
+
+    def __init__(self, sock: socket.socket, recv_size: int = 65536, max_header_size: int = MAX_HEADER_SIZE,
+                 metrics: Optional[MetricsRegistry] = None):
+        self.sock = sock
+        self.recv_size = recv_size
+        self.max_header_size = max_header_size
+        self.metrics = metrics
+        self.buffer = bytearray()
+        # Consumed bytes at the front of buffer, dropped lazily to avoid a
+        # memmove per message when many small frames arrive in one read
+        self.position = 0
+
+    def read_message(self) -> Optional[Message]:
+        line = self._read_line()
+        if line is None:
+            return None
+
+        # Deserialization time leaves out the wait for payload bytes
+        start = time.perf_counter()
+        message = Message.from_json(line.decode())
+        elapsed = time.perf_counter() - start
+        info = message.payload_info
+        if info is not None and "codec" in info:
+            dtype, shape, _ = _payload_spec(info)
+            data = self._read_payload({"dtype": "u1", "shape": [info["wireBytes"]], "nbytes": info["wireBytes"]})
+            start = time.perf_counter()
+            message.payload = _decode_payload(message, data.tobytes(), dtype, shape)
+            elapsed += time.perf_counter() - start
+        elif info is not None:
+            message.payload = self._read_payload(info)
+        if self.metrics is not None:
+            self.metrics.message_received(message.type, len(line) + 1 + message.wire_nbytes(), elapsed)
+        return message
+
+    def _consume(self, count: int):
+        self.position += count
+        if self.position == len(self.buffer):
+            self.buffer.clear()
+            self.position = 0
+        elif self.position >= self.recv_size:
+            del self.buffer[:self.position]
+            self.position = 0
+
+    def _read_line(self) -> Optional[bytes]:
+        scanned = self.position
+        while True:
+            newline = self.buffer.find(b'\n', scanned)
+            if newline >= 0:
+                line = bytes(self.buffer[self.position:newline])
+                self._consume(newline + 1 - self.position)
+                scanned = self.position
+                if line.strip():
+                    return line
+                continue
+
+            # Only the newly received bytes need to be searched next time
+            scanned = len(self.buffer)
+            if scanned - self.position > self.max_header_size:
+                raise ValueError(f"Message header exceeds {self.max_header_size} bytes")
+            chunk = self.sock.recv(self.recv_size)
+            if not chunk:
+                if scanned > self.position and self.buffer[self.position:].strip():
+                    raise ConnectionError("Socket closed in the middle of a message")
+                return None
+            self.buffer += chunk
+
+    def _read_payload(self, info: Dict[str, Any]) -> np.ndarray:
+        dtype, shape, nbytes = _payload_spec(info)
+        array = np.empty(shape, dtype=dtype)
+        view = memoryview(array).cast('B')
+
+        # Drain whatever part of the payload was already buffered with the header
+        received = min(len(self.buffer) - self.position, nbytes)
+        view[:received] = self.buffer[self.position:self.position + received]
+        self._consume(received)
+
+        while received < nbytes:
+            count = self.sock.recv_into(view[received:], nbytes - received)
+            if count == 0:
+                raise ConnectionError("Socket closed while receiving message payload")
+            received += count
+        return array
+
+def write_message(writer: asyncio.StreamWriter, message: Message, header: Optional[bytes] = None,
+                  metrics: Optional[MetricsRegistry] = None):
+    """Queue ``message`` on an asyncio stream; await ``writer.drain()`` to apply backpressure.
+
+    ``header`` may be passed pre-encoded, e.g. when it was built off the event loop.
+    """
+    start = time.perf_counter()
+    if header is None:
+        header = encode_header(message)
+    payload = _payload_bytes(message) if message.payload is not None else b''
+    if metrics is not None:
+        metrics.message_sent(message.type, len(header) + len(payload), time.perf_counter() - start)
+    writer.write(header)
+    if len(payload):
+        writer.write(payload)
+
+def _decode_header(line: bytes) -> Message:
+    return Message.from_json(line.decode())
+
+class AsyncMessageReader:
+    """asyncio counterpart of ``MessageReader`` over a ``StreamReader``.
+
+    Very large JSON headers are decoded in ``executor`` so they do not stall
+    the event loop. ``progress``, if set, is called whenever payload bytes
+    arrive, so a peer streaming a large payload can be told apart from a
+    silent one before the whole message is in.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, executor: Optional[Executor] = None,
+                 progress: Optional[Callable[[], None]] = None, metrics: Optional[MetricsRegistry] = None):
+        self.reader = reader
+        self.executor = executor
+        self.progress = progress
+        self.metrics = metrics
+
+    async def _read_payload_bytes(self, nbytes: int):
+        if self.progress is None:
+            return await self.reader.readexactly(nbytes)
+        data = bytearray(nbytes)
+        view = memoryview(data)
+        received = 0
+        while received < nbytes:
+            chunk = await self.reader.read(min(nbytes - received, PAYLOAD_READ_SIZE))
+            if not chunk:
+                raise ConnectionError("Connection closed while receiving message payload")
+            view[received:received + len(chunk)] = chunk
+            received += len(chunk)
+            self.progress()
+        return data
+
+    async def read_message(self) -> Optional[Message]:
+        while True:
+            try:
+                line = await self.reader.readuntil(b'\n')
+            except asyncio.IncompleteReadError as e:
+                if e.partial.strip():
+                    raise ConnectionError("Connection closed in the middle of a message")
+                return None
+            except asyncio.LimitOverrunError:
+                raise ValueError("Message header exceeds the stream limit")
+            if line.strip():
+                break
+
+        # Deserialization time leaves out the wait for payload bytes
+        start = time.perf_counter()
+        if len(line) > LARGE_HEADER_SIZE and self.executor is not None:
+            loop = asyncio.get_running_loop()
+            message = await loop.run_in_executor(self.executor, _decode_header, line)
+        else:
+            message = _decode_header(line)
+        elapsed = time.perf_counter() - start
+
+        info = message.payload_info
+        if info is not None and "codec" in info:
+            dtype, shape, _ = _payload_spec(info)
+            data = await self._read_payload_bytes(info["wireBytes"])
+            start = time.perf_counter()
+            if len(data) > LARGE_HEADER_SIZE and self.executor is not None:
+                loop = asyncio.get_running_loop()
+                message.payload = await loop.run_in_executor(self.executor, _decode_payload,
+                                                             message, data, dtype, shape)
+            else:
+                message.payload = _decode_payload(message, data, dtype, shape)
+            elapsed += time.perf_counter() - start
+        elif info is not None:
+            dtype, shape, nbytes = _payload_spec(info)
+            data = await self._read_payload_bytes(nbytes)
+            message.payload = np.frombuffer(data, dtype=dtype).reshape(shape)
+        if self.metrics is not None:
+            self.metrics.message_received(message.type, len(line) + message.wire_nbytes(), elapsed)
+        return message
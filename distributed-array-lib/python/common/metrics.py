@@ -0,0 +1,192 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# Histograms count microseconds in log-linear buckets, as HdrHistogram does:
+# values below 2**SUB_BUCKET_BITS get a bucket each, and every power of two
+# above is split into 2**(SUB_BUCKET_BITS - 1) buckets, so a reported value
+# is within 1 / 2**(SUB_BUCKET_BITS - 1) (about 1.6%) of the recorded one
+SUB_BUCKET_BITS = 7
+_HALF = 1 << (SUB_BUCKET_BITS - 1)
+
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+def _bucket_high(index: int) -> int:
+    # Highest value that falls in bucket ``index``
+    if index < 2 * _HALF:
+        return index
+    shift = index // _HALF - 1
+    return ((index - shift * _HALF + 1) << shift) - 1
+
+class Histogram:
+    """Latency histogram with bounded relative error and sparse buckets.
+
+    Snapshots carry the buckets, so histograms from several nodes merge
+    exactly and percentiles can be taken over the whole cluster.
+    """
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max = 0
+
+    def record(self, seconds: float):
+        # On every message's path, so kept to plain integer arithmetic
+        micros = int(seconds * 1e6)
+        if micros < 0:
+            micros = 0
+        # Top SUB_BUCKET_BITS bits of the value, offset by its magnitude
+        shift = micros.bit_length() - SUB_BUCKET_BITS
+        index = micros if shift <= 0 else shift * _HALF + (micros >> shift)
+        counts = self.counts
+        counts[index] = counts.get(index, 0) + 1
+        self.count += 1
+        self.total += micros
+        if micros > self.max:
+            self.max = micros
+        if self.min is None or micros < self.min:
+            self.min = micros
+
+    def merge(self, other: 'Histogram'):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percentile: float) -> float:
+        """Seconds below which ``percentile`` percent of the values fall."""
+        if not self.count:
+            return 0.0
+        rank = max(percentile / 100.0 * self.count, 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(_bucket_high(index), self.max) / 1e6
+        return self.max / 1e6
+
+    def snapshot(self) -> Dict[str, Any]:
+        snapshot = {
+            "count": self.count,
+            "sum": self.total / 1e6,
+            "min": (self.min or 0) / 1e6,
+            "max": self.max / 1e6,
+        }
+        for percentile in PERCENTILES:
+            snapshot[f"p{percentile:g}"] = self.percentile(percentile)
+        snapshot["buckets"] = sorted(self.counts.items())
+        return snapshot
+
+    @staticmethod
+    def from_snapshot(snapshot: Dict[str, Any]) -> 'Histogram':
+        histogram = Histogram()
+        for index, count in snapshot["buckets"]:
+            histogram.counts[index] = histogram.counts.get(index, 0) + count
+        histogram.count = snapshot["count"]
+        histogram.total = int(round(snapshot["sum"] * 1e6))
+        histogram.min = int(round(snapshot["min"] * 1e6)) if snapshot["count"] else None
+        histogram.max = int(round(snapshot["max"] * 1e6))
+        return histogram
+
+class MetricsRegistry:
+    """Counters, gauges and latency histograms of one node.
+
+    Names are dotted and end in what they are about, e.g.
+    ``bytes.sent.SEGMENT_RESULT`` or ``compute.example1``. Counters and
+    histograms may be updated from any thread. Gauges are functions sampled
+    when a snapshot is taken, so they cost nothing in between.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self.started = time.time()
+
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, seconds: float):
+        with self.lock:
+            self._histogram(name).record(seconds)
+
+    def _histogram(self, name: str) -> Histogram:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return histogram
+
+    def gauge(self, name: str, sample: Callable[[], float]):
+        self.gauges[name] = sample
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def message_sent(self, message_type: str, nbytes: int, seconds: float):
+        self._message("sent", "serialize", message_type, nbytes, seconds)
+
+    def message_received(self, message_type: str, nbytes: int, seconds: float):
+        self._message("received", "deserialize", message_type, nbytes, seconds)
+
+    def _message(self, direction: str, stage: str, message_type: str, nbytes: int, seconds: float):
+        messages, size = f"messages.{direction}.{message_type}", f"bytes.{direction}.{message_type}"
+        with self.lock:
+            counters = self.counters
+            counters[messages] = counters.get(messages, 0) + 1
+            counters[size] = counters.get(size, 0) + nbytes
+            self._histogram(f"{stage}.{message_type}").record(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        # Gauges are sampled outside the lock: they may take locks of their own
+        gauges = {name: sample() for name, sample in list(self.gauges.items())}
+        with self.lock:
+            return {
+                "uptime": time.time() - self.started,
+                "counters": dict(self.counters),
+                "gauges": gauges,
+                "histograms": {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+            }
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine node snapshots: counters and gauges add up, histograms merge."""
+    counters: Dict[str, int] = {}
+    gauges: Dict[str, float] = {}
+    histograms: Dict[str, Histogram] = {}
+    for snapshot in snapshots:
+        for name, value in snapshot["counters"].items():
+            counters[name] = counters.get(name, 0) + value
+        for name, value in snapshot["gauges"].items():
+            gauges[name] = gauges.get(name, 0) + value
+        for name, histogram in snapshot["histograms"].items():
+            histograms.setdefault(name, Histogram()).merge(Histogram.from_snapshot(histogram))
+    return {
+        "counters": counters,
+        "gauges": gauges,
+        "histograms": {name: histogram.snapshot() for name, histogram in histograms.items()},
+    }
+
+def format_snapshot(snapshot: Dict[str, Any]) -> List[str]:
+    """Lines of a human-readable table of ``snapshot``, in milliseconds."""
+    lines = [f"{'histogram':<40}{'count':>9}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'total s':>10}"]
+    for name, histogram in sorted(snapshot["histograms"].items()):
+        lines.append(f"{name:<40}{histogram['count']:>9}{histogram['p50'] * 1e3:>10.3f}"
+                     f"{histogram['p99'] * 1e3:>10.3f}{histogram['max'] * 1e3:>10.3f}{histogram['sum']:>10.3f}")
+    lines.append(f"{'counter':<40}{'value':>9}")
+    for name, value in sorted(snapshot["counters"].items()):
+        lines.append(f"{name:<40}{value:>9}")
+    for name, value in sorted(snapshot["gauges"].items()):
+        lines.append(f"{name:<40}{value:>9g}")
+    return lines
@@ -0,0 +1,112 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from common.darray import Segment
+
+MB = 1024 * 1024
+
+class PlacementError(Exception):
+    """Raised when the cluster cannot hold an array with the requested replication."""
+
+@dataclass
+class WorkerCapacity:
+    worker_id: str
+    cores: int
+    free_bytes: int
+    # Most primary partitions of one array the worker can hold; None for no limit
+    max_partitions: Optional[int] = None
+
+def proportional_shares(total: int, weights: List[float], limits: List[int]) -> List[int]:
+    """Split ``total`` in proportion to ``weights`` without exceeding ``limits``.
+
+    Capacity a capped worker cannot take is redistributed among the others
+    (water-filling). Raises ``PlacementError`` if the limits sum to less than
+    ``total``.
+    """
+    if sum(limits) < total:
+        raise PlacementError(f"{total} elements do not fit in the cluster's free memory")
+
+    shares = [0] * len(weights)
+    open_workers = [i for i in range(len(weights)) if limits[i] > 0]
+    remaining = total
+    while remaining > 0 and open_workers:
+        weight_sum = sum(weights[i] for i in open_workers)
+        capped = [i for i in open_workers if remaining * weights[i] / weight_sum >= limits[i] - shares[i]]
+        if capped:
+            for i in capped:
+                remaining -= limits[i] - shares[i]
+                shares[i] = limits[i]
+            open_workers = [i for i in open_workers if i not in capped]
+            continue
+
+        # Nobody is capped: hand out the rest proportionally, then the rounding leftovers
+        given = [int(remaining * weights[i] / weight_sum) for i in open_workers]
+        for i, amount in zip(open_workers, given):
+            shares[i] += amount
+        leftover = remaining - sum(given)
+        for i in sorted(open_workers, key=lambda i: limits[i] - shares[i], reverse=True)[:leftover]:
+            shares[i] += 1
+        remaining = 0
+    return shares
+
+def plan_placement(total_size: int, itemsize: int, workers: List[WorkerCapacity],
+                   partitions_per_core: int = 2, replication_factor: int = 2) -> List[Segment]:
+    """Lay out an array over ``workers`` by capacity.
+
+    Each worker's primary share is proportional to its cores and is split
+    into ``cores * partitions_per_core`` partitions, so every core has work
+    and finishes at about the same time, but into no more than the worker's
+    ``max_partitions``. Primaries use at most
+    ``1 / replication_factor`` of a worker's free memory, leaving room for
+    replicas, which go to the distinct workers with the lowest share of
+    their memory in use. Segments are returned in array order.
+    """
+    if not workers:
+        raise PlacementError("No workers available for distribution")
+    if total_size == 0:
+        return []
+
+    copies = min(replication_factor, len(workers))
+    weights = [max(worker.cores, 1) for worker in workers]
+    limits = [worker.free_bytes // (itemsize * copies) for worker in workers]
+    try:
+        shares = proportional_shares(total_size, weights, limits)
+    except PlacementError:
+        needed = total_size * itemsize * copies
+        free = sum(worker.free_bytes for worker in workers)
+        raise PlacementError(f"Array needs {needed // MB} MB with {copies} copies but only "
+                             f"{free // MB} MB are free on {len(workers)} workers")
+
+    # Partition each share, then interleave the workers' partitions in array order
+    queues: Dict[int, List[int]] = {}
+    for i, share in enumerate(shares):
+        count = max(min(weights[i] * partitions_per_core, share), 1) if share else 0
+        if workers[i].max_partitions is not None:
+            count = min(count, workers[i].max_partitions)
+        queues[i] = [share // count + (1 if k < share % count else 0) for k in range(count)]
+
+    used = [0] * len(workers)
+    segments: List[Segment] = []
+    owners: List[int] = []
+    start = 0
+    while any(queues.values()):
+        for i in range(len(workers)):
+            if not queues[i]:
+                continue
+            size = queues[i].pop()
+            segments.append(Segment(workers[i].worker_id, start, start + size, []))
+            owners.append(i)
+            used[i] += size * itemsize
+            start += size
+
+    for segment, primary in zip(segments, owners):
+        nbytes = (segment.end_index - segment.start_index) * itemsize
+        candidates = [i for i in range(len(workers))
+                      if i != primary and used[i] + nbytes <= workers[i].free_bytes]
+        candidates.sort(key=lambda i: used[i] / max(workers[i].free_bytes, 1))
+        if len(candidates) < copies - 1:
+            raise PlacementError(f"No room for {copies - 1} replicas of segment {segment.start_index}")
+        for i in candidates[:copies - 1]:
+            segment.replicas.append(workers[i].worker_id)
+            used[i] += nbytes
+    return segments
@@ -0,0 +1,240 @@
+import numpy as np
+from concurrent.futures import Executor
+from typing import Any, Dict, List, Optional, Sequence
+
+from common import kernels
+from common.kernels import BLOCK_SIZE, MIN_PARALLEL_ELEMENTS
+
+# Actions that end a plan and decide what each worker returns: ``collect``
+# returns the surviving elements, the others a small partial aggregate that
+# ``combine`` merges and ``finalize`` turns into the answer.
+ACTIONS = ("collect", "sum", "count", "min", "max", "mean", "histogram")
+
+# Partials for these are [count, value] so empty segments can be told apart
+_COUNTED_ACTIONS = ("min", "max", "mean")
+
+def map_step(fn, operand=None) -> Dict[str, Any]:
+    """Describe an elementwise step: a registered kernel name or a NumPy ufunc.
+
+    Binary ufuncs take a scalar ``operand``, e.g. ``map_step(np.multiply, 2.0)``.
+    """
+    return _step("map", fn, operand)
+
+def filter_step(fn, operand=None) -> Dict[str, Any]:
+    """Describe a filter: a ufunc returning booleans, e.g. ``filter_step(np.greater, 0.5)``."""
+    return _step("filter", fn, operand)
+
+def _step(op: str, fn, operand) -> Dict[str, Any]:
+    if isinstance(fn, kernels.Kernel):
+        return {"op": op, "kernel": fn.name}
+    if isinstance(fn, np.ufunc):
+        step = {"op": op, "ufunc": fn.__name__}
+    elif isinstance(fn, str) and fn in kernels.KERNELS:
+        return {"op": op, "kernel": fn}
+    elif isinstance(fn, str):
+        step = {"op": op, "ufunc": fn}
+    else:
+        raise ValueError(f"Plan steps must be kernels or NumPy ufuncs, got {fn!r}")
+    if operand is not None:
+        step["operand"] = operand
+    return step
+
+class Step:
+    """One compiled plan step with its per-block output buffer."""
+
+    def __init__(self, spec: Dict[str, Any], input_dtype: np.dtype):
+        self.spec = spec
+        self.op = spec["op"]
+        self.input_dtype = np.dtype(input_dtype)
+        self.kernel: Optional[kernels.Kernel] = None
+        self.ufunc: Optional[np.ufunc] = None
+        self.operands = ()
+
+        if self.op not in ("map", "filter"):
+            raise ValueError(f"Unknown plan step: {self.op}")
+
+        if "kernel" in spec:
+            self.kernel = kernels.KERNELS.get(spec["kernel"])
+            if self.kernel is None or self.op != "map":
+                raise ValueError(f"Unknown map kernel: {spec['kernel']}")
+            self.output_dtype = self.kernel.output_dtype
+        else:
+            self.ufunc = getattr(np, spec.get("ufunc", ""), None)
+            if not isinstance(self.ufunc, np.ufunc) or self.ufunc.nout != 1:
+                raise ValueError(f"Unknown ufunc: {spec.get('ufunc')}")
+            if "operand" in spec:
+                self.operands = (spec["operand"],)
+            if self.ufunc.nin != 1 + len(self.operands):
+                raise ValueError(f"{self.ufunc.__name__} takes {self.ufunc.nin} inputs")
+            with np.errstate(all='ignore'):
+                self.output_dtype = self.ufunc(np.ones(1, dtype=self.input_dtype), *self.operands).dtype
+
+        if self.op == "filter" and self.output_dtype != np.bool_:
+            raise ValueError(f"Filter {spec} does not produce booleans")
+
+    def buffers(self, size: int) -> List[np.ndarray]:
+        """Allocate the reusable buffers one thread needs for blocks of ``size``."""
+        if self.kernel is not None:
+            scratch = self.kernel.make_scratch(size)
+            cast = np.empty(size, dtype=self.kernel.input_dtype)
+            return [np.empty(size, dtype=self.output_dtype), cast] + scratch
+        if self.op == "filter":
+            return [np.empty(size, dtype=bool), np.empty(size, dtype=self.input_dtype)]
+        return [np.empty(size, dtype=self.output_dtype)]
+
+    def apply(self, x: np.ndarray, buffers: List[np.ndarray]) -> np.ndarray:
+        n = len(x)
+        if self.kernel is not None:
+            out, cast = buffers[0][:n], buffers[1][:n]
+            if x.dtype != self.kernel.input_dtype:
+                np.copyto(cast, x, casting='unsafe')
+                x = cast
+            self.kernel.block_fn(x, out, [buf[:n] for buf in buffers[2:]])
+            return out
+        if self.op == "map":
+            return self.ufunc(x, *self.operands, out=buffers[0][:n])
+
+        mask = self.ufunc(x, *self.operands, out=buffers[0][:n])
+        kept = np.count_nonzero(mask)
+        return np.compress(mask, x, out=buffers[1][:kept])
+
+class Plan:
+    """A chain of elementwise steps ending in an action, run in one pass.
+
+    Steps are fused: each block of ``BLOCK_SIZE`` input elements goes through
+    every step while it is still in cache, using buffers allocated once per
+    thread, and is then folded into the action's output. Only the action's
+    result is ever materialized at segment size.
+    """
+
+    def __init__(self, steps: Sequence[Dict[str, Any]], action: str, input_dtype,
+                 bins: int = 10, hist_range: Optional[Sequence[float]] = None):
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown plan action: {action}")
+        if action == "histogram" and (hist_range is None or len(hist_range) != 2
+                                      or not hist_range[0] < hist_range[1] or bins < 1):
+            # Fixed edges are what make per-segment histograms addable
+            raise ValueError("histogram needs bins >= 1 and a range [low, high]")
+        self.action = action
+        self.bins = int(bins)
+        self.range = (float(hist_range[0]), float(hist_range[1])) if hist_range is not None else None
+        self.input_dtype = np.dtype(input_dtype)
+        self.steps: List[Step] = []
+        dtype = self.input_dtype
+        for spec in steps:
+            step = Step(spec, dtype)
+            self.steps.append(step)
+            if step.op == "map":
+                dtype = step.output_dtype
+        self.output_dtype = dtype
+
+    @staticmethod
+    def from_dict(spec: Dict[str, Any], input_dtype) -> 'Plan':
+        return Plan(spec.get("steps", []), spec["action"], input_dtype,
+                    spec.get("bins", 10), spec.get("range"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        spec = {"steps": [step.spec for step in self.steps], "action": self.action}
+        if self.action == "histogram":
+            spec["bins"] = self.bins
+            spec["range"] = list(self.range)
+        return spec
+
+    def modules(self) -> List[str]:
+        """Modules that register the kernels this plan uses."""
+        return sorted({step.kernel.module for step in self.steps if step.kernel is not None})
+
+    def result_dtype(self) -> np.dtype:
+        if self.action in ("count", "histogram"):
+            return np.dtype(np.int64)
+        if self.action == "mean":
+            return np.dtype(np.float64)
+        if self.action in ("sum", "min", "max"):
+            return np.dtype(np.float64) if self.output_dtype.kind in 'fc' else np.dtype(np.int64)
+        return self.output_dtype
+
+    def run_range(self, segment: np.ndarray, start: int, end: int) -> np.ndarray:
+        """Return this plan's partial result over ``segment[start:end]``."""
+        size = min(BLOCK_SIZE, max(end - start, 1))
+        buffers = [step.buffers(size) for step in self.steps]
+        result_dtype = self.result_dtype()
+        if self.action == "collect":
+            out = np.empty(end - start, dtype=result_dtype)
+        elif self.action == "histogram":
+            out = np.zeros(self.bins, dtype=result_dtype)
+        total = result_dtype.type(0)
+        count = 0
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for block_start in range(start, end, BLOCK_SIZE):
+                x = segment[block_start:min(block_start + BLOCK_SIZE, end)]
+                for step, step_buffers in zip(self.steps, buffers):
+                    x = step.apply(x, step_buffers)
+                if len(x) == 0:
+                    continue
+
+                if self.action == "collect":
+                    out[count:count + len(x)] = x
+                elif self.action in ("sum", "mean"):
+                    total += np.add.reduce(x, dtype=result_dtype)
+                elif self.action == "min":
+                    value = result_dtype.type(np.min(x))
+                    total = value if count == 0 else min(total, value)
+                elif self.action == "max":
+                    value = result_dtype.type(np.max(x))
+                    total = value if count == 0 else max(total, value)
+                elif self.action == "histogram":
+                    out += np.histogram(x, bins=self.bins, range=self.range)[0]
+                count += len(x)
+
+        if self.action == "collect":
+            return out[:count]
+        if self.action == "histogram":
+            return out
+        if self.action == "count":
+            return np.array([count], dtype=result_dtype)
+        if self.action in _COUNTED_ACTIONS:
+            return np.array([count, total], dtype=result_dtype)
+        return np.array([total], dtype=result_dtype)
+
+    def __call__(self, segment: np.ndarray, executor: Optional[Executor] = None,
+                 num_threads: int = 1) -> np.ndarray:
+        num_threads = min(num_threads, len(segment) // MIN_PARALLEL_ELEMENTS)
+        if executor is None or num_threads < 2:
+            return self.run_range(segment, 0, len(segment))
+
+        # As in Kernel.__call__, the caller runs the first range itself
+        bounds = np.linspace(0, len(segment), num_threads + 1).astype(int)
+        futures = [executor.submit(self.run_range, segment, bounds[i], bounds[i + 1])
+                   for i in range(1, num_threads)]
+        partials = [self.run_range(segment, bounds[0], bounds[1])]
+        partials += [future.result() for future in futures]
+        return combine(self.action, partials)
+
+def combine(action: str, partials: Sequence[np.ndarray]) -> np.ndarray:
+    """Merge partial results given in segment order.
+
+    Aggregate partials merge associatively, so partially combined results can
+    be combined again; only ``collect`` depends on the order.
+    """
+    if action == "collect":
+        return np.concatenate(partials) if partials else np.empty(0)
+    if action in ("min", "max"):
+        present = [partial for partial in partials if partial[0] > 0]
+        if not present:
+            return partials[0]
+        reduce = np.min if action == "min" else np.max
+        values = np.array([partial[1] for partial in present], dtype=present[0].dtype)
+        return np.array([sum(partial[0] for partial in present), reduce(values)], dtype=present[0].dtype)
+    return np.sum(np.stack(partials), axis=0)
+
+def finalize(action: str, result: np.ndarray):
+    """Turn a combined aggregate into the value returned to the client."""
+    if action in _COUNTED_ACTIONS:
+        count, value = result.tolist()
+        if count == 0:
+            return None
+        return value / count if action == "mean" else value
+    if action == "histogram":
+        return result.tolist()
+    return result.tolist()[0]
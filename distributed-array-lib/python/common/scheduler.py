@@ -0,0 +1,282 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+TaskKey = Tuple[str, int]
+
+@dataclass
+class Task:
+    """One partition of a job: ``holders`` are the workers with its data, primary first."""
+    job_id: str
+    segment_id: int
+    holders: List[str]
+    spec: Dict[str, Any]
+    size: int = 1
+    worker_id: Optional[str] = None
+    started_at: float = 0.0
+    stolen: bool = False
+    speculative: bool = False
+    excluded: set = field(default_factory=set)
+
+    @property
+    def key(self) -> TaskKey:
+        return (self.job_id, self.segment_id)
+
+class TaskScheduler:
+    """Master-side queue that hands partitions to workers as they free up.
+
+    Every worker has ``slots`` concurrent tasks (its cores). A free slot is
+    filled with a queued partition the worker holds as primary; failing
+    that, with one it holds a replica of, i.e. stolen from a primary that is
+    still busy. Queued tasks are served in submission order, so earlier
+    jobs finish first. The scheduler does no I/O; the master sends whatever
+    ``assignments`` and ``speculate`` return.
+
+    With speculation, a running task that takes longer than
+    ``speculation_multiplier`` times the ``speculation_percentile`` of its
+    job's completed tasks (per element) gets a backup copy on another
+    holder with a free slot. The first copy to complete wins and
+    ``complete`` returns the other one to be cancelled.
+
+    A task whose holders have all failed it or are gone can never run;
+    ``fail`` and ``remove_worker`` drop its job from the queue and return
+    it, for the caller to fail the job.
+    """
+
+    def __init__(self, work_stealing: bool = True, speculation: bool = True,
+                 speculation_percentile: float = 75.0, speculation_multiplier: float = 1.5,
+                 speculation_quorum: float = 0.5, min_speculation_delay: float = 0.05,
+                 clock: Callable[[], float] = time.time):
+        self.work_stealing = work_stealing
+        self.speculation = speculation
+        self.speculation_percentile = speculation_percentile
+        self.speculation_multiplier = speculation_multiplier
+        # Fraction of a job's tasks that must be done before its runtimes are trusted
+        self.speculation_quorum = speculation_quorum
+        self.min_speculation_delay = min_speculation_delay
+        self.clock = clock
+
+        self.queue: "OrderedDict[TaskKey, Task]" = OrderedDict()
+        self.running: Dict[TaskKey, Task] = {}
+        self.backups: Dict[TaskKey, Task] = {}
+        self.slots: Dict[str, int] = {}
+        self.inflight: Dict[str, int] = {}
+        # Seconds per element of each job's completed tasks, and its task count
+        self.rates: Dict[str, List[float]] = {}
+        # The speculation percentile of each job's rates, once it has a quorum;
+        # updated as tasks complete rather than on every speculation check
+        self.typical_rates: Dict[str, float] = {}
+        self.job_tasks: Dict[str, int] = {}
+        self.remaining: Dict[str, int] = {}
+
+        self.stolen_count = 0
+        self.speculated_count = 0
+        self.speculation_wins = 0
+
+    def add_worker(self, worker_id: str, slots: int):
+        self.slots[worker_id] = max(slots, 1)
+        self.inflight.setdefault(worker_id, 0)
+
+    def remove_worker(self, worker_id: str) -> List[Task]:
+        """Forget a failed worker and requeue the tasks it was running.
+
+        Returns one task per job left with a partition no worker can run.
+        """
+        self.slots.pop(worker_id, None)
+        self.inflight.pop(worker_id, None)
+        for key, backup in list(self.backups.items()):
+            if backup.worker_id == worker_id:
+                del self.backups[key]
+        for key, task in list(self.running.items()):
+            if task.worker_id != worker_id:
+                continue
+            backup = self.backups.pop(key, None)
+            if backup is not None:
+                # The backup copy is already running; it becomes the task
+                self.running[key] = backup
+            else:
+                self._requeue(task)
+        for task in self.queue.values():
+            if worker_id in task.holders:
+                task.holders.remove(worker_id)
+        return self._abandon([task for task in self.queue.values() if not self._eligible(task)])
+
+    def submit(self, tasks: List[Task]):
+        for task in tasks:
+            self.queue[task.key] = task
+            self.job_tasks[task.job_id] = self.job_tasks.get(task.job_id, 0) + 1
+            self.remaining[task.job_id] = self.remaining.get(task.job_id, 0) + 1
+
+    def cancel_job(self, job_id: str):
+        for key in [key for key in self.queue if key[0] == job_id]:
+            del self.queue[key]
+        self._forget_job(job_id)
+
+    def complete(self, job_id: str, segment_id: int,
+                 worker_id: Optional[str] = None) -> Tuple[Optional[Task], List[Task]]:
+        """Mark a task done by ``worker_id``.
+
+        Returns the copy that finished (None if the task was not running, or
+        not on ``worker_id``) and any other copies still running, which the
+        caller should cancel.
+        """
+        key = (job_id, segment_id)
+        attempts = [task for task in (self.running.get(key), self.backups.get(key)) if task is not None]
+        winner = next((task for task in attempts if worker_id is None or task.worker_id == worker_id), None)
+        if winner is None:
+            return None, []
+        self.running.pop(key, None)
+        self.backups.pop(key, None)
+        for task in attempts:
+            self._release(task)
+
+        if winner.speculative:
+            self.speculation_wins += 1
+        rates = self.rates.setdefault(job_id, [])
+        rates.append((self.clock() - winner.started_at) / max(winner.size, 1))
+        if self.speculation and len(rates) >= self.speculation_quorum * self.job_tasks.get(job_id, 0):
+            self.typical_rates[job_id] = float(np.percentile(rates, self.speculation_percentile))
+        if job_id in self.remaining:
+            self.remaining[job_id] -= 1
+            if self.remaining[job_id] <= 0:
+                self._forget_job(job_id)
+        return winner, [task for task in attempts if task is not winner]
+
+    def running_on(self, worker_id: str) -> List[Task]:
+        """Copies ``worker_id`` is running, earliest started first."""
+        tasks = [task for task in list(self.running.values()) + list(self.backups.values())
+                 if task.worker_id == worker_id]
+        return sorted(tasks, key=lambda task: task.started_at)
+
+    def fail(self, job_id: str, segment_id: int, worker_id: str) -> Optional[Task]:
+        """Requeue a task its worker could not run; it will not go back there.
+
+        Returns the task if no other holder can run it either.
+        """
+        key = (job_id, segment_id)
+        running, backup = self.running.get(key), self.backups.get(key)
+        if running is not None and backup is not None:
+            # The other copy carries on alone
+            if backup.worker_id == worker_id:
+                self._release(self.backups.pop(key))
+            elif running.worker_id == worker_id:
+                self._release(running)
+                self.running[key] = self.backups.pop(key)
+            return None
+
+        task = self.running.get(key)
+        if task is not None and task.worker_id == worker_id:
+            del self.running[key]
+            self._release(task)
+            task.excluded.add(worker_id)
+            if not self._eligible(task):
+                self._abandon([task])
+                return task
+            self._requeue(task)
+        return None
+
+    def _eligible(self, task: Task) -> List[str]:
+        # Holders still alive that have not failed the task
+        return [holder for holder in task.holders if holder not in task.excluded and holder in self.slots]
+
+    def _abandon(self, tasks: List[Task]) -> List[Task]:
+        abandoned = {}
+        for task in tasks:
+            abandoned.setdefault(task.job_id, task)
+        for job_id in abandoned:
+            self.cancel_job(job_id)
+        return list(abandoned.values())
+
+    def _release(self, task: Task):
+        if task.worker_id in self.inflight:
+            self.inflight[task.worker_id] -= 1
+
+    def _forget_job(self, job_id: str):
+        self.rates.pop(job_id, None)
+        self.typical_rates.pop(job_id, None)
+        self.job_tasks.pop(job_id, None)
+        self.remaining.pop(job_id, None)
+
+    def _requeue(self, task: Task):
+        # Retries go to the front so a job is not starved by later ones
+        self.running.pop(task.key, None)
+        task.worker_id = None
+        task.stolen = False
+        self.queue[task.key] = task
+        self.queue.move_to_end(task.key, last=False)
+
+    def _free(self, worker_id: str) -> bool:
+        return worker_id in self.slots and self.inflight[worker_id] < self.slots[worker_id]
+
+    def _take(self, worker_id: str, steal: bool) -> Optional[Task]:
+        for key, task in self.queue.items():
+            if worker_id in task.excluded or worker_id not in task.holders:
+                continue
+            # The first live holder that has not failed the task owns it; the others steal
+            owner = self._eligible(task)[0]
+            holds = owner != worker_id if steal else owner == worker_id
+            if holds:
+                del self.queue[key]
+                task.worker_id = worker_id
+                task.started_at = self.clock()
+                task.stolen = steal
+                self.running[key] = task
+                self.inflight[worker_id] += 1
+                if steal:
+                    self.stolen_count += 1
+                return task
+        return None
+
+    def assignments(self) -> List[Task]:
+        """Fill free slots: primaries take their own partitions first, then idle
+        replica holders steal what is left."""
+        assigned = []
+        for steal in ((False, True) if self.work_stealing else (False,)):
+            progress = True
+            while progress and self.queue:
+                # One task per worker per round keeps the assignment fair
+                progress = False
+                for worker_id in self.slots:
+                    if not self._free(worker_id):
+                        continue
+                    task = self._take(worker_id, steal)
+                    if task is not None:
+                        assigned.append(task)
+                        progress = True
+        return assigned
+
+    def speculation_threshold(self, task: Task) -> Optional[float]:
+        """Seconds after which ``task`` counts as a straggler, or None while
+        too few tasks of its job have completed to tell."""
+        rate = self.typical_rates.get(task.job_id)
+        if rate is None:
+            return None
+        typical = rate * max(task.size, 1)
+        return max(self.speculation_multiplier * typical, self.min_speculation_delay)
+
+    def speculate(self) -> List[Task]:
+        """Start backup copies of straggling tasks on holders with a free slot."""
+        if not self.speculation:
+            return []
+        now = self.clock()
+        started = []
+        for key, task in self.running.items():
+            if key in self.backups:
+                continue
+            threshold = self.speculation_threshold(task)
+            if threshold is None or now - task.started_at < threshold:
+                continue
+            for worker_id in task.holders:
+                if worker_id == task.worker_id or worker_id in task.excluded or not self._free(worker_id):
+                    continue
+                backup = replace(task, worker_id=worker_id, started_at=now, stolen=False,
+                                 speculative=True, excluded=set(task.excluded))
+                self.backups[key] = backup
+                self.inflight[worker_id] += 1
+                self.speculated_count += 1
+                started.append(backup)
+                break
+        return started
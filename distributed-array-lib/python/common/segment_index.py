@@ -0,0 +1,142 @@
+import heapq
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from common.darray import Segment
+
+SegmentKey = Tuple[str, int]
+
+class SegmentIndex:
+    """Master-side record of which workers hold which segments.
+
+    ``segments`` maps ``(array_id, segment_id)`` to the array's own
+    ``Segment``, whose ``worker_id`` and ``replicas`` are its holders;
+    ``by_worker`` is the reverse, every segment a worker holds as primary
+    or replica. A worker failure therefore visits only the segments that
+    worker held, however many the cluster stores.
+
+    ``load`` is the bytes each worker holds. A min-heap of ``(load,
+    worker_id)`` picks the least loaded worker for a new replica; entries
+    go stale when a load changes and are skipped when popped, and the heap
+    is rebuilt once they outnumber the live ones.
+
+    All changes to ``Segment.worker_id`` and ``Segment.replicas`` after
+    placement must go through the index to keep both directions in step.
+    """
+
+    def __init__(self):
+        self.segments: Dict[SegmentKey, Segment] = {}
+        self.nbytes: Dict[SegmentKey, int] = {}
+        self.by_worker: Dict[str, Set[SegmentKey]] = {}
+        self.load: Dict[str, int] = {}
+        self.heap: List[Tuple[int, str]] = []
+
+    def add_worker(self, worker_id: str):
+        self.by_worker.setdefault(worker_id, set())
+        self.load.setdefault(worker_id, 0)
+        self._push(worker_id)
+
+    def add_array(self, array_id: str, segments: Iterable[Segment], itemsize: int):
+        touched = set()
+        for segment in segments:
+            key = (array_id, segment.start_index)
+            self.segments[key] = segment
+            self.nbytes[key] = (segment.end_index - segment.start_index) * itemsize
+            for worker_id in [segment.worker_id] + segment.replicas:
+                self._hold(key, worker_id)
+                touched.add(worker_id)
+        for worker_id in touched:
+            self._push(worker_id)
+
+    def remove_array(self, array_id: str, segments: Iterable[Segment]):
+        touched = set()
+        for segment in segments:
+            key = (array_id, segment.start_index)
+            if self.segments.pop(key, None) is None:
+                continue
+            nbytes = self.nbytes.pop(key)
+            for worker_id in [segment.worker_id] + segment.replicas:
+                if key in self.by_worker.get(worker_id, ()):
+                    self.by_worker[worker_id].discard(key)
+                    self.load[worker_id] -= nbytes
+                    touched.add(worker_id)
+        for worker_id in touched:
+            self._push(worker_id)
+
+    def _push(self, worker_id: str):
+        if len(self.heap) > 2 * len(self.load) + 16:
+            self.heap = [(load, worker) for worker, load in self.load.items()]
+            heapq.heapify(self.heap)
+        else:
+            heapq.heappush(self.heap, (self.load[worker_id], worker_id))
+
+    def _hold(self, key: SegmentKey, worker_id: str):
+        self.by_worker.setdefault(worker_id, set()).add(key)
+        self.load[worker_id] = self.load.get(worker_id, 0) + self.nbytes[key]
+
+    def segment(self, array_id: str, segment_id: int) -> Optional[Segment]:
+        return self.segments.get((array_id, segment_id))
+
+    def holders(self, array_id: str, segment_id: int) -> List[str]:
+        segment = self.segments[(array_id, segment_id)]
+        return [segment.worker_id] + segment.replicas
+
+    def segments_of(self, worker_id: str) -> Set[SegmentKey]:
+        return self.by_worker.get(worker_id, set())
+
+    def remove_worker(self, worker_id: str) -> List[SegmentKey]:
+        """Forget ``worker_id`` and return the segments it held.
+
+        It is dropped from the replicas of those segments. Where it was the
+        primary, ``worker_id`` is left in place for the caller to promote a
+        replica with ``promote``.
+        """
+        keys = sorted(self.by_worker.pop(worker_id, set()))
+        self.load.pop(worker_id, None)
+        for key in keys:
+            segment = self.segments[key]
+            if worker_id in segment.replicas:
+                segment.replicas.remove(worker_id)
+        return keys
+
+    def promote(self, array_id: str, segment_id: int, replica_id: str):
+        segment = self.segments[(array_id, segment_id)]
+        segment.replicas.remove(replica_id)
+        segment.worker_id = replica_id
+
+    def restore(self, array_id: str, segment_id: int, worker_id: str):
+        """Make ``worker_id`` the primary of a segment that has no copy left.
+
+        For a worker that restarts with the segment on disk; ``remove_worker``
+        left the lost primary in place, which this replaces.
+        """
+        key = (array_id, segment_id)
+        self.segments[key].worker_id = worker_id
+        self._hold(key, worker_id)
+        self._push(worker_id)
+
+    def add_replica(self, array_id: str, segment_id: int, worker_id: str):
+        key = (array_id, segment_id)
+        self.segments[key].replicas.append(worker_id)
+        self._hold(key, worker_id)
+        self._push(worker_id)
+
+    def least_loaded(self, exclude: Iterable[str] = (),
+                     eligible: Callable[[str], bool] = lambda worker_id: True) -> Optional[str]:
+        """The worker holding the fewest bytes, other than ``exclude``, or None."""
+        exclude = set(exclude)
+        skipped = []
+        chosen = None
+        while self.heap:
+            load, worker_id = self.heap[0]
+            if self.load.get(worker_id) != load or not eligible(worker_id):
+                # Stale entry, or a worker that is gone; a later change pushes it again
+                heapq.heappop(self.heap)
+                continue
+            if worker_id in exclude:
+                skipped.append(heapq.heappop(self.heap))
+                continue
+            chosen = worker_id
+            break
+        for entry in skipped:
+            heapq.heappush(self.heap, entry)
+        return chosen
@@ -0,0 +1,213 @@
+import itertools
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+
+SegmentKey = Tuple[str, int]
+
+class SegmentStore:
+    """The segments a worker holds, keyed by ``(array_id, segment_id)``.
+
+    A worker can hold any number of primary partitions of the same array
+    next to replicas of other partitions. ``segment_id`` is the segment's
+    start index in the array, as assigned by the master.
+
+    With a ``directory`` and a ``memory_budget`` (bytes), segments in memory
+    are kept within the budget by spilling the least recently used ones to
+    ``np.memmap`` files there, replicas before primaries. A spilled segment
+    stays readable and writable through its memmap; ``lookup`` and ``get``
+    fault it back into memory, since it is about to be processed.
+    ``on_spill`` is called with the keys spilled, outside the lock, so
+    callers can drop copies of their own (e.g. in shared memory).
+    """
+
+    def __init__(self, directory: Optional[str] = None, memory_budget: Optional[int] = None,
+                 on_spill: Optional[Callable[[List[SegmentKey]], None]] = None):
+        self.lock = threading.Lock()
+        self.primaries: Dict[SegmentKey, np.ndarray] = {}
+        self.replicas: Dict[SegmentKey, np.ndarray] = {}
+
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.on_spill = on_spill
+        # Segments in memory and their size, least recently used first
+        self.resident: "OrderedDict[SegmentKey, int]" = OrderedDict()
+        self.resident_bytes = 0
+        # Backing files of spilled segments
+        self.files: Dict[SegmentKey, str] = {}
+        self.file_counter = itertools.count()
+        self.spill_count = 0
+        self.fault_count = 0
+
+    def put(self, array_id: str, segment_id: int, data: np.ndarray, primary: bool = True):
+        key = (array_id, segment_id)
+        with self.lock:
+            # A segment has one copy here, in whichever role it is put last
+            self._discard(key, self.primaries)
+            self._discard(key, self.replicas)
+            (self.primaries if primary else self.replicas)[key] = data
+            self._admit(key, data)
+            spilled = self._evict(key)
+        self._notify(spilled)
+
+    def get(self, array_id: str, segment_id: int, primary: bool = True) -> Optional[np.ndarray]:
+        table = self.primaries if primary else self.replicas
+        key = (array_id, segment_id)
+        with self.lock:
+            if key not in table:
+                return None
+            segment, spilled = self._use(key, table)
+        self._notify(spilled)
+        return segment
+
+    def lookup(self, array_id: str, segment_id: int) -> Optional[np.ndarray]:
+        """Return the segment whether it is held as primary or as replica."""
+        key = (array_id, segment_id)
+        with self.lock:
+            table = self.primaries if key in self.primaries else self.replicas
+            if key not in table:
+                return None
+            segment, spilled = self._use(key, table)
+        self._notify(spilled)
+        return segment
+
+    def write(self, array_id: str, segment_id: int, offset: int, values: np.ndarray,
+              primary: bool = True) -> bool:
+        """Copy ``values`` into a held segment at ``offset``, wherever it lives.
+
+        Writes go through the lock so that a concurrent spill cannot copy the
+        segment away halfway. Returns False if the segment is not held.
+        """
+        table = self.primaries if primary else self.replicas
+        key = (array_id, segment_id)
+        with self.lock:
+            segment = table.get(key)
+            if segment is None:
+                return False
+            segment[offset:offset + len(values)] = values
+            if key in self.resident:
+                self.resident.move_to_end(key)
+            return True
+
+    def replace(self, array_id: str, segment_id: int, data: np.ndarray):
+        """Swap in a relocated copy of a held segment (e.g. moved into shared memory)."""
+        key = (array_id, segment_id)
+        with self.lock:
+            table = self.primaries if key in self.primaries else self.replicas
+            self._discard(key, table)
+            table[key] = data
+            self._admit(key, data)
+            spilled = self._evict(key)
+        self._notify(spilled)
+
+    def primary_ids(self, array_id: str) -> List[int]:
+        with self.lock:
+            return sorted(segment_id for key_array, segment_id in self.primaries if key_array == array_id)
+
+    def promote(self, array_id: str, segment_id: int) -> bool:
+        """Turn a replica into a primary; returns False if there is no such replica."""
+        key = (array_id, segment_id)
+        with self.lock:
+            replica = self.replicas.pop(key, None)
+            if replica is None:
+                return False
+            self.primaries[key] = replica
+            return True
+
+    def demote(self, array_id: str, segment_id: int) -> bool:
+        """Turn a primary into a replica; returns False if there is no such primary."""
+        key = (array_id, segment_id)
+        with self.lock:
+            primary = self.primaries.pop(key, None)
+            if primary is None:
+                return False
+            self.replicas[key] = primary
+            return True
+
+    def remove(self, array_id: str, segment_id: int):
+        key = (array_id, segment_id)
+        with self.lock:
+            self._discard(key, self.primaries)
+            self._discard(key, self.replicas)
+
+    def remove_array(self, array_id: str) -> List[int]:
+        """Drop every segment of ``array_id``; returns their ids."""
+        with self.lock:
+            keys = [key for table in (self.primaries, self.replicas) for key in table if key[0] == array_id]
+            for key in keys:
+                self._discard(key, self.primaries)
+                self._discard(key, self.replicas)
+        return sorted({segment_id for _, segment_id in keys})
+
+    def nbytes(self) -> int:
+        with self.lock:
+            tables = (self.primaries, self.replicas)
+            return sum(array.nbytes for table in tables for array in table.values())
+
+    def close(self):
+        """Delete the spill files; the store must not be used afterwards."""
+        with self.lock:
+            for key in list(self.files):
+                table = self.primaries if key in self.primaries else self.replicas
+                self._discard(key, table)
+
+    def _admit(self, key: SegmentKey, data: np.ndarray):
+        self.resident[key] = data.nbytes
+        self.resident_bytes += data.nbytes
+
+    def _discard(self, key: SegmentKey, table: Dict[SegmentKey, np.ndarray]):
+        if table.pop(key, None) is None:
+            return
+        nbytes = self.resident.pop(key, None)
+        if nbytes is not None:
+            self.resident_bytes -= nbytes
+        path = self.files.pop(key, None)
+        if path is not None:
+            os.remove(path)
+
+    def _use(self, key: SegmentKey, table: Dict[SegmentKey, np.ndarray]):
+        if key in self.resident:
+            self.resident.move_to_end(key)
+            return table[key], []
+
+        # Fault in: read the file back into memory and drop it
+        segment = np.array(table[key])
+        os.remove(self.files.pop(key))
+        table[key] = segment
+        self.fault_count += 1
+        self._admit(key, segment)
+        return segment, self._evict(key)
+
+    def _evict(self, keep: SegmentKey) -> List[SegmentKey]:
+        if self.directory is None or self.memory_budget is None:
+            return []
+        spilled = []
+        while self.resident_bytes > self.memory_budget:
+            candidates = [key for key, nbytes in self.resident.items() if key != keep and nbytes > 0]
+            victim = next((key for key in candidates if key in self.replicas), None)
+            if victim is None and candidates:
+                victim = candidates[0]
+            if victim is None:
+                # Only the segment in use is left; it may exceed the budget alone
+                break
+            self._spill(victim)
+            spilled.append(victim)
+        return spilled
+
+    def _spill(self, key: SegmentKey):
+        table = self.primaries if key in self.primaries else self.replicas
+        segment = table[key]
+        path = os.path.join(self.directory, f"{next(self.file_counter)}.seg")
+        mapped = np.memmap(path, dtype=segment.dtype, mode='w+', shape=segment.shape)
+        mapped[...] = segment
+        mapped.flush()
+        table[key] = mapped
+        self.files[key] = path
+        self.resident_bytes -= self.resident.pop(key)
+        self.spill_count += 1
+
+    def _notify(self, spilled: List[SegmentKey]):
+        if spilled and self.on_spill is not None:
+            self.on_spill(spilled)
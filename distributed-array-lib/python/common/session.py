@@ -0,0 +1,162 @@
+import itertools
+import socket
+import threading
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+from typing import Dict, Any, Iterable, List, Optional
+
+from common.message import Message, MessageReader, send_message
+from common.transport import TcpTransport
+
+class ClientSession:
+    """A long-lived connection to the master that pipelines requests.
+
+    Every request gets a ``requestId`` in the envelope; a reader thread
+    matches responses to the returned futures, so any number of threads can
+    have requests in flight on the same socket. Masters that do not echo
+    request ids answer a single request per connection; the session then
+    falls back to one connection per request, one request at a time.
+    """
+
+    def __init__(self, master_host: str, master_port: int, client_id: str = "client", transport=None):
+        self.master_host = master_host
+        self.master_port = master_port
+        self.client_id = client_id
+        self.transport = transport or TcpTransport()
+        self.lock = threading.Lock()
+        self.sock: Optional[socket.socket] = None
+        self.pending: "OrderedDict[int, Future]" = OrderedDict()
+        self.request_ids = itertools.count(1)
+        self.persistent = True
+
+    def submit(self, msg_type: str, data: Dict[str, Any], payload: Optional[np.ndarray] = None,
+               chunks: Iterable[Message] = (), trace_id: Optional[str] = None) -> Future:
+        """Send a request and return a future for its response.
+
+        ``chunks`` are follow-up messages that belong to the request (e.g. the
+        ARRAY_CHUNKs of a streaming upload); they are written back to back
+        with it so no other request can interleave.
+        """
+        if not self.persistent:
+            wait(list(self.pending.values()))
+
+        future = Future()
+        error = None
+        with self.lock:
+            request_id = None
+            try:
+                if self.sock is None:
+                    self._connect()
+                request_id = next(self.request_ids)
+                self.pending[request_id] = future
+                message = Message(msg_type, self.client_id, "master", data,
+                                  payload=payload, request_id=request_id, trace_id=trace_id)
+                send_message(self.sock, message)
+                for chunk in chunks:
+                    send_message(self.sock, chunk)
+            except OSError as e:
+                self.pending.pop(request_id, None)
+                self._disconnect()
+                error = e
+
+        if error is not None:
+            future.set_exception(error)
+        return future
+
+    def request(self, msg_type: str, data: Dict[str, Any], payload: Optional[np.ndarray] = None,
+                chunks: Iterable[Message] = (), timeout: Optional[float] = None,
+                trace_id: Optional[str] = None) -> Message:
+        return self.submit(msg_type, data, payload, chunks, trace_id).result(timeout)
+
+    def pending_count(self) -> int:
+        return len(self.pending)
+
+    def close(self):
+        with self.lock:
+            self._disconnect()
+
+    def _connect(self):
+        sock = self.transport.connect(self.master_host, self.master_port)
+        self.sock = sock
+        reader_thread = threading.Thread(target=self._read_loop, args=(sock,))
+        reader_thread.daemon = True
+        reader_thread.start()
+
+    def _disconnect(self):
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+            self.sock = None
+
+    def _read_loop(self, sock: socket.socket):
+        reader = MessageReader(sock)
+        detached = False
+        try:
+            while not detached:
+                message = reader.read_message()
+                if message is None:
+                    break
+
+                with self.lock:
+                    if message.request_id is None:
+                        # Legacy master: it answers one request per
+                        # connection, so detach before the next is sent and
+                        # close this one once the reply is handed over
+                        self.persistent = False
+                        request_id = next(iter(self.pending), None)
+                        if self.sock is sock:
+                            self.sock = None
+                        detached = True
+                    else:
+                        request_id = message.request_id
+                    future = self.pending.pop(request_id, None)
+
+                if future is not None:
+                    future.set_result(message)
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self.lock:
+                if self.sock is sock:
+                    self.sock = None
+                # Once detached, pending requests belong to the next connection
+                failed = [] if detached else list(self.pending.values())
+                if not detached:
+                    self.pending.clear()
+            sock.close()
+            for future in failed:
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection to master closed"))
+
+class ConnectionPool:
+    """A fixed set of sessions shared by multi-threaded callers.
+
+    Requests go to the session with the fewest responses outstanding, so a
+    slow request (e.g. a blocking GET_RESULT) does not delay small ones.
+    """
+
+    def __init__(self, master_host: str, master_port: int, size: int = 4, client_id: str = "client",
+                 transport=None):
+        self.sessions: List[ClientSession] = [
+            ClientSession(master_host, master_port, f"{client_id}-{i}", transport) for i in range(size)
+        ]
+
+    def session(self) -> ClientSession:
+        return min(self.sessions, key=lambda session: session.pending_count())
+
+    def submit(self, msg_type: str, data: Dict[str, Any], payload: Optional[np.ndarray] = None,
+               chunks: Iterable[Message] = (), trace_id: Optional[str] = None) -> Future:
+        return self.session().submit(msg_type, data, payload, chunks, trace_id)
+
+    def request(self, msg_type: str, data: Dict[str, Any], payload: Optional[np.ndarray] = None,
+                chunks: Iterable[Message] = (), timeout: Optional[float] = None,
+                trace_id: Optional[str] = None) -> Message:
+        return self.submit(msg_type, data, payload, chunks, trace_id).result(timeout)
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
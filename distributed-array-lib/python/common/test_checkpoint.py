@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+
+from common.checkpoint import SegmentCheckpoint
+
+def test_load_returns_saved_segments_with_their_role(tmp_path):
+    checkpoint = SegmentCheckpoint(str(tmp_path))
+    checkpoint.save("a", 0, np.arange(10, dtype=np.int32), primary=True)
+    checkpoint.save("a", 10, np.linspace(0, 1, 5), primary=False)
+    checkpoint.set_role("a", 10, True)
+
+    loaded, corrupt = SegmentCheckpoint(str(tmp_path)).load()
+    by_key = {(entry["arrayId"], entry["segmentId"]): (entry, data) for entry, data in loaded}
+
+    assert corrupt == []
+    assert np.array_equal(by_key[("a", 0)][1], np.arange(10, dtype=np.int32))
+    assert by_key[("a", 10)][1].dtype == np.float64
+    assert by_key[("a", 10)][0]["isPrimary"] is True
+
+def test_dropped_segment_is_gone(tmp_path):
+    checkpoint = SegmentCheckpoint(str(tmp_path))
+    checkpoint.save("a", 0, np.arange(10, dtype=np.int32), primary=True)
+    checkpoint.drop("a", 0)
+
+    loaded, corrupt = SegmentCheckpoint(str(tmp_path)).load()
+    assert loaded == [] and corrupt == []
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".seg")] == []
+
+def test_damaged_file_is_reported_and_removed(tmp_path):
+    checkpoint = SegmentCheckpoint(str(tmp_path))
+    checkpoint.save("a", 0, np.arange(10, dtype=np.int32), primary=True)
+    checkpoint.save("a", 10, np.arange(10, dtype=np.int32), primary=True)
+    path = checkpoint._path("a", 0)
+    with open(path, "r+b") as segment:
+        segment.write(b"\xff\xff")
+
+    loaded, corrupt = SegmentCheckpoint(str(tmp_path)).load()
+    assert corrupt == [("a", 0)]
+    assert [entry["segmentId"] for entry, _ in loaded] == [10]
+    assert not os.path.exists(path)
+
+def test_torn_journal_record_keeps_what_came_before(tmp_path):
+    checkpoint = SegmentCheckpoint(str(tmp_path))
+    checkpoint.save("a", 0, np.arange(10, dtype=np.int32), primary=True)
+    with open(tmp_path / SegmentCheckpoint.MANIFEST, "a") as journal:
+        journal.write('{"op": "drop", "arrayId": "a", "segm')
+
+    loaded, _ = SegmentCheckpoint(str(tmp_path)).load()
+    assert [entry["segmentId"] for entry, _ in loaded] == [0]
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from common.compression import CODECS, CodecPolicy, decode, encode
+
+SAMPLES = {
+    "<i4": [
+        np.arange(100000, dtype=np.int32),
+        np.random.default_rng(0).integers(-2**31, 2**31 - 1, 5000, dtype=np.int32),
+        np.full(1000, 7, dtype=np.int32),
+        np.array([2**31 - 1, -2**31, 0, -1], dtype=np.int32),
+        np.empty(0, dtype=np.int32),
+        np.array([42], dtype=np.int32),
+    ],
+    "<f8": [
+        np.random.default_rng(1).uniform(1.0, 100.0, 10000),
+        np.linspace(0, 1, 1000),
+        np.array([np.inf, -np.inf, 0.0, -0.0]),
+        np.empty(0),
+    ],
+}
+
+CASES = [(name, array) for name, codec in CODECS.items()
+         for dtype in codec.dtypes for array in SAMPLES[dtype]]
+
+@pytest.mark.parametrize("name,array", CASES)
+def test_round_trip(name, array):
+    data = encode(name, array)
+    result = decode(name, data, array.dtype, array.shape)
+
+    assert result.dtype == array.dtype
+    assert np.array_equal(result, array)
+
+@pytest.mark.parametrize("name", [name for name, codec in CODECS.items() if "<i4" in codec.dtypes])
+def test_round_trip_keeps_shape(name):
+    array = np.arange(600, dtype=np.int32).reshape(20, 30)
+
+    assert np.array_equal(decode(name, encode(name, array), array.dtype, array.shape), array)
+
+@pytest.mark.parametrize("name", list(CODECS))
+def test_truncated_payload_is_rejected(name):
+    array = np.arange(100000, dtype=np.int32) * 3
+    data = encode(name, array)
+
+    with pytest.raises(Exception):
+        decode(name, data[:len(data) // 2], array.dtype, array.shape)
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        decode("snappy", b"", np.dtype(np.int32), (0,))
+
+def test_policy_sends_small_and_random_payloads_raw():
+    policy = CodecPolicy()
+
+    assert policy.choose(np.arange(10, dtype=np.int32), 1e8, CODECS) is None
+    noise = np.random.default_rng(2).integers(-2**31, 2**31 - 1, 1 << 20, dtype=np.int32)
+    assert policy.choose(noise, 1e8, CODECS) is None
+
+def test_policy_compresses_regular_data_on_a_slow_link():
+    policy = CodecPolicy()
+
+    assert policy.choose(np.arange(1 << 20, dtype=np.int32), 1e6, CODECS) is not None
+    assert policy.choose(np.arange(1 << 20, dtype=np.int32), 1e6, []) is None
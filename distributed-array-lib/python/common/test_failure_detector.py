@@ -0,0 +1,42 @@
+from common.failure_detector import PhiAccrualFailureDetector
+
+def regular(interval: float, count: int = 50, **options) -> PhiAccrualFailureDetector:
+    detector = PhiAccrualFailureDetector(interval, **options)
+    for i in range(count):
+        detector.heartbeat(i * interval)
+    return detector
+
+def test_phi_grows_with_silence():
+    detector = regular(1.0)
+    last = 49.0
+
+    assert detector.phi(last + 0.5) < detector.phi(last + 1.5) < detector.phi(last + 3.0)
+    assert detector.is_available(last + 1.0)
+    assert not detector.is_available(last + 10.0)
+
+def test_unknown_node_is_not_suspected():
+    assert PhiAccrualFailureDetector(1.0).phi(1000.0) == 0.0
+
+def test_jittery_heartbeats_need_longer_silence():
+    steady = regular(1.0)
+    jittery = PhiAccrualFailureDetector(1.0)
+    now = 0.0
+    for i in range(50):
+        now += 0.2 if i % 2 else 1.8
+        jittery.heartbeat(now)
+
+    assert jittery.phi(now + 3.0) < steady.phi(49.0 + 3.0)
+
+def test_touch_proves_liveness_without_a_sample():
+    detector = regular(1.0)
+    intervals = list(detector.intervals)
+    detector.touch(60.0)
+
+    assert detector.is_available(60.5)
+    assert list(detector.intervals) == intervals
+
+def test_acceptable_pause_delays_suspicion():
+    assert regular(1.0, acceptable_pause=5.0).is_available(49.0 + 5.0)
+
+def test_long_silence_does_not_overflow():
+    assert regular(1.0).phi(1e9) > 8.0
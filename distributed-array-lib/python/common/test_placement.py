@@ -0,0 +1,54 @@
+import pytest
+
+from common.placement import MB, PlacementError, WorkerCapacity, plan_placement, proportional_shares
+
+def primaries(segments, worker_id):
+    return [segment for segment in segments if segment.worker_id == worker_id]
+
+def test_shares_follow_cores():
+    workers = [WorkerCapacity("a", 1, 1024 * MB), WorkerCapacity("b", 3, 1024 * MB)]
+    segments = plan_placement(4000, 8, workers, partitions_per_core=2, replication_factor=1)
+
+    assert sum(s.end_index - s.start_index for s in primaries(segments, "a")) == 1000
+    assert sum(s.end_index - s.start_index for s in primaries(segments, "b")) == 3000
+    assert len(primaries(segments, "a")) == 2
+    assert len(primaries(segments, "b")) == 6
+
+def test_segments_cover_the_array_in_order():
+    workers = [WorkerCapacity(f"w{i}", i + 1, 1024 * MB) for i in range(3)]
+    segments = plan_placement(10007, 8, workers)
+
+    assert segments[0].start_index == 0
+    assert segments[-1].end_index == 10007
+    for previous, segment in zip(segments, segments[1:]):
+        assert previous.end_index == segment.start_index
+
+def test_replicas_go_to_other_workers():
+    workers = [WorkerCapacity(f"w{i}", 2, 1024 * MB) for i in range(3)]
+    for segment in plan_placement(6000, 8, workers, replication_factor=2):
+        assert len(segment.replicas) == 1
+        assert segment.replicas[0] != segment.worker_id
+
+def test_json_only_workers_get_one_partition():
+    workers = [WorkerCapacity("binary", 2, 1024 * MB),
+               WorkerCapacity("java", 2, 1024 * MB, max_partitions=1)]
+    segments = plan_placement(4000, 8, workers, partitions_per_core=2)
+
+    assert len(primaries(segments, "binary")) == 4
+    [java] = primaries(segments, "java")
+    assert java.end_index - java.start_index == 2000
+    assert segments[-1].end_index == 4000
+
+def test_memory_caps_the_share():
+    workers = [WorkerCapacity("small", 8, 8000), WorkerCapacity("big", 1, 1024 * MB)]
+    segments = plan_placement(10000, 8, workers, replication_factor=1)
+
+    assert sum(s.end_index - s.start_index for s in primaries(segments, "small")) == 1000
+
+def test_array_that_does_not_fit_is_refused():
+    workers = [WorkerCapacity("a", 1, 1000), WorkerCapacity("b", 1, 1000)]
+    with pytest.raises(PlacementError):
+        plan_placement(1000, 8, workers)
+
+def test_capped_share_is_redistributed():
+    assert proportional_shares(100, [1, 1, 2], [10, 100, 100]) == [10, 30, 60]
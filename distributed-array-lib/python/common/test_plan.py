@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from common import kernels
+from common.plan import Plan, combine, filter_step, finalize, map_step
+
+DATA = np.random.default_rng(0).uniform(-10.0, 10.0, 100003)
+
+def run(plan: Plan, data: np.ndarray, pieces: int = 3):
+    # As the master does: one partial per segment, combined in order
+    bounds = np.linspace(0, len(data), pieces + 1).astype(int)
+    partials = [plan.run_range(data, bounds[i], bounds[i + 1]) for i in range(pieces)]
+    combined = combine(plan.action, partials)
+    return combined if plan.action == "collect" else finalize(plan.action, combined)
+
+@pytest.mark.parametrize("action,expected", [
+    ("sum", lambda x: x.sum()),
+    ("count", lambda x: len(x)),
+    ("min", lambda x: x.min()),
+    ("max", lambda x: x.max()),
+    ("mean", lambda x: x.mean()),
+])
+def test_aggregates_match_numpy(action, expected):
+    plan = Plan([map_step(np.multiply, 2.0), filter_step(np.greater, 0.0)], action, np.float64)
+    kept = DATA[DATA * 2.0 > 0] * 2.0
+
+    assert run(plan, DATA) == pytest.approx(expected(kept))
+
+def test_collect_keeps_order():
+    plan = Plan([filter_step(np.less, 0.0), map_step(np.negative)], "collect", np.float64)
+
+    assert np.array_equal(run(plan, DATA), -DATA[DATA < 0])
+
+def test_kernel_step():
+    plan = Plan([map_step(kernels.EXAMPLE1)], "collect", np.float64)
+
+    assert np.allclose(run(plan, DATA), kernels.EXAMPLE1(DATA))
+
+def test_histogram_partials_add_up():
+    plan = Plan([], "histogram", np.float64, bins=4, hist_range=[-10, 10])
+
+    assert run(plan, DATA) == np.histogram(DATA, bins=4, range=(-10, 10))[0].tolist()
+
+def test_empty_selection():
+    plan = Plan([filter_step(np.greater, 100.0)], "min", np.float64)
+
+    assert run(plan, DATA) is None
+    assert Plan([filter_step(np.greater, 100.0)], "count", np.float64).run_range(DATA, 0, len(DATA))[0] == 0
+
+def test_integer_sum_does_not_overflow():
+    data = np.full(1000, 2**31 - 1, dtype=np.int32)
+
+    assert run(Plan([], "sum", np.int32), data) == 1000 * (2**31 - 1)
+
+def test_round_trips_through_a_dict():
+    plan = Plan([map_step(np.sqrt), filter_step(np.greater, 1.5)], "histogram", np.float64,
+                bins=3, hist_range=[0, 3])
+
+    assert Plan.from_dict(plan.to_dict(), np.float64).to_dict() == plan.to_dict()
+
+@pytest.mark.parametrize("steps,action,options", [
+    ([], "median", {}),
+    ([{"op": "reduce", "ufunc": "add"}], "sum", {}),
+    ([map_step("no_such_ufunc")], "sum", {}),
+    ([filter_step(np.sqrt)], "sum", {}),
+    ([map_step(np.add)], "sum", {}),
+    ([], "histogram", {"bins": 3}),
+])
+def test_malformed_plans_are_rejected(steps, action, options):
+    with pytest.raises(ValueError):
+        Plan(steps, action, np.float64, **options)
@@ -0,0 +1,104 @@
+from common.scheduler import Task, TaskScheduler
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def make_scheduler(clock=None, **options) -> TaskScheduler:
+    scheduler = TaskScheduler(clock=clock or Clock(), **options)
+    scheduler.add_worker("a", 1)
+    scheduler.add_worker("b", 1)
+    return scheduler
+
+def tasks(job_id, holders, count, size=10):
+    return [Task(job_id, i, list(holders), {"arrayId": "x"}, size=size) for i in range(count)]
+
+def test_primaries_take_their_own_partitions_first():
+    scheduler = make_scheduler()
+    scheduler.submit([Task("j", 0, ["a", "b"], {}), Task("j", 1, ["b", "a"], {})])
+
+    assert [(task.segment_id, task.worker_id, task.stolen) for task in scheduler.assignments()] == \
+        [(0, "a", False), (1, "b", False)]
+
+def test_idle_replica_holder_steals():
+    scheduler = make_scheduler()
+    scheduler.submit(tasks("j", ["a", "b"], 2))
+
+    assert [(task.worker_id, task.stolen) for task in scheduler.assignments()] == [("a", False), ("b", True)]
+
+def test_no_stealing_when_disabled():
+    scheduler = make_scheduler(work_stealing=False)
+    scheduler.submit(tasks("j", ["a", "b"], 2))
+
+    assert [task.worker_id for task in scheduler.assignments()] == ["a"]
+
+def test_completion_frees_the_slot():
+    scheduler = make_scheduler(work_stealing=False)
+    scheduler.submit(tasks("j", ["a"], 2))
+    [first] = scheduler.assignments()
+
+    winner, losers = scheduler.complete("j", first.segment_id, "a")
+    assert winner is first and losers == []
+    assert [task.segment_id for task in scheduler.assignments()] == [1]
+
+def test_completion_without_job_id_goes_through_the_running_task():
+    # A worker that does not echo the jobId is matched to what it runs
+    scheduler = make_scheduler(work_stealing=False)
+    scheduler.submit(tasks("j", ["a"], 2))
+    scheduler.assignments()
+
+    [task] = scheduler.running_on("a")
+    winner, _ = scheduler.complete(task.job_id, task.segment_id, "a")
+    assert winner is task
+    [following] = scheduler.assignments()
+    assert following.segment_id == 1
+
+def test_result_from_another_worker_is_rejected():
+    scheduler = make_scheduler(work_stealing=False)
+    scheduler.submit(tasks("j", ["a"], 1))
+    scheduler.assignments()
+
+    assert scheduler.complete("j", 0, "b") == (None, [])
+    assert scheduler.complete("j", 5, "a") == (None, [])
+    assert ("j", 0) in scheduler.running
+
+def test_failed_task_moves_to_another_holder():
+    scheduler = make_scheduler(work_stealing=False)
+    scheduler.submit(tasks("j", ["a", "b"], 1))
+    scheduler.assignments()
+
+    assert scheduler.fail("j", 0, "a") is None
+    [retry] = scheduler.assignments()
+    assert retry.worker_id == "b"
+
+def test_task_without_holders_is_returned_to_fail_its_job():
+    scheduler = make_scheduler()
+    scheduler.submit(tasks("j", ["a"], 2))
+    scheduler.assignments()
+
+    abandoned = scheduler.remove_worker("a")
+    assert [task.job_id for task in abandoned] == ["j"]
+    assert not scheduler.queue
+
+def test_straggler_gets_a_backup_copy():
+    clock = Clock()
+    scheduler = make_scheduler(clock, work_stealing=False)
+    scheduler.add_worker("a", 2)
+    scheduler.submit(tasks("j", ["a", "b"], 2))
+    scheduler.assignments()
+    clock.now = 1.0
+    scheduler.complete("j", 0, "a")
+
+    # 0.1 s per element, 10 elements, times 1.5
+    clock.now = 1.4
+    assert scheduler.speculate() == []
+    clock.now = 1.6
+    [backup] = scheduler.speculate()
+    assert (backup.segment_id, backup.worker_id, backup.speculative) == (1, "b", True)
+
+    winner, losers = scheduler.complete("j", 1, "b")
+    assert winner is backup
+    assert [loser.worker_id for loser in losers] == ["a"]
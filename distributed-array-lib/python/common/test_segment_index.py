@@ -0,0 +1,50 @@
+from common.darray import Segment
+from common.segment_index import SegmentIndex
+
+def make_index():
+    index = SegmentIndex()
+    for worker_id in ("a", "b", "c"):
+        index.add_worker(worker_id)
+    index.add_array("x", [Segment("a", 0, 100, ["b"]), Segment("b", 100, 300, ["a"])], itemsize=8)
+    return index
+
+def test_tracks_holders_both_ways():
+    index = make_index()
+
+    assert index.holders("x", 100) == ["b", "a"]
+    assert index.segments_of("a") == {("x", 0), ("x", 100)}
+    assert index.load == {"a": 2400, "b": 2400, "c": 0}
+
+def test_remove_worker_leaves_the_primary_for_promotion():
+    index = make_index()
+
+    assert index.remove_worker("a") == [("x", 0), ("x", 100)]
+    assert index.segment("x", 0).worker_id == "a"
+    assert index.segment("x", 100).replicas == []
+
+    index.promote("x", 0, "b")
+    assert index.holders("x", 0) == ["b"]
+
+def test_least_loaded_skips_excluded_and_ineligible():
+    index = make_index()
+
+    assert index.least_loaded() == "c"
+    assert index.least_loaded(exclude=["c"]) in ("a", "b")
+    # Excluded workers stay available for later calls
+    assert index.least_loaded() == "c"
+    assert index.least_loaded(eligible=lambda worker_id: worker_id != "c") in ("a", "b")
+
+def test_add_replica_updates_load():
+    index = make_index()
+    index.add_replica("x", 100, "c")
+
+    assert index.holders("x", 100) == ["b", "a", "c"]
+    assert index.load["c"] == 1600
+    assert index.least_loaded() == "c"
+
+def test_remove_array_releases_load():
+    index = make_index()
+    index.remove_array("x", [index.segment("x", 0), index.segment("x", 100)])
+
+    assert index.load == {"a": 0, "b": 0, "c": 0}
+    assert index.segment("x", 0) is None
@@ -0,0 +1,36 @@
+import numpy as np
+
+from common.segment_store import SegmentStore
+
+def test_put_as_replica_replaces_the_primary(tmp_path):
+    store = SegmentStore(str(tmp_path), memory_budget=1 << 20)
+    store.put("a", 0, np.zeros(1000))
+    store.put("a", 0, np.ones(1000), primary=False)
+
+    assert store.get("a", 0) is None
+    assert np.array_equal(store.get("a", 0, primary=False), np.ones(1000))
+    assert store.primary_ids("a") == []
+    assert store.resident_bytes == 8000
+    assert store.nbytes() == 8000
+
+def test_put_as_primary_replaces_the_replica(tmp_path):
+    store = SegmentStore(str(tmp_path), memory_budget=1 << 20)
+    store.put("a", 0, np.zeros(1000), primary=False)
+    store.put("a", 0, np.ones(1000))
+
+    assert store.get("a", 0, primary=False) is None
+    assert store.primary_ids("a") == [0]
+    assert store.resident_bytes == 8000
+
+def test_relabelled_segment_is_spilled_once(tmp_path):
+    spilled = []
+    store = SegmentStore(str(tmp_path), memory_budget=12000, on_spill=spilled.extend)
+    store.put("a", 0, np.zeros(1000))
+    store.put("a", 0, np.zeros(1000), primary=False)
+    store.put("a", 1000, np.ones(1000))
+
+    # Over budget by one segment: the replica goes, the new primary stays
+    assert spilled == [("a", 0)]
+    assert store.resident_bytes == 8000
+    assert len(store.files) == 1
+    assert np.array_equal(store.lookup("a", 0), np.zeros(1000))
@@ -0,0 +1,117 @@
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+# Stages of a job, in order. The master records dispatch (queued until a
+# core was free and PROCESS_SEGMENT was written), merge (writing a result
+# into the job) and deliver (the reply to GET_RESULT). Workers report when
+# a PROCESS_SEGMENT arrived, when its partition started and when it was
+# computed, which gives network (master to worker), queue (waiting for a
+# core), compute, and result (serializing and sending SEGMENT_RESULT until
+# the master has read it). Workers that report no times get one ``worker``
+# span for the whole round trip.
+STAGES = ("dispatch", "network", "queue", "compute", "result", "worker", "merge", "deliver")
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+@contextmanager
+def compute_timing(timing: Optional[Dict[str, float]]):
+    """Stamp ``started`` and ``computed`` in a worker's ``timing`` of a
+    traced partition around its computation; untraced ones pass None."""
+    if timing is not None:
+        timing["started"] = time.time()
+    try:
+        yield
+    finally:
+        if timing is not None:
+            timing["computed"] = time.time()
+
+@dataclass
+class Span:
+    stage: str
+    node: str
+    start: float
+    end: float
+    segment_id: Optional[int] = None
+    args: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+class Trace:
+    """Timeline of one job across the master and its workers.
+
+    Span times are wall-clock seconds of the node that took them, so the
+    stages spanning two nodes (network and result) are only as accurate as
+    the nodes' clocks agree; on one host they are exact.
+    """
+
+    def __init__(self, trace_id: str, job_id: str, array_id: str, operation: str):
+        self.trace_id = trace_id
+        self.job_id = job_id
+        self.array_id = array_id
+        self.operation = operation
+        self.spans: List[Span] = []
+
+    def add(self, stage: str, node: str, start: float, end: float, segment_id: Optional[int] = None, **args):
+        self.spans.append(Span(stage, node, start, end, segment_id, args))
+
+    def add_segment(self, segment_id: int, worker_id: str, queued: float, dispatched: float, arrived: float,
+                    timing: Optional[Dict[str, float]] = None, **args):
+        """Spans of one partition from the master's times and the worker's ``timing``."""
+        self.add("dispatch", "master", queued, dispatched, segment_id, **args)
+        if timing is None:
+            self.add("worker", worker_id, dispatched, arrived, segment_id, **args)
+            return
+        self.add("network", worker_id, dispatched, timing["received"], segment_id, **args)
+        self.add("queue", worker_id, timing["received"], timing["started"], segment_id, **args)
+        self.add("compute", worker_id, timing["started"], timing["computed"], segment_id, **args)
+        self.add("result", worker_id, timing["computed"], arrived, segment_id, **args)
+
+    def stages(self) -> Dict[str, Dict[str, float]]:
+        """Total, mean and longest duration of each stage over the job's partitions."""
+        summary: Dict[str, Dict[str, float]] = {}
+        for span in self.spans:
+            stage = summary.setdefault(span.stage, {"count": 0, "total": 0.0, "max": 0.0})
+            stage["count"] += 1
+            stage["total"] += span.duration
+            stage["max"] = max(stage["max"], span.duration)
+        for stage in summary.values():
+            stage["mean"] = stage["total"] / stage["count"]
+        return {name: summary[name] for name in STAGES if name in summary}
+
+    def to_dict(self) -> Dict[str, Any]:
+        spans = sorted(self.spans, key=lambda span: span.start)
+        return {
+            "traceId": self.trace_id,
+            "jobId": self.job_id,
+            "arrayId": self.array_id,
+            "operation": self.operation,
+            "spans": [{"stage": span.stage, "node": span.node, "segmentId": span.segment_id,
+                       "start": span.start, "end": span.end, "duration": span.duration, **span.args}
+                      for span in spans],
+            "stages": self.stages(),
+        }
+
+    def to_chrome(self) -> Dict[str, Any]:
+        """The trace in Chrome's Trace Event format, for chrome://tracing or Perfetto.
+
+        Every node is a process and every partition a thread within it.
+        """
+        origin = min((span.start for span in self.spans), default=0.0)
+        nodes = {"master": 0}
+        events = []
+        for span in sorted(self.spans, key=lambda span: span.start):
+            pid = nodes.setdefault(span.node, len(nodes))
+            events.append({"name": span.stage, "cat": span.stage, "ph": "X", "pid": pid,
+                           "tid": span.segment_id if span.segment_id is not None else -1,
+                           "ts": (span.start - origin) * 1e6, "dur": max(span.duration, 0.0) * 1e6,
+                           "args": dict(span.args, segmentId=span.segment_id)})
+        for node, pid in nodes.items():
+            events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": node}})
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"traceId": self.trace_id, "jobId": self.job_id, "operation": self.operation}}
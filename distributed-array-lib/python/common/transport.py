@@ -0,0 +1,370 @@
+import asyncio
+import errno
+import itertools
+import os
+import queue
+import socket
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# Nodes open and accept connections through a transport. Every transport
+# carries the same byte stream (header lines and binary payloads, see
+# message.py), so nodes and the framing code do not change with it:
+#
+#   TcpTransport     TCP sockets, the default
+#   UnixTransport    Unix domain sockets in a shared directory, for one
+#                    process per node on the same host
+#   MemoryTransport  in-memory buffers, for a whole cluster in one process
+#
+# Addresses are (host, port) pairs throughout; a transport decides what they
+# mean. Threaded code (workers, clients) gets socket-like objects from
+# ``connect`` and ``listen``; the master's event loop gets asyncio streams
+# from ``start_server``.
+
+Handler = Callable[[asyncio.StreamReader, Any], Awaitable[None]]
+
+class TcpTransport:
+    """TCP sockets. Servers listen on all interfaces, and small messages are
+    not held back by Nagle's algorithm."""
+
+    name = "tcp"
+
+    def connect(self, host: str, port: int) -> socket.socket:
+        sock = socket.create_connection((host, port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def listen(self, port: int = 0) -> Tuple[socket.socket, int]:
+        """A listening socket and its port; port 0 picks a free one."""
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(('0.0.0.0', port))
+        server.listen()
+        return server, server.getsockname()[1]
+
+    async def start_server(self, handler: Handler, port: int, limit: int, backlog: int = 100):
+        async def accepted(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            sock = writer.get_extra_info('socket')
+            if sock is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            await handler(reader, writer)
+
+        return await asyncio.start_server(accepted, '0.0.0.0', port, limit=limit, backlog=backlog)
+
+    def local_address(self, sock) -> Tuple[str, int]:
+        return sock.getsockname()[:2]
+
+    def peer_address(self, writer) -> tuple:
+        return writer.get_extra_info('peername')
+
+class UnixTransport:
+    """Unix domain sockets named ``<port>.sock`` in ``directory``.
+
+    The host of an address is the directory, so nodes in different
+    processes reach each other as long as they share it. No TCP stack is
+    involved, but every message still crosses the kernel.
+    """
+
+    name = "unix"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @staticmethod
+    def path(host: str, port: int) -> str:
+        return os.path.join(host, f"{port}.sock")
+
+    def connect(self, host: str, port: int) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path(host, port))
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def listen(self, port: int = 0) -> Tuple[socket.socket, int]:
+        # Port 0 takes the lowest number no other node has bound yet
+        for candidate in [port] if port else itertools.count(1):
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                server.bind(self.path(self.directory, candidate))
+            except OSError as e:
+                server.close()
+                if port or e.errno != errno.EADDRINUSE:
+                    raise
+                continue
+            server.listen()
+            return server, candidate
+
+    async def start_server(self, handler: Handler, port: int, limit: int, backlog: int = 100):
+        return await asyncio.start_unix_server(handler, self.path(self.directory, port),
+                                               limit=limit, backlog=backlog)
+
+    def local_address(self, sock) -> Tuple[str, int]:
+        return self.directory, 0
+
+    def peer_address(self, writer) -> tuple:
+        return self.directory, 0
+
+class MemoryTransport:
+    """Connections between nodes of one process over in-memory buffers.
+
+    Bytes are framed and parsed exactly as on a socket, but are handed from
+    one node to the other without a system call. Buffers are unbounded: a
+    reader that falls behind holds everything written to it. Ports are
+    handed out by the transport and the host is ignored.
+    """
+
+    name = "memory"
+    HOST = "memory"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.listeners: Dict[int, Callable[['MemorySocket'], None]] = {}
+        self.ports = itertools.count(1)
+
+    def bind(self, port: int, accept: Callable[['MemorySocket'], None]) -> int:
+        with self.lock:
+            if not port:
+                port = next(candidate for candidate in self.ports if candidate not in self.listeners)
+            elif port in self.listeners:
+                raise OSError(errno.EADDRINUSE, f"Memory port {port} is in use")
+            self.listeners[port] = accept
+        return port
+
+    def unbind(self, port: int):
+        with self.lock:
+            self.listeners.pop(port, None)
+
+    def connect(self, host: str, port: int) -> 'MemorySocket':
+        with self.lock:
+            accept = self.listeners.get(port)
+        if accept is None:
+            raise ConnectionRefusedError(errno.ECONNREFUSED, f"Nothing listens on memory port {port}")
+        sock = MemorySocket((self.HOST, port))
+        accept(sock)
+        return sock
+
+    def listen(self, port: int = 0) -> Tuple['MemoryListener', int]:
+        listener = MemoryListener(self)
+        listener.port = self.bind(port, listener.accept_connection)
+        return listener, listener.port
+
+    async def start_server(self, handler: Handler, port: int, limit: int, backlog: int = 100):
+        server = MemoryServer(self, handler, limit, asyncio.get_running_loop())
+        server.port = self.bind(port, server.accept_connection)
+        return server
+
+    def local_address(self, sock) -> Tuple[str, int]:
+        return sock.getsockname()
+
+    def peer_address(self, writer) -> tuple:
+        return writer.get_extra_info('peername')
+
+class MemorySocket:
+    """One end of an in-memory connection, with the socket methods the
+    threaded nodes use. ``peer`` is the other end, a ``MemorySocket`` or
+    the ``MemoryStreamWriter`` of a server."""
+
+    def __init__(self, address: Tuple[str, int]):
+        self.address = address
+        self.peer = None
+        self.ready = threading.Condition()
+        # Received data as a queue of chunks, consumed from ``offset`` into
+        # the first, so large payloads are not shifted around as they are read
+        self.chunks: deque = deque()
+        self.offset = 0
+        self.eof = False
+        self.closed = False
+
+    def deliver(self, data: bytes):
+        with self.ready:
+            if self.closed:
+                raise ConnectionResetError(errno.ECONNRESET, "Connection reset by peer")
+            self.chunks.append(memoryview(data))
+            self.ready.notify_all()
+
+    def end(self):
+        with self.ready:
+            self.eof = True
+            self.ready.notify_all()
+
+    def recv_into(self, view, nbytes: int = 0) -> int:
+        nbytes = nbytes or len(view)
+        with self.ready:
+            while not self.chunks and not self.eof:
+                self.ready.wait()
+            received = 0
+            while received < nbytes and self.chunks:
+                chunk = self.chunks[0]
+                count = min(nbytes - received, len(chunk) - self.offset)
+                view[received:received + count] = chunk[self.offset:self.offset + count]
+                received += count
+                self.offset += count
+                if self.offset == len(chunk):
+                    self.chunks.popleft()
+                    self.offset = 0
+            return received
+
+    def recv(self, size: int) -> bytes:
+        data = bytearray(size)
+        return bytes(data[:self.recv_into(memoryview(data), size)])
+
+    def sendall(self, data):
+        if self.closed or self.peer is None:
+            raise BrokenPipeError(errno.EPIPE, "Connection closed")
+        # Copied, as a socket would: the caller may reuse its buffer
+        self.peer.deliver(bytes(data))
+
+    def shutdown(self, how: int):
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.peer is not None:
+            self.peer.end()
+        self.end()
+
+    def setsockopt(self, *args):
+        pass
+
+    def getsockname(self) -> Tuple[str, int]:
+        return self.address
+
+class MemoryListener:
+    """The accepting end of ``MemoryTransport.listen``, like a listening socket."""
+
+    def __init__(self, transport: MemoryTransport):
+        self.transport = transport
+        self.port = 0
+        self.pending: queue.Queue = queue.Queue()
+
+    def accept_connection(self, sock: MemorySocket):
+        end = MemorySocket((MemoryTransport.HOST, self.port))
+        end.peer, sock.peer = sock, end
+        self.pending.put(end)
+
+    def accept(self) -> Tuple[MemorySocket, Tuple[str, int]]:
+        end = self.pending.get()
+        if end is None:
+            raise OSError(errno.EBADF, "Listener closed")
+        return end, (MemoryTransport.HOST, 0)
+
+    def close(self):
+        self.transport.unbind(self.port)
+        self.pending.put(None)
+
+class MemoryStreamWriter:
+    """The server's end of an in-memory connection: the ``StreamWriter``
+    methods the master uses, and delivery into its ``StreamReader`` on the
+    master's loop from whichever thread the peer writes in."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, peer: MemorySocket):
+        self.loop = loop
+        self.peer = peer
+        self.reader: Optional[asyncio.StreamReader] = None
+        # Guards against data fed after the end of the stream
+        self.lock = threading.Lock()
+        self.ended = False
+        self.closing = False
+        self.lost = False
+
+    def _call(self, fn: Callable, *args):
+        try:
+            self.loop.call_soon_threadsafe(fn, *args)
+        except RuntimeError:
+            raise ConnectionResetError(errno.ECONNRESET, "Server loop is closed")
+
+    def deliver(self, data: bytes):
+        with self.lock:
+            if self.ended:
+                raise ConnectionResetError(errno.ECONNRESET, "Connection reset by peer")
+            # Calls run in order, so the reader exists by the time this one does
+            self._call(lambda: self.reader.feed_data(data))
+
+    def end(self):
+        with self.lock:
+            if self.ended:
+                return
+            self.ended = True
+            try:
+                self._call(lambda: self.reader.feed_eof())
+            except ConnectionResetError:
+                pass
+
+    def write(self, data):
+        if self.closing or self.lost:
+            return
+        try:
+            self.peer.deliver(bytes(data))
+        except OSError:
+            self.lost = True
+
+    async def drain(self):
+        if self.lost:
+            raise ConnectionResetError(errno.ECONNRESET, "Connection lost")
+
+    def close(self):
+        if not self.closing:
+            self.closing = True
+            self.peer.end()
+
+    def is_closing(self) -> bool:
+        return self.closing
+
+    async def wait_closed(self):
+        pass
+
+    def get_extra_info(self, name: str, default=None):
+        return {"peername": (MemoryTransport.HOST, 0)}.get(name, default)
+
+class MemoryServer:
+    """``MemoryTransport.start_server``'s server, used like an ``asyncio.Server``."""
+
+    def __init__(self, transport: MemoryTransport, handler: Handler, limit: int, loop: asyncio.AbstractEventLoop):
+        self.transport = transport
+        self.handler = handler
+        self.limit = limit
+        self.loop = loop
+        self.port = 0
+        self.serving: Optional[asyncio.Future] = None
+        self.connections = set()
+
+    def accept_connection(self, sock: MemorySocket):
+        writer = MemoryStreamWriter(self.loop, sock)
+        sock.peer = writer
+        try:
+            self.loop.call_soon_threadsafe(self._start, writer)
+        except RuntimeError:
+            raise ConnectionRefusedError(errno.ECONNREFUSED, "Server loop is closed")
+
+    def _start(self, writer: MemoryStreamWriter):
+        writer.reader = asyncio.StreamReader(limit=self.limit)
+        task = self.loop.create_task(self.handler(writer.reader, writer))
+        self.connections.add(task)
+        task.add_done_callback(self.connections.discard)
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        return self.loop
+
+    def close(self):
+        self.transport.unbind(self.port)
+        if self.serving is not None:
+            self.serving.cancel()
+
+    async def serve_forever(self):
+        self.serving = self.loop.create_future()
+        try:
+            await self.serving
+        finally:
+            self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
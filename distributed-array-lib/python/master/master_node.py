@@ -1,42 +1,262 @@
-import socket
-import threading
+import asyncio
 import json
 import logging
 import time
 import sys
 import os
-from typing import Dict, List, Any
-from dataclasses import dataclass
-from concurrent.futures import ThreadPoolExecutor
+import itertools
+import numpy as np
+from collections import OrderedDict, deque
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+from dataclasses import dataclass, field
+from concurrent.futures import Executor, ThreadPoolExecutor
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from common.message import Message, MessageType
-from common.darray import DArrayInt, DArrayDouble
+from common.message import (Message, MessageType, AsyncMessageReader, write_message, encode_header,
+                            MAX_HEADER_SIZE)
+from common.darray import DArrayInt, DArrayDouble, overlapping_segments
+from common import kernels
+from common.backends import BACKENDS
+from common.plan import Plan, combine, finalize
+from common.placement import WorkerCapacity, PlacementError, plan_placement, MB
+from common.scheduler import Task, TaskScheduler
+from common.failure_detector import PhiAccrualFailureDetector
+from common.segment_index import SegmentIndex
+from common.compression import CODECS, CodecPolicy, LinkMeter
+from common.metrics import MetricsRegistry, merge_snapshots
+from common.tracing import Trace, new_trace_id
+from common.transport import TcpTransport
 
 @dataclass
 class WorkerInfo:
     worker_id: str
-    socket: socket.socket
+    writer: asyncio.StreamWriter
     address: tuple
     cores: int
     memory: int
     last_heartbeat: float
     alive: bool = True
+    reader: Optional[AsyncMessageReader] = None
+    # Free memory in MB as of the last heartbeat, and bytes placed on the
+    # worker since then that the figure does not reflect yet
+    free_memory: int = 0
+    reserved: int = 0
+    # Bulk data (segments and chunks) goes through a bounded queue written by
+    # the worker's own task, so a slow worker only holds back its own sends
+    outbox: Optional[asyncio.Queue] = None
+    outbox_task: Optional[asyncio.Task] = None
+    # Port other workers send replicas to; None for workers without one
+    peer_port: Optional[int] = None
+    detector: Optional[PhiAccrualFailureDetector] = None
+    # Payload codecs the worker decodes, and the measured rate of its link
+    codecs: Tuple[str, ...] = ()
+    link: LinkMeter = field(default_factory=LinkMeter)
+    # Whether the worker reads binary payloads; others get JSON lists
+    binary: bool = False
+    # Whether the worker acknowledges stored segments with SEGMENT_ACK
+    acks: bool = False
+    # Whether the worker answers METRICS with a snapshot of its own
+    reports_metrics: bool = False
+    metrics: Optional[MetricsRegistry] = None
+    
+    def capacity(self) -> WorkerCapacity:
+        # JSON-only workers (the Java worker) keep one primary per array and
+        # answer PROCESS_SEGMENT for it alone, whatever segmentIds name
+        return WorkerCapacity(self.worker_id, self.cores, max(self.free_memory * MB - self.reserved, 0),
+                              max_partitions=None if self.binary else 1)
+    
+    def peer_address(self) -> Optional[Dict[str, Any]]:
+        if self.peer_port is None:
+            return None
+        return {"workerId": self.worker_id, "host": self.address[0], "port": self.peer_port,
+                "codecs": list(self.codecs)}
+
+    def touch(self):
+        # Bytes of a message are still arriving: the worker is alive even
+        # though its heartbeats may be queued behind the message
+        now = time.time()
+        self.last_heartbeat = now
+        self.detector.touch(now)
+    
+    def send(self, message: Message):
+        # Queues the message on the transport; await drain() for backpressure
+        write_message(self.writer, message, metrics=self.metrics)
+
+    async def drain(self):
+        try:
+            await self.writer.drain()
+        except ConnectionError as e:
+            logging.getLogger('MasterNode').warning(f"Could not flush to worker {self.worker_id}: {e}")
+    
+    async def enqueue(self, message: Message):
+        # Waits only while this worker's outbox is full
+        await self.outbox.put(message)
+    
+    def compress(self, message: Message, policy: CodecPolicy):
+        start = time.perf_counter()
+        codec = policy.choose(message.payload, self.link.rate, self.codecs)
+        if codec is not None:
+            message.compress(codec)
+        if self.metrics is not None:
+            self.metrics.observe(f"compress.{message.type}", time.perf_counter() - start)
+    
+    @staticmethod
+    def inline(message: Message):
+        # For JSON-only workers: the payload goes in the header as "data"
+        message.data = dict(message.data, data=message.payload.tolist())
+        message.payload = None
+    
+    async def write_outbox(self, policy: Optional[CodecPolicy] = None, executor: Optional[Executor] = None):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await self.outbox.get()
+            # Payloads are compressed (or turned into JSON) off the loop,
+            # while other workers' outboxes keep sending
+            if self.alive and message.payload is not None and not self.binary:
+                await loop.run_in_executor(executor, self.inline, message)
+            elif self.alive and policy is not None and self.codecs and message.payload is not None:
+                await loop.run_in_executor(executor, self.compress, message, policy)
+            # Messages for a dead worker are dropped so producers never block on it
+            if self.alive:
+                start = time.perf_counter()
+                self.send(message)
+                await self.drain()
+                self.link.observe(message.wire_nbytes(), time.perf_counter() - start)
+            self.outbox.task_done()
+
+@dataclass
+class ClientConnection:
+    """A client connection that may carry many pipelined requests."""
+    reader: AsyncMessageReader
+    writer: asyncio.StreamWriter
+
+@dataclass
+class Job:
+    """An APPLY_OPERATION or EXECUTE_PLAN in flight.
+
+    Operation results are written into ``result`` as segments arrive. Plan
+    results have no fixed layout, so their partials are kept per segment and
+    combined into ``result`` once all have arrived. A job that cannot finish
+    is done with an ``error``.
+    """
+    job_id: str
+    array_id: str
+    operation: str
+    result: Optional[np.ndarray]
+    segment_ends: Dict[int, int]
+    pending: set
+    started_at: float
+    finished_at: Optional[float] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+    action: Optional[str] = None
+    partials: Dict[int, np.ndarray] = field(default_factory=dict)
+    stolen: int = 0
+    speculated: int = 0
+    speculation_wins: int = 0
+    error: Optional[str] = None
+    trace: Optional[Trace] = None
+
+@dataclass
+class Distribution:
+    """Copies of a new array's segments that workers have not acknowledged yet."""
+    array_id: str
+    pending: set
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+    error: Optional[str] = None
 
 class MasterNode:
-    def __init__(self, port: int):
+    """Master node running on a single asyncio event loop.
+
+    Worker and client connections are coroutines, so the number of
+    connections is not bounded by a thread pool; all cluster state is only
+    touched from the loop. ``executor`` is reserved for CPU-heavy work such
+    as encoding or decoding large JSON messages.
+    """
+
+    def __init__(self, port: int, partitions_per_core: int = 2, work_stealing: bool = True,
+                 speculation: bool = True, phi_threshold: float = 8.0, rereplication_delay: float = 5.0,
+                 compression: bool = True, transport=None):
         self.port = port
-        self.server_socket = None
+        # Where workers and clients connect; see common/transport.py
+        self.transport = transport or TcpTransport()
+        self.server: Optional[asyncio.AbstractServer] = None
         self.workers: Dict[str, WorkerInfo] = {}
         self.int_arrays: Dict[str, DArrayInt] = {}
         self.double_arrays: Dict[str, DArrayDouble] = {}
         self.running = True
-        self.executor = ThreadPoolExecutor(max_workers=20)
+        self.executor = ThreadPoolExecutor(max_workers=4)
         
-        # Replication tracking
-        self.segment_replicas: Dict[str, Dict[int, List[str]]] = {}
-        self.worker_segments: Dict[str, set] = {}
+        # Replication tracking: segment holders and, per worker, the segments it holds
+        self.segment_index = SegmentIndex()
         self.REPLICATION_FACTOR = 2  # Primary + 1 replica
+        # Segments that lost a copy, and since when. New copies are made only
+        # after REREPLICATION_DELAY seconds, so a worker that restarts with
+        # its checkpoint in time restores them from its own disk
+        self.under_replicated: Dict[Tuple[str, int], float] = {}
+        self.REREPLICATION_DELAY = rereplication_delay
+        
+        # Failure detection: a closed or broken connection fails a worker at
+        # once; a hung one is suspected by a phi accrual detector over its
+        # heartbeat arrivals, checked every HEALTH_CHECK_INTERVAL seconds.
+        # Silence up to ACCEPTABLE_PAUSE longer than usual is tolerated on
+        # top of the heartbeat jitter. Payload bytes still streaming in
+        # count as signs of life, so a worker whose heartbeats wait behind
+        # a large transfer is not suspected.
+        self.PHI_THRESHOLD = phi_threshold
+        self.HEALTH_CHECK_INTERVAL = 0.1
+        self.ACCEPTABLE_PAUSE = 0.5
+        # Assumed for workers that do not advertise their heartbeat interval
+        self.DEFAULT_HEARTBEAT_INTERVAL = 3.0
+        
+        # Arrays are split into this many partitions per worker core, so a
+        # worker always has queued partitions for a core that finishes early
+        self.PARTITIONS_PER_CORE = partitions_per_core
+        
+        # Partitions are dispatched as tasks to workers with a free core;
+        # with work stealing an idle replica holder takes a busy primary's.
+        # With speculation, stragglers also get a backup copy on a replica
+        # holder, checked every SPECULATION_INTERVAL seconds
+        self.scheduler = TaskScheduler(work_stealing, speculation)
+        self.SPECULATION_INTERVAL = 0.05
+        
+        # Operation tracking; GET_RESULT returns the latest job per array.
+        # Other jobs are forgotten once their result is delivered, or
+        # JOB_TTL seconds after they finished if it never is
+        self.jobs: Dict[str, Job] = {}
+        self.latest_jobs: Dict[str, Job] = {}
+        self.job_counter = itertools.count()
+        self.RESULT_TIMEOUT = 30.0
+        self.JOB_TTL = 300.0
+        # (finished_at, job_id) in the order jobs finished
+        self.finished_jobs: deque = deque()
+        
+        # CREATE_ARRAY is answered once every copy of every segment is acknowledged
+        self.distributions: Dict[str, Distribution] = {}
+        self.ACK_TIMEOUT = 60.0
+        # Bulk messages queued per worker beyond the one being written
+        self.OUTBOX_SIZE = 4
+        # JSON results at least this long are encoded in the executor
+        self.OFFLOAD_ELEMENTS = 65536
+        # Payloads to workers that decode a codec are compressed when that
+        # gets them across the worker's link faster; see CodecPolicy
+        self.codec_policy = CodecPolicy() if compression else None
+        
+        # Message, handler and queue metrics; METRICS merges them with
+        # snapshots from the workers, which get METRICS_TIMEOUT to answer
+        self.metrics = MetricsRegistry()
+        self.metrics.gauge("scheduler.queued", lambda: len(self.scheduler.queue))
+        self.metrics.gauge("scheduler.running", lambda: len(self.scheduler.running))
+        self.metrics.gauge("outbox.queued", lambda: sum(worker.outbox.qsize() for worker in self.workers.values()
+                                                        if worker.alive))
+        self.metrics.gauge("jobs.active", lambda: len(self.jobs))
+        self.metrics_counter = itertools.count()
+        self.metrics_waiters: Dict[Tuple[int, str], asyncio.Future] = {}
+        self.METRICS_TIMEOUT = 2.0
+        
+        # Every job is traced; GET_TRACE finds the last TRACE_HISTORY traces,
+        # also of jobs that were already delivered or evicted
+        self.traces: "OrderedDict[str, Trace]" = OrderedDict()
+        self.TRACE_HISTORY = 256
         
         self.setup_logging()
     
@@ -52,209 +272,453 @@ class MasterNode:
         self.logger = logging.getLogger('MasterNode')
     
     def start(self):
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_socket.bind(('0.0.0.0', self.port))
-        self.server_socket.listen(10)
+        asyncio.run(self.serve())
+    
+    async def serve(self):
+        self.server = await self.transport.start_server(
+            self.handle_connection, self.port,
+            limit=MAX_HEADER_SIZE, backlog=1024
+        )
         
         self.logger.info(f"Master node started on port {self.port}")
         
-        # Start health check thread
-        health_thread = threading.Thread(target=self.health_check_loop)
-        health_thread.daemon = True
-        health_thread.start()
-        
-        # Accept connections
-        while self.running:
-            try:
-                client_socket, address = self.server_socket.accept()
-                self.executor.submit(self.handle_connection, client_socket, address)
-            except Exception as e:
-                if self.running:
-                    self.logger.error(f"Error accepting connection: {e}")
+        health_task = asyncio.create_task(self.health_check_loop())
+        speculation_task = asyncio.create_task(self.speculation_loop())
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            health_task.cancel()
+            speculation_task.cancel()
     
-    def handle_connection(self, client_socket: socket.socket, address: tuple):
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # The transport turns off Nagle's algorithm, so small pipelined
+        # requests and replies do not wait
+        address = self.transport.peer_address(writer)
         try:
-            # Receive data with larger buffer and handle partial messages
-            buffer = ""
-            while True:
-                chunk = client_socket.recv(8192).decode()
-                if not chunk:
-                    break
-                buffer += chunk
-                if '\n' in buffer:
-                    data, _ = buffer.split('\n', 1)
-                    break
-            
-            if not buffer:
+            message_reader = AsyncMessageReader(reader, self.executor, metrics=self.metrics)
+            message = await message_reader.read_message()
+            if message is None:
+                writer.close()
                 return
             
-            message = Message.from_json(data if '\n' in buffer else buffer)
-            
             if message.type == MessageType.REGISTER_WORKER:
-                self.handle_worker_registration(message, client_socket, address)
+                await self.handle_worker_registration(message, writer, address, message_reader)
             else:
-                self.handle_client_request(message, client_socket)
+                await self.handle_client_request(message, ClientConnection(message_reader, writer))
         except Exception as e:
             self.logger.error(f"Error handling connection: {e}")
-            client_socket.close()
+            writer.close()
     
-    def handle_worker_registration(self, message: Message, worker_socket: socket.socket, address: tuple):
+    async def handle_worker_registration(self, message: Message, writer: asyncio.StreamWriter, address: tuple,
+                                         reader: AsyncMessageReader):
         worker_id = message.from_node
         data = message.data
         
+        # A restarted worker may register before its old connection is noticed as dead
+        previous = self.workers.get(worker_id)
+        if previous is not None and previous.alive:
+            self.logger.warning(f"Worker {worker_id} registered again; failing its previous connection")
+            previous.alive = False
+            self.handle_worker_failure(worker_id)
+            previous.writer.close()
+        
         worker = WorkerInfo(
             worker_id=worker_id,
-            socket=worker_socket,
+            writer=writer,
             address=address,
             cores=data['cores'],
             memory=data['memory'],
-            last_heartbeat=time.time()
+            last_heartbeat=time.time(),
+            reader=reader,
+            free_memory=data.get('freeMemory', data['memory']),
+            outbox=asyncio.Queue(self.OUTBOX_SIZE),
+            peer_port=data.get('peerPort'),
+            codecs=tuple(codec for codec in data.get('codecs', []) if codec in CODECS) if self.codec_policy else (),
+            binary=bool(data.get('binary', False)),
+            acks=bool(data.get('acks', False)),
+            reports_metrics=bool(data.get('metrics', False)),
+            metrics=self.metrics,
+            detector=PhiAccrualFailureDetector(data.get('heartbeatInterval', self.DEFAULT_HEARTBEAT_INTERVAL),
+                                               self.PHI_THRESHOLD, acceptable_pause=self.ACCEPTABLE_PAUSE)
         )
+        worker.detector.heartbeat(worker.last_heartbeat)
+        reader.progress = worker.touch
+        worker.outbox_task = asyncio.create_task(worker.write_outbox(self.codec_policy, self.executor))
         
         self.workers[worker_id] = worker
+        self.scheduler.add_worker(worker_id, worker.cores)
+        self.segment_index.add_worker(worker_id)
         self.logger.info(f"Worker registered: {worker_id} from {address}")
+        # Tells the worker to return results as binary payloads and with
+        # which codecs; JSON-only workers ignore it
+        worker.send(Message(MessageType.REGISTER_WORKER, "master", worker_id,
+                            {"binary": True, "codecs": list(CODECS) if self.codec_policy else []}))
+        if data.get('segments'):
+            self.reconcile_segments(worker, data['segments'])
         
-        # Start worker message handler
-        self.executor.submit(self.handle_worker_messages, worker)
+        # This connection's coroutine becomes the worker's message handler
+        await self.handle_worker_messages(worker)
     
-    def handle_worker_messages(self, worker: WorkerInfo):
-        try:
-            while worker.alive and self.running:
-                data = worker.socket.recv(8192).decode()
-                if not data:
-                    break
-                
-                message = Message.from_json(data)
-                
-                if message.type == MessageType.HEARTBEAT:
-                    worker.last_heartbeat = time.time()
+    def reconcile_segments(self, worker: WorkerInfo, announced: List[Dict[str, Any]]):
+        """Take back the segments a restarted worker still holds on disk.
+
+        A copy is kept where the segment has lost its primary (it becomes
+        the primary again) or has fewer than REPLICATION_FACTOR copies (a
+        replica, replacing the re-replication still pending); any other copy
+        is stale or surplus and the worker drops it.
+        """
+        verdicts = []
+        for entry in announced:
+            array_id, segment_id = entry['arrayId'], entry['segmentId']
+            array = self.int_arrays.get(array_id) or self.double_arrays.get(array_id)
+            segment = self.segment_index.segment(array_id, segment_id)
+            role = "drop"
+            if (array is not None and segment is not None and segment.end_index == entry['endIndex']
+                    and entry['dataType'] == array.data_type):
+                alive = [holder for holder in [segment.worker_id] + segment.replicas
+                         if holder in self.workers and self.workers[holder].alive]
+                if worker.worker_id in alive:
+                    role = "primary" if segment.worker_id == worker.worker_id else "replica"
+                elif segment.worker_id not in alive:
+                    self.segment_index.restore(array_id, segment_id, worker.worker_id)
+                    role = "primary"
+                elif len(alive) < self.REPLICATION_FACTOR:
+                    self.segment_index.add_replica(array_id, segment_id, worker.worker_id)
+                    role = "replica"
+            if role != "drop":
+                self.under_replicated.pop((array_id, segment_id), None)
+            verdicts.append({"arrayId": array_id, "segmentId": segment_id, "role": role})
+        
+        worker.send(Message(MessageType.RECONCILE_SEGMENTS, "master", worker.worker_id, {"segments": verdicts}))
+        kept = sum(verdict['role'] != "drop" for verdict in verdicts)
+        self.logger.info(f"Worker {worker.worker_id} restored {kept} of {len(verdicts)} checkpointed segment(s)")
+    
+    async def handle_worker_messages(self, worker: WorkerInfo):
+        while worker.alive and self.running:
+            try:
+                message = await worker.reader.read_message()
+            except Exception as e:
+                # Only a broken stream means the worker is gone
+                if worker.alive:
+                    self.logger.error(f"Lost connection to worker {worker.worker_id}: {e}")
+                    worker.alive = False
+                    self.handle_worker_failure(worker.worker_id)
+                return
+            if message is None:
+                # A worker that exits closes its socket; no need to wait for heartbeats
+                if worker.alive and self.running:
+                    self.logger.error(f"Worker {worker.worker_id} closed its connection")
+                    worker.alive = False
+                    self.handle_worker_failure(worker.worker_id)
+                return
+            
+            # Any message proves the worker is alive, but only heartbeats
+            # are samples of the arrival interval
+            now = time.time()
+            worker.last_heartbeat = now
+            if message.type == MessageType.HEARTBEAT:
+                worker.detector.heartbeat(now)
+                # From the worker stamping the heartbeat to here: its wait
+                # to be sent, the network and this loop (plus any clock skew)
+                self.metrics.observe("heartbeat.lag", max(now - message.timestamp / 1000, 0.0))
+            else:
+                worker.detector.touch(now)
+            start = time.perf_counter()
+            try:
+                if message.type == MessageType.HEARTBEAT and 'freeMemory' in message.data:
+                    worker.free_memory = message.data['freeMemory']
+                    worker.reserved = 0
                 elif message.type == MessageType.SEGMENT_RESULT:
-                    self.logger.info(f"Received segment result from {worker.worker_id}")
+                    self.logger.info(f"Received segment result from {worker.worker_id} "
+                                     f"({message.data.get('backend', 'thread')} backend)")
+                    self.handle_task_finished(message, worker.worker_id)
+                elif message.type == MessageType.SEGMENT_ACK:
+                    self.handle_segment_ack(message, worker.worker_id)
                 elif message.type == MessageType.RECOVERY_COMPLETE:
                     self.logger.info(f"Recovery completed by {worker.worker_id}")
-        except Exception as e:
-            self.logger.error(f"Lost connection to worker {worker.worker_id}: {e}")
-            worker.alive = False
-            self.handle_worker_failure(worker.worker_id)
+                elif message.type == MessageType.METRICS:
+                    waiter = self.metrics_waiters.pop((message.data['metricsId'], worker.worker_id), None)
+                    if waiter is not None and not waiter.done():
+                        waiter.set_result(message.data['metrics'])
+            except Exception as e:
+                self.logger.error(f"Error handling {message.type} from {worker.worker_id}: {e}")
+            self.metrics.observe(f"handle.{message.type}", time.perf_counter() - start)
     
-    def handle_client_request(self, message: Message, client_socket: socket.socket):
+    async def handle_client_request(self, message: Message, conn: ClientConnection):
+        # Serve requests on this connection until the client closes it. Requests
+        # are handled in arrival order; responses echo the request's requestId.
         try:
-            if message.type == MessageType.CREATE_ARRAY:
-                self.handle_create_array(message, client_socket)
-            elif message.type == MessageType.APPLY_OPERATION:
-                self.handle_apply_operation(message, client_socket)
-            elif message.type == MessageType.GET_RESULT:
-                self.handle_get_result(message, client_socket)
+            while message is not None:
+                start = time.perf_counter()
+                if message.type == MessageType.CREATE_ARRAY and message.data.get('streaming'):
+                    await self.handle_streaming_create_array(message, conn)
+                elif message.type == MessageType.CREATE_ARRAY:
+                    await self.handle_create_array(message, conn)
+                elif message.type == MessageType.APPLY_OPERATION:
+                    await self.handle_apply_operation(message, conn)
+                elif message.type == MessageType.EXECUTE_PLAN:
+                    await self.handle_execute_plan(message, conn)
+                elif message.type == MessageType.GET_RESULT:
+                    await self.handle_get_result(message, conn)
+                elif message.type == MessageType.METRICS:
+                    await self.handle_metrics(message, conn)
+                elif message.type == MessageType.GET_TRACE:
+                    await self.handle_get_trace(message, conn)
+                self.metrics.observe(f"handle.{message.type}", time.perf_counter() - start)
+                message = await conn.reader.read_message()
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            self.logger.info(f"Client connection closed: {e}")
         finally:
-            client_socket.close()
+            conn.writer.close()
+    
+    async def reply(self, conn: ClientConnection, request: Message, data: Dict[str, Any], payload=None,
+                    offload: bool = False, inline: Optional[str] = None):
+        """Answer ``request``. With ``inline`` the payload is sent as a JSON
+        list in that field of the data instead; with ``offload`` the header
+        is built (list included) off the event loop."""
+        response = Message(
+            MessageType.OPERATION_COMPLETE,
+            "master",
+            request.from_node,
+            data,
+            payload=payload,
+            request_id=request.request_id
+        )
+        
+        def encode() -> bytes:
+            if inline is not None:
+                response.data = dict(response.data, **{inline: response.payload.tolist()})
+                response.payload = None
+            return encode_header(response)
+        
+        start = time.perf_counter()
+        if offload:
+            # Large JSON bodies are serialized off the event loop
+            header = await asyncio.get_running_loop().run_in_executor(self.executor, encode)
+        else:
+            header = encode()
+        write_message(conn.writer, response, header)
+        self.metrics.message_sent(response.type, len(header) + response.wire_nbytes(), time.perf_counter() - start)
+        await conn.writer.drain()
     
-    def handle_create_array(self, message: Message, client_socket: socket.socket):
+    async def drain_workers(self, workers: Iterable[WorkerInfo]):
+        await asyncio.gather(*(worker.drain() for worker in workers))
+    
+    def place_array(self, array, streaming: bool = False):
+        """Assign the array's segments and replicas by worker capacity.
+
+        Raises ``PlacementError`` when the alive workers cannot hold the array
+        with ``REPLICATION_FACTOR`` copies; nothing is reserved in that case.
+        Streamed arrays only go to workers that read binary SEGMENT_CHUNKs.
+        """
+        workers = [worker for worker in self.workers.values()
+                   if worker.alive and (worker.binary or not streaming)]
+        array.segments = plan_placement(array.total_size, array.dtype.itemsize,
+                                        [worker.capacity() for worker in workers],
+                                        self.PARTITIONS_PER_CORE, self.REPLICATION_FACTOR)
+        for segment in array.segments:
+            nbytes = (segment.end_index - segment.start_index) * array.dtype.itemsize
+            for worker_id in [segment.worker_id] + segment.replicas:
+                self.workers[worker_id].reserved += nbytes
+        self.segment_index.add_array(array.array_id, array.segments, array.dtype.itemsize)
+    
+    async def handle_create_array(self, message: Message, conn: ClientConnection):
         data = message.data
         array_id = data['arrayId']
         data_type = data['dataType']
         values = data['values']
         
-        if data_type == 'int':
-            darray = DArrayInt(array_id, values)
-            darray.segment_array(len(self.workers))
-            self.int_arrays[array_id] = darray
-            self.distribute_int_array(darray)
-        else:
-            darray = DArrayDouble(array_id, values)
-            darray.segment_array(len(self.workers))
-            self.double_arrays[array_id] = darray
-            self.distribute_double_array(darray)
+        # Converting a JSON list of values is CPU-bound; keep it off the loop
+        loop = asyncio.get_running_loop()
+        array_class = DArrayInt if data_type == 'int' else DArrayDouble
+        darray = await loop.run_in_executor(self.executor, array_class, array_id, values)
+        try:
+            self.place_array(darray)
+        except PlacementError as e:
+            self.logger.error(f"Cannot place array {array_id}: {e}")
+            await self.reply(conn, message, {"status": "error", "arrayId": array_id, "error": str(e)})
+            return
         
-        response = Message(
-            MessageType.OPERATION_COMPLETE,
-            "master",
-            message.from_node,
-            {"status": "created", "arrayId": array_id}
-        )
-        client_socket.send(response.to_json().encode() + b'\n')
+        distribution = self.expect_acks(darray)
+        arrays = self.int_arrays if data_type == 'int' else self.double_arrays
+        arrays[array_id] = darray
+        await self.distribute_array(darray)
+        
+        await self.reply_when_stored(conn, message, distribution)
     
-    def distribute_int_array(self, array: DArrayInt):
-        worker_list = list(self.workers.values())
-        if not worker_list:
-            self.logger.error("No workers available for distribution")
+    async def handle_streaming_create_array(self, message: Message, conn: ClientConnection):
+        """Create an array whose values arrive afterwards as ARRAY_CHUNK messages.
+
+        The master only keeps the segment map: each chunk is sliced along
+        segment boundaries and forwarded to the segment's primary and replicas,
+        which have preallocated their buffers. The full array never exists here.
+        """
+        data = message.data
+        array_id = data['arrayId']
+        data_type = data['dataType']
+        total_size = data['totalSize']
+        
+        array_class = DArrayInt if data_type == 'int' else DArrayDouble
+        darray = array_class(array_id, None, total_size)
+        try:
+            self.place_array(darray, streaming=True)
+        except PlacementError as e:
+            self.logger.error(f"Cannot place array {array_id}: {e}")
+            # The chunks are already on their way; consume them before replying
+            await self.discard_chunks(conn, total_size)
+            await self.reply(conn, message, {"status": "error", "arrayId": array_id, "error": str(e)})
             return
         
-        worker_index = 0
-        self.segment_replicas[array.array_id] = {}
+        distribution = self.expect_acks(darray)
+        arrays = self.int_arrays if data_type == 'int' else self.double_arrays
+        arrays[array_id] = darray
+        await self.distribute_array(darray)
         
-        for segment in array.segments:
-            if worker_index >= len(worker_list):
-                worker_index = 0
-            
-            primary_worker = worker_list[worker_index]
-            segment_data = array.get_segment_data(segment.start_index, segment.end_index)
-            
-            # Send to primary worker
-            msg_data = {
-                "arrayId": array.array_id,
-                "segmentId": segment.start_index,
-                "startIndex": segment.start_index,
-                "endIndex": segment.end_index,
-                "dataType": "int",
-                "data": segment_data.tolist(),
-                "isPrimary": True
-            }
-            
-            distribute_msg = Message(
-                MessageType.DISTRIBUTE_ARRAY,
-                "master",
-                primary_worker.worker_id,
-                msg_data
-            )
-            
-            primary_worker.socket.send(distribute_msg.to_json().encode() + b'\n')
-            segment.worker_id = primary_worker.worker_id
-            
-            # Track primary assignment
-            if primary_worker.worker_id not in self.worker_segments:
-                self.worker_segments[primary_worker.worker_id] = set()
-            self.worker_segments[primary_worker.worker_id].add(segment.start_index)
+        received = 0
+        while received < total_size:
+            chunk_msg = await conn.reader.read_message()
+            if chunk_msg is None:
+                self.logger.error(f"Client disconnected after {received}/{total_size} elements of {array_id}")
+                await self.discard_array(darray)
+                return
+            if chunk_msg.type != MessageType.ARRAY_CHUNK or chunk_msg.payload is None:
+                await self.abort_stream(conn, message, darray,
+                                        f"Unexpected {chunk_msg.type} while streaming {array_id}")
+                return
             
-            # Send replicas
-            replicas = []
-            for i in range(1, self.REPLICATION_FACTOR):
-                if len(worker_list) > 1:
-                    replica_index = (worker_index + i) % len(worker_list)
-                    replica_worker = worker_list[replica_index]
-                    
-                    # Don't replicate to the same worker
-                    if replica_worker.worker_id != primary_worker.worker_id:
-                        msg_data["isPrimary"] = False
-                        replicate_msg = Message(
-                            MessageType.REPLICATE_DATA,
-                            "master",
-                            replica_worker.worker_id,
-                            msg_data
-                        )
-                        replica_worker.socket.send(replicate_msg.to_json().encode() + b'\n')
-                        
-                        replicas.append(replica_worker.worker_id)
-                        segment.replicas.append(replica_worker.worker_id)
-                        self.logger.info(f"Replicated segment {segment.start_index} to {replica_worker.worker_id}")
+            offset = chunk_msg.data['offset']
+            values = np.asarray(chunk_msg.payload, dtype=darray.dtype)
+            received += len(values)
+            if offset < 0 or offset + len(values) > total_size:
+                # The rest of the stream is still coming; skip it before replying
+                await self.discard_chunks(conn, total_size - received)
+                await self.abort_stream(conn, message, darray,
+                                        f"Chunk [{offset}, {offset + len(values)}) is outside array {array_id}")
+                return
             
-            self.segment_replicas[array.array_id][segment.start_index] = replicas
-            worker_index += 1
+            # Waits only if a target's outbox is full, so the master buffers
+            # a few chunks per worker and workers are written concurrently
+            await self.route_array_chunk(darray, offset, values)
+        
+        self.logger.info(f"Streamed {total_size} elements of {array_id} to workers")
+        await self.reply_when_stored(conn, message, distribution)
     
-    def distribute_double_array(self, array: DArrayDouble):
-        worker_list = list(self.workers.values())
-        if not worker_list:
-            self.logger.error("No workers available for distribution")
-            return
+    async def abort_stream(self, conn: ClientConnection, message: Message, array, error: str):
+        self.logger.error(error)
+        await self.discard_array(array)
+        await self.reply(conn, message, {"status": "error", "arrayId": array.array_id, "error": error})
+    
+    async def discard_array(self, array):
+        """Undo ``place_array`` and the distribution of an array that was not completed."""
+        array_id = array.array_id
+        self.int_arrays.pop(array_id, None)
+        self.double_arrays.pop(array_id, None)
+        self.distributions.pop(array_id, None)
+        holders = set()
+        for segment in array.segments:
+            nbytes = (segment.end_index - segment.start_index) * array.dtype.itemsize
+            for worker_id in [segment.worker_id] + segment.replicas:
+                holders.add(worker_id)
+                if worker_id in self.workers:
+                    self.workers[worker_id].reserved = max(self.workers[worker_id].reserved - nbytes, 0)
+            self.under_replicated.pop((array_id, segment.start_index), None)
+        self.segment_index.remove_array(array_id, array.segments)
         
-        worker_index = 0
-        self.segment_replicas[array.array_id] = {}
+        # Behind whatever segments and chunks are still queued for the worker
+        for worker_id in sorted(holders):
+            worker = self.workers.get(worker_id)
+            if worker is not None and worker.alive:
+                await worker.enqueue(Message(MessageType.DROP_ARRAY, "master", worker_id, {"arrayId": array_id}))
+        self.logger.info(f"Discarded array {array_id}")
+    
+    def expect_acks(self, array) -> Distribution:
+        # Registered before anything is sent, so no acknowledgement can be
+        # missed. Workers that never acknowledge (the Java worker) are not
+        # waited for
+        pending = {(segment.start_index, worker_id) for segment in array.segments
+                   for worker_id in [segment.worker_id] + list(segment.replicas)
+                   if self.workers[worker_id].acks}
+        distribution = Distribution(array.array_id, pending)
+        if not pending:
+            distribution.done.set()
+        self.distributions[array.array_id] = distribution
+        return distribution
+    
+    def handle_segment_ack(self, message: Message, worker_id: str):
+        data = message.data
+        distribution = self.distributions.get(data['arrayId'])
+        if distribution is None:
+            # e.g. a replica re-created after a failure
+            return
+        distribution.pending.discard((data['segmentId'], worker_id))
+        if not distribution.pending:
+            distribution.done.set()
+    
+    async def reply_when_stored(self, conn: ClientConnection, message: Message, distribution: Distribution):
+        array_id = distribution.array_id
+        try:
+            await asyncio.wait_for(distribution.done.wait(), self.ACK_TIMEOUT)
+        except asyncio.TimeoutError:
+            distribution.error = f"{len(distribution.pending)} segment copies were not acknowledged"
+        finally:
+            self.distributions.pop(array_id, None)
         
+        if distribution.error is not None:
+            self.logger.error(f"Distribution of {array_id} failed: {distribution.error}")
+            await self.reply(conn, message, {"status": "error", "arrayId": array_id, "error": distribution.error})
+        else:
+            await self.reply(conn, message, {"status": "created", "arrayId": array_id})
+    
+    async def discard_chunks(self, conn: ClientConnection, total_size: int):
+        received = 0
+        while received < total_size:
+            chunk_msg = await conn.reader.read_message()
+            if chunk_msg is None or chunk_msg.type != MessageType.ARRAY_CHUNK or chunk_msg.payload is None:
+                return
+            received += len(chunk_msg.payload)
+    
+    def replica_chain(self, segment) -> Optional[List[Dict[str, Any]]]:
+        """Peer addresses of a segment's replicas, in chain order, or None if
+        some holder cannot take part and the master must send every copy."""
+        primary = self.workers.get(segment.worker_id)
+        replicas = [self.workers.get(replica_id) for replica_id in segment.replicas]
+        if primary is None or primary.peer_port is None:
+            return None
+        if any(replica is None or replica.peer_port is None for replica in replicas):
+            return None
+        return [replica.peer_address() for replica in replicas]
+    
+    async def route_array_chunk(self, array, offset: int, values: np.ndarray):
+        for segment, lo, hi in overlapping_segments(array.segments, offset, offset + len(values)):
+            chunk = values[lo - offset:hi - offset]
+            targets = [(segment.worker_id, True)]
+            if self.replica_chain(segment) is None:
+                targets += [(replica_id, False) for replica_id in segment.replicas]
+            for worker_id, is_primary in targets:
+                worker = self.workers.get(worker_id)
+                if worker is None or not worker.alive:
+                    continue
+                chunk_msg = Message(
+                    MessageType.SEGMENT_CHUNK,
+                    "master",
+                    worker_id,
+                    {
+                        "arrayId": array.array_id,
+                        "segmentId": segment.start_index,
+                        "offset": lo - segment.start_index,
+                        "isPrimary": is_primary
+                    },
+                    payload=chunk
+                )
+                await worker.enqueue(chunk_msg)
+    
+    async def distribute_array(self, array):
+        # Segments and replicas were assigned (and indexed) by place_array
         for segment in array.segments:
-            if worker_index >= len(worker_list):
-                worker_index = 0
-            
-            primary_worker = worker_list[worker_index]
+            primary_worker = self.workers[segment.worker_id]
             segment_data = array.get_segment_data(segment.start_index, segment.end_index)
             
             # Send to primary worker
@@ -263,238 +727,533 @@ class MasterNode:
                 "segmentId": segment.start_index,
                 "startIndex": segment.start_index,
                 "endIndex": segment.end_index,
-                "dataType": "double",
-                "data": segment_data.tolist(),
+                "dataType": array.data_type,
                 "isPrimary": True
             }
+            if segment_data is None:
+                # Streamed array: the worker preallocates and receives SEGMENT_CHUNKs
+                msg_data["streaming"] = True
+            # The primary passes the data on to the replicas, so the master
+            # sends each byte once
+            chain = self.replica_chain(segment)
+            if chain:
+                msg_data["replicaChain"] = chain
             
             distribute_msg = Message(
                 MessageType.DISTRIBUTE_ARRAY,
                 "master",
                 primary_worker.worker_id,
-                msg_data
+                msg_data,
+                payload=segment_data
             )
             
-            primary_worker.socket.send(distribute_msg.to_json().encode() + b'\n')
-            segment.worker_id = primary_worker.worker_id
+            await primary_worker.enqueue(distribute_msg)
             
-            # Track primary assignment
-            if primary_worker.worker_id not in self.worker_segments:
-                self.worker_segments[primary_worker.worker_id] = set()
-            self.worker_segments[primary_worker.worker_id].add(segment.start_index)
-            
-            # Send replicas
-            replicas = []
-            for i in range(1, self.REPLICATION_FACTOR):
-                if len(worker_list) > 1:
-                    replica_index = (worker_index + i) % len(worker_list)
-                    replica_worker = worker_list[replica_index]
-                    
-                    # Don't replicate to the same worker
-                    if replica_worker.worker_id != primary_worker.worker_id:
-                        msg_data["isPrimary"] = False
-                        replicate_msg = Message(
-                            MessageType.REPLICATE_DATA,
-                            "master",
-                            replica_worker.worker_id,
-                            msg_data
-                        )
-                        replica_worker.socket.send(replicate_msg.to_json().encode() + b'\n')
-                        
-                        replicas.append(replica_worker.worker_id)
-                        segment.replicas.append(replica_worker.worker_id)
-                        self.logger.info(f"Replicated segment {segment.start_index} to {replica_worker.worker_id}")
-            
-            self.segment_replicas[array.array_id][segment.start_index] = replicas
-            worker_index += 1
+            # Send replicas ourselves when they cannot be chained; queued
+            # messages are encoded later, so they get their own data
+            msg_data = dict(msg_data, isPrimary=False)
+            for replica_id in (segment.replicas if chain is None else []):
+                replica_worker = self.workers[replica_id]
+                replicate_msg = Message(
+                    MessageType.REPLICATE_DATA,
+                    "master",
+                    replica_worker.worker_id,
+                    msg_data,
+                    payload=segment_data
+                )
+                await replica_worker.enqueue(replicate_msg)
+                self.logger.info(f"Replicating segment {segment.start_index} to {replica_worker.worker_id}")
     
-    def handle_apply_operation(self, message: Message, client_socket: socket.socket):
+    async def handle_apply_operation(self, message: Message, conn: ClientConnection):
         data = message.data
         array_id = data['arrayId']
         operation = data['operation']
+        backend = data.get('backend', 'thread')
         
-        for worker in self.workers.values():
-            if worker.alive:
-                process_msg = Message(
-                    MessageType.PROCESS_SEGMENT,
-                    "master",
-                    worker.worker_id,
-                    {"arrayId": array_id, "operation": operation}
-                )
-                worker.socket.send(process_msg.to_json().encode() + b'\n')
+        array = self.int_arrays.get(array_id) or self.double_arrays.get(array_id)
+        if array is None:
+            await self.reply(conn, message, {"status": "error", "arrayId": array_id,
+                                             "error": f"Unknown array {array_id}"})
+            return
         
-        response = Message(
-            MessageType.OPERATION_COMPLETE,
-            "master",
-            message.from_node,
-            {"status": "processing", "arrayId": array_id}
+        # Reject operations no worker could run here rather than on every worker
+        kernel = kernels.KERNELS.get(operation)
+        error = None
+        if kernel is None:
+            error = f"Unknown operation: {operation}"
+        elif kernel.input_dtype != array.dtype:
+            error = (f"{operation} takes {kernel.data_type} arrays; "
+                     f"{array_id} is {'int' if array.dtype == np.int32 else 'double'}")
+        elif backend not in BACKENDS:
+            error = f"Unknown execution backend: {backend}"
+        if error is not None:
+            await self.reply(conn, message, {"status": "error", "arrayId": array_id, "error": error})
+            return
+        
+        job = self.create_job(array, operation, trace_id=message.trace_id)
+        self.submit_tasks(array, job, {"arrayId": array_id, "operation": operation,
+                                       "backend": backend, "jobId": job.job_id})
+        await self.drain_workers(self.workers.values())
+        
+        await self.reply(conn, message, {"status": "processing", "arrayId": array_id, "jobId": job.job_id,
+                                         "traceId": job.trace.trace_id})
+    
+    async def handle_execute_plan(self, message: Message, conn: ClientConnection):
+        data = message.data
+        array_id = data['arrayId']
+        backend = data.get('backend', 'thread')
+        
+        array = self.int_arrays.get(array_id) or self.double_arrays.get(array_id)
+        if array is None:
+            await self.reply(conn, message, {"status": "error", "arrayId": array_id,
+                                             "error": f"Unknown array {array_id}"})
+            return
+        
+        # Reject malformed plans here rather than on every worker
+        try:
+            plan = Plan.from_dict(data['plan'], array.dtype)
+            if backend not in BACKENDS:
+                raise ValueError(f"Unknown execution backend: {backend}")
+        except (KeyError, ValueError) as e:
+            await self.reply(conn, message, {"status": "error", "arrayId": array_id, "error": str(e)})
+            return
+        
+        job = self.create_job(array, "plan", action=plan.action, trace_id=message.trace_id)
+        if not job.pending:
+            # Nothing to run: the answer is the plan over no elements
+            job.result = plan.run_range(np.empty(0, dtype=array.dtype), 0, 0)
+        self.submit_tasks(array, job, {"arrayId": array_id, "operation": "plan", "plan": plan.to_dict(),
+                                       "backend": backend, "jobId": job.job_id})
+        await self.drain_workers(self.workers.values())
+        
+        await self.reply(conn, message, {"status": "processing", "arrayId": array_id, "jobId": job.job_id,
+                                         "traceId": job.trace.trace_id})
+    
+    def create_job(self, array, operation: str, action: Optional[str] = None,
+                   trace_id: Optional[str] = None) -> Job:
+        kernel = kernels.KERNELS.get(operation)
+        dtype = kernel.output_dtype if kernel else array.dtype
+        
+        job = Job(
+            job_id=f"{array.array_id}-{next(self.job_counter)}",
+            array_id=array.array_id,
+            operation=operation,
+            result=np.empty(array.total_size, dtype=dtype) if action is None else None,
+            segment_ends={segment.start_index: segment.end_index for segment in array.segments},
+            pending={segment.start_index for segment in array.segments},
+            started_at=time.time(),
+            action=action
         )
-        client_socket.send(response.to_json().encode() + b'\n')
+        # Clients may pass their own trace id to find the job's trace by
+        job.trace = Trace(trace_id or new_trace_id(), job.job_id, array.array_id,
+                          operation if action is None else f"plan.{action}")
+        self.traces[job.trace.trace_id] = job.trace
+        while len(self.traces) > self.TRACE_HISTORY:
+            self.traces.popitem(last=False)
+        self.jobs[job.job_id] = job
+        self.latest_jobs[array.array_id] = job
+        if not job.pending:
+            # An empty array has no partitions to wait for
+            self.finish_job(job)
+        return job
     
-    def handle_get_result(self, message: Message, client_socket: socket.socket):
-        response = Message(
-            MessageType.OPERATION_COMPLETE,
+    def finish_job(self, job: Job):
+        job.finished_at = time.time()
+        job.done.set()
+        self.finished_jobs.append((job.finished_at, job.job_id))
+    
+    def evict_jobs(self, now: float):
+        while self.finished_jobs and now - self.finished_jobs[0][0] >= self.JOB_TTL:
+            _, job_id = self.finished_jobs.popleft()
+            self.jobs.pop(job_id, None)
+    
+    def submit_tasks(self, array, job: Job, spec: Dict[str, Any]):
+        """Queue one task per partition of ``array`` and start as many as there are free cores.
+
+        JSON-only workers only run the partition they hold as primary, so
+        they neither steal nor back up the partitions they are replicas of.
+        """
+        tasks = [Task(job.job_id, segment.start_index,
+                      [segment.worker_id] + [worker_id for worker_id in segment.replicas
+                                             if worker_id in self.workers and self.workers[worker_id].binary],
+                      spec, size=segment.end_index - segment.start_index)
+                 for segment in array.segments]
+        self.scheduler.submit(tasks)
+        self.dispatch()
+    
+    def dispatch(self):
+        for task in self.scheduler.assignments() + self.scheduler.speculate():
+            worker = self.workers.get(task.worker_id)
+            if worker is None or not worker.alive:
+                self.fail_job(self.scheduler.fail(task.job_id, task.segment_id, task.worker_id))
+                continue
+            job = self.jobs.get(task.job_id)
+            if task.stolen:
+                if job is not None:
+                    job.stolen += 1
+                self.logger.info(f"{task.worker_id} steals segment {task.segment_id} of {task.job_id} "
+                                 f"from {task.holders[0]}")
+            elif task.speculative:
+                if job is not None:
+                    job.speculated += 1
+                self.logger.info(f"Speculating segment {task.segment_id} of {task.job_id} on {task.worker_id}")
+            worker.send(Message(
+                MessageType.PROCESS_SEGMENT,
+                "master",
+                worker.worker_id,
+                dict(task.spec, segmentIds=[task.segment_id]),
+                trace_id=job.trace.trace_id if job is not None else None
+            ))
+    
+    def handle_task_finished(self, message: Message, worker_id: str):
+        data = message.data
+        job_id = data.get('jobId')
+        if job_id is None:
+            # Workers that do not echo the jobId (the Java worker) report the
+            # task they have been running longest on the array
+            task = next((task for task in self.scheduler.running_on(worker_id)
+                         if task.spec.get("arrayId") == data.get('arrayId')), None)
+            if task is None:
+                self.logger.warning(f"{worker_id} reported segment {data['segmentId']} of array "
+                                    f"{data.get('arrayId')} without running a task on it")
+                return
+            job_id = task.job_id
+            if task.segment_id != data['segmentId']:
+                # It ran something else; the partition goes to another holder
+                self.logger.error(f"{worker_id} answered segment {task.segment_id} of {job_id} "
+                                  f"with segment {data['segmentId']}")
+                self.fail_job(self.scheduler.fail(job_id, task.segment_id, worker_id))
+                self.dispatch()
+                return
+        
+        if data.get('status') == 'failed':
+            self.logger.warning(f"{worker_id} could not run segment {data['segmentId']} of {job_id}")
+            self.fail_job(self.scheduler.fail(job_id, data['segmentId'], worker_id))
+        else:
+            arrived = time.time()
+            winner, losers = self.scheduler.complete(job_id, data['segmentId'], worker_id)
+            for loser in losers:
+                self.cancel_task(loser)
+            job = self.jobs.get(job_id)
+            if winner is None:
+                # Not a partition this worker was sent (or one already done):
+                # merging it could write over another segment's result
+                self.logger.info(f"Ignoring result for segment {data['segmentId']} of {job_id} "
+                                 f"from {worker_id}: no such task is running there")
+            else:
+                if winner.speculative and job is not None:
+                    job.speculation_wins += 1
+                self.handle_segment_result(message, job_id)
+                if job is not None:
+                    # Workers that predate tracing send no timing; their part is one span
+                    job.trace.add_segment(winner.segment_id, worker_id, job.started_at, winner.started_at,
+                                          arrived, data.get('timing'), stolen=winner.stolen,
+                                          speculative=winner.speculative)
+                    job.trace.add("merge", "master", arrived, time.time(), winner.segment_id)
+        # The freed core picks up the next queued partition
+        self.dispatch()
+    
+    def fail_job(self, task: Optional[Task]):
+        # ``task`` is a partition no holder is left to run, as the scheduler reports it
+        if task is None:
+            return
+        job = self.jobs.get(task.job_id)
+        if job is None or job.done.is_set():
+            return
+        job.error = f"No worker can run segment {task.segment_id} of {task.job_id}"
+        self.finish_job(job)
+        self.logger.error(f"Job {job.job_id} failed: {job.error}")
+    
+    def cancel_task(self, task: Task):
+        worker = self.workers.get(task.worker_id)
+        if worker is None or not worker.alive:
+            return
+        worker.send(Message(
+            MessageType.CANCEL_TASK,
             "master",
-            message.from_node,
-            {"status": "complete", "result": "Operation completed successfully"}
-        )
-        client_socket.send(response.to_json().encode() + b'\n')
+            worker.worker_id,
+            {"arrayId": task.spec["arrayId"], "jobId": task.job_id, "segmentIds": [task.segment_id]}
+        ))
     
-    def health_check_loop(self):
+    async def speculation_loop(self):
+        # Stragglers are found by elapsed time, so check even when no result arrives
         while self.running:
-            time.sleep(5)
+            await asyncio.sleep(self.SPECULATION_INTERVAL)
+            if self.scheduler.running:
+                self.dispatch()
+    
+    def handle_segment_result(self, message: Message, job_id: str):
+        data = message.data
+        # Results of a forgotten job are dropped
+        job = self.jobs.get(job_id)
+        if job is None:
+            self.logger.warning(f"Segment result for unknown job on array {data['arrayId']}")
+            return
+        
+        segment_id = data['segmentId']
+        values = message.payload if message.payload is not None else data['data']
+        start = segment_id
+        end = job.segment_ends.get(segment_id)
+        if end is None or (job.action is None and len(values) != end - start):
+            self.logger.error(f"Result for segment {segment_id} of {job.job_id} does not match the segment map")
+            return
+        
+        if job.error is not None:
+            return
+        if segment_id not in job.pending:
+            # A segment reported twice (e.g. after recovery) must not be counted twice
+            self.logger.info(f"Ignoring duplicate result for segment {segment_id} of {job.job_id}")
+            return
+        
+        if job.action is None:
+            job.result[start:end] = values
+        elif job.action == "collect":
+            job.partials[segment_id] = np.asarray(values)
+        else:
+            # Aggregates are folded in as they arrive, so the master holds one
+            # partial per job however many workers report
+            partial = np.asarray(values)
+            job.result = partial if job.result is None else combine(job.action, [job.result, partial])
+        job.pending.discard(segment_id)
+        if not job.pending and not job.done.is_set():
+            if job.action == "collect":
+                job.result = combine(job.action, [job.partials[key] for key in sorted(job.partials)])
+                job.partials.clear()
+            self.finish_job(job)
+            self.logger.info(f"Job {job.job_id} completed in "
+                             f"{job.finished_at - job.started_at:.3f}s ({job.stolen} segments stolen, "
+                             f"{job.speculation_wins}/{job.speculated} speculative copies won; "
+                             f"{self.scheduler.speculation_wins}/{self.scheduler.speculated_count} overall)")
+    
+    async def handle_get_result(self, message: Message, conn: ClientConnection):
+        data = message.data
+        array_id = data['arrayId']
+        
+        # Resolve the job now so a pipelined APPLY_OPERATION -> GET_RESULT pair
+        # sees the right job; only the wait for completion is deferred
+        job_id = data.get('jobId')
+        job = self.jobs.get(job_id) if job_id else self.latest_jobs.get(array_id)
+        if job is None and job_id:
+            await self.reply(conn, message, {"status": "error", "arrayId": array_id, "jobId": job_id,
+                                             "error": f"Job {job_id} is unknown or its result was already returned"})
+        elif job is None:
+            await self.reply(conn, message, {"status": "error", "arrayId": array_id,
+                                             "error": f"No operation has been applied to {array_id}"})
+        elif job.done.is_set():
+            await self.send_job_result(message, conn, job)
+        else:
+            asyncio.create_task(self.send_job_result(message, conn, job))
+    
+    async def send_job_result(self, message: Message, conn: ClientConnection, job: Job):
+        data = message.data
+        timeout = data.get('timeout', self.RESULT_TIMEOUT)
+        
+        try:
+            try:
+                if not job.done.is_set():
+                    await asyncio.wait_for(job.done.wait(), timeout)
+            except asyncio.TimeoutError:
+                await self.reply(conn, message, {"status": "timeout", "arrayId": job.array_id,
+                                                 "jobId": job.job_id, "pendingSegments": len(job.pending)})
+                return
+            # Delivered; only the latest job of the array stays reachable, by arrayId
+            self.jobs.pop(job.job_id, None)
+            if job.error is not None:
+                await self.reply(conn, message, {"status": "error", "arrayId": job.array_id,
+                                                 "jobId": job.job_id, "error": job.error})
+                return
+            
+            response_data = {"status": "complete", "arrayId": job.array_id, "jobId": job.job_id,
+                             "traceId": job.trace.trace_id,
+                             "operation": job.operation,
+                             "elapsed": job.finished_at - job.started_at,
+                             "stolenTasks": job.stolen,
+                             "speculativeTasks": job.speculated,
+                             "speculationWins": job.speculation_wins}
+            delivering = time.time()
+            if job.action is not None and job.action != "collect":
+                # Aggregates are a handful of numbers; always answer in JSON
+                response_data["action"] = job.action
+                response_data["value"] = finalize(job.action, job.result)
+                await self.reply(conn, message, response_data)
+            elif data.get('binary'):
+                await self.reply(conn, message, response_data, payload=job.result)
+            else:
+                await self.reply(conn, message, response_data, payload=job.result, inline="result",
+                                 offload=job.result.size >= self.OFFLOAD_ELEMENTS)
+            job.trace.add("deliver", "master", delivering, time.time())
+        except OSError as e:
+            self.logger.warning(f"Could not deliver result of {job.job_id}: {e}")
+
+    async def handle_metrics(self, message: Message, conn: ClientConnection):
+        # Workers answer on their own connection, matched by metricsId;
+        # the request goes straight out rather than behind queued segments
+        metrics_id = next(self.metrics_counter)
+        loop = asyncio.get_running_loop()
+        waiters = {}
+        for worker in self.workers.values():
+            if not worker.alive or not worker.reports_metrics:
+                continue
+            waiters[worker.worker_id] = self.metrics_waiters[(metrics_id, worker.worker_id)] = loop.create_future()
+            worker.send(Message(MessageType.METRICS, "master", worker.worker_id, {"metricsId": metrics_id}))
+        await self.drain_workers(self.workers[worker_id] for worker_id in waiters)
+        if waiters:
+            await asyncio.wait(waiters.values(), timeout=self.METRICS_TIMEOUT)
+
+        workers = {}
+        for worker_id, waiter in waiters.items():
+            self.metrics_waiters.pop((metrics_id, worker_id), None)
+            if waiter.done():
+                workers[worker_id] = waiter.result()
+            else:
+                waiter.cancel()
+        missing = sorted(set(waiters) - set(workers))
+        if missing:
+            self.logger.warning(f"No metrics from {', '.join(missing)} within {self.METRICS_TIMEOUT}s")
+        await self.reply(conn, message, {"status": "ok", "master": self.metrics.snapshot(), "workers": workers,
+                                         "cluster": merge_snapshots(workers.values()), "missing": missing},
+                         offload=True)
+
+    async def handle_get_trace(self, message: Message, conn: ClientConnection):
+        # By traceId or jobId, else the latest traced job of arrayId
+        data = message.data
+        trace = None
+        if data.get('traceId'):
+            trace = self.traces.get(data['traceId'])
+        else:
+            for candidate in reversed(self.traces.values()):
+                if (candidate.job_id == data['jobId'] if data.get('jobId')
+                        else candidate.array_id == data.get('arrayId')):
+                    trace = candidate
+                    break
+        if trace is None:
+            await self.reply(conn, message, {"status": "error", "error": "No such trace"})
+            return
+        
+        if data.get('format') == 'chrome':
+            await self.reply(conn, message, {"status": "ok", "trace": trace.to_chrome()}, offload=True)
+        else:
+            await self.reply(conn, message, {"status": "ok", **trace.to_dict()}, offload=True)
+
+    async def health_check_loop(self):
+        while self.running:
+            await asyncio.sleep(self.HEALTH_CHECK_INTERVAL)
             current_time = time.time()
             
             for worker_id, worker in list(self.workers.items()):
-                if worker.alive and (current_time - worker.last_heartbeat) > 10:
-                    self.logger.warning(f"Worker {worker_id} failed health check")
+                if not worker.alive:
+                    continue
+                phi = worker.detector.phi(current_time)
+                if phi >= self.PHI_THRESHOLD:
+                    self.logger.warning(f"Worker {worker_id} failed health check: silent for "
+                                        f"{current_time - worker.last_heartbeat:.2f}s (phi {phi:.1f})")
                     worker.alive = False
                     self.handle_worker_failure(worker_id)
+                    # Fence it off: a worker that was only slow must not keep serving
+                    worker.writer.close()
+            self.rereplicate(current_time)
+            self.evict_jobs(current_time)
     
     def handle_worker_failure(self, worker_id: str):
         self.logger.error(f"Handling failure of worker: {worker_id}")
         
-        # Get segments owned by failed worker
-        failed_segments = self.worker_segments.get(worker_id, set())
+        # Arrays still being distributed to the worker cannot reach their copy count
+        for distribution in self.distributions.values():
+            if any(holder == worker_id for _, holder in distribution.pending):
+                distribution.error = f"Worker {worker_id} failed during distribution"
+                distribution.done.set()
+        
+        # Partitions the worker was running go to the holders that remain
+        for task in self.scheduler.remove_worker(worker_id):
+            self.fail_job(task)
+        self.dispatch()
+        
+        # Only the segments the worker held need attention
+        failed_segments: Dict[str, List[int]] = {}
+        for array_id, segment_id in self.segment_index.remove_worker(worker_id):
+            failed_segments.setdefault(array_id, []).append(segment_id)
+        if worker_id in self.workers:
+            del self.workers[worker_id]
         if not failed_segments:
             self.logger.info(f"No segments to recover from worker {worker_id}")
             return
         
-        # Recover each segment
-        for array_id, array_replicas in self.segment_replicas.items():
-            # Check if this array has segments on the failed worker
-            int_array = self.int_arrays.get(array_id)
-            double_array = self.double_arrays.get(array_id)
-            
-            if int_array:
-                self._recover_int_array_segments(int_array, worker_id, failed_segments, array_replicas)
-            elif double_array:
-                self._recover_double_array_segments(double_array, worker_id, failed_segments, array_replicas)
-        
-        # Remove failed worker from tracking
-        if worker_id in self.worker_segments:
-            del self.worker_segments[worker_id]
-        if worker_id in self.workers:
-            del self.workers[worker_id]
+        for array_id, segment_ids in failed_segments.items():
+            array = self.int_arrays.get(array_id) or self.double_arrays.get(array_id)
+            if array:
+                self._recover_array_segments(array, worker_id, segment_ids)
+        self.rereplicate(time.time())
     
-    def _recover_int_array_segments(self, array: DArrayInt, failed_worker_id: str, 
-                                   failed_segments: set, replicas: Dict[int, List[str]]):
-        for segment in array.segments:
-            if segment.worker_id == failed_worker_id:
-                segment_replicas = replicas.get(segment.start_index, [])
-                if segment_replicas:
-                    # Find first alive replica
-                    for replica_id in segment_replicas:
-                        replica_worker = self.workers.get(replica_id)
-                        if replica_worker and replica_worker.alive:
-                            # Promote replica to primary
-                            promote_data = {
-                                "arrayId": array.array_id,
-                                "segmentId": segment.start_index,
-                                "makePrimary": True
-                            }
-                            
-                            promote_msg = Message(
-                                MessageType.RECOVER_DATA,
-                                "master",
-                                replica_id,
-                                promote_data
-                            )
-                            replica_worker.socket.send(promote_msg.to_json().encode() + b'\n')
-                            
-                            # Update segment assignment
-                            segment.worker_id = replica_id
-                            segment.replicas.remove(replica_id)
-                            if replica_id not in self.worker_segments:
-                                self.worker_segments[replica_id] = set()
-                            self.worker_segments[replica_id].add(segment.start_index)
-                            
-                            self.logger.info(f"Promoted replica {replica_id} for segment "
-                                           f"{segment.start_index} of array {array.array_id}")
-                            
-                            # Create new replica for resilience
-                            self._create_new_replica_int(array, segment)
-                            break
-    
-    def _recover_double_array_segments(self, array: DArrayDouble, failed_worker_id: str,
-                                     failed_segments: set, replicas: Dict[int, List[str]]):
-        for segment in array.segments:
-            if segment.worker_id == failed_worker_id:
-                segment_replicas = replicas.get(segment.start_index, [])
-                if segment_replicas:
-                    # Find first alive replica
-                    for replica_id in segment_replicas:
-                        replica_worker = self.workers.get(replica_id)
-                        if replica_worker and replica_worker.alive:
-                            # Promote replica to primary
-                            promote_data = {
-                                "arrayId": array.array_id,
-                                "segmentId": segment.start_index,
-                                "makePrimary": True
-                            }
-                            
-                            promote_msg = Message(
-                                MessageType.RECOVER_DATA,
-                                "master",
-                                replica_id,
-                                promote_data
-                            )
-                            replica_worker.socket.send(promote_msg.to_json().encode() + b'\n')
-                            
-                            # Update segment assignment
-                            segment.worker_id = replica_id
-                            segment.replicas.remove(replica_id)
-                            if replica_id not in self.worker_segments:
-                                self.worker_segments[replica_id] = set()
-                            self.worker_segments[replica_id].add(segment.start_index)
-                            
-                            self.logger.info(f"Promoted replica {replica_id} for segment "
-                                           f"{segment.start_index} of array {array.array_id}")
-                            
-                            # Create new replica for resilience
-                            self._create_new_replica_double(array, segment)
-                            break
-    
-    def _create_new_replica_int(self, array: DArrayInt, segment):
-        available_workers = [w for w in self.workers.values() 
-                           if w.alive and w.worker_id != segment.worker_id 
-                           and w.worker_id not in segment.replicas]
-        
-        if available_workers:
-            new_replica = available_workers[0]
-            segment_data = array.get_segment_data(segment.start_index, segment.end_index)
-            
-            msg_data = {
-                "arrayId": array.array_id,
-                "segmentId": segment.start_index,
-                "startIndex": segment.start_index,
-                "endIndex": segment.end_index,
-                "dataType": "int",
-                "data": segment_data.tolist(),
-                "isPrimary": False
-            }
-            
-            replicate_msg = Message(
-                MessageType.REPLICATE_DATA,
-                "master",
-                new_replica.worker_id,
-                msg_data
-            )
-            new_replica.socket.send(replicate_msg.to_json().encode() + b'\n')
-            
-            segment.replicas.append(new_replica.worker_id)
-            self.segment_replicas[array.array_id][segment.start_index].append(new_replica.worker_id)
+    def rereplicate(self, now: float):
+        # Give segments that lost a copy REREPLICATION_DELAY ago a new replica
+        for key, since in list(self.under_replicated.items()):
+            if now - since < self.REREPLICATION_DELAY:
+                continue
+            del self.under_replicated[key]
+            segment = self.segment_index.segment(*key)
+            alive = [holder for holder in [segment.worker_id] + segment.replicas
+                     if holder in self.workers and self.workers[holder].alive]
+            if not alive or len(alive) >= self.REPLICATION_FACTOR:
+                continue
+            self._create_new_replica(self.int_arrays.get(key[0]) or self.double_arrays[key[0]], segment)
+    
+    def _recover_array_segments(self, array, failed_worker_id: str, segment_ids: List[int]):
+        for segment_id in segment_ids:
+            segment = self.segment_index.segment(array.array_id, segment_id)
+            if segment.worker_id != failed_worker_id:
+                # Only a replica was lost; the primary still serves the segment
+                self.under_replicated[(array.array_id, segment_id)] = time.time()
+                continue
             
-            self.logger.info(f"Created new replica on {new_replica.worker_id} "
-                           f"for segment {segment.start_index}")
+            # Find first alive replica
+            for replica_id in list(segment.replicas):
+                replica_worker = self.workers.get(replica_id)
+                # A JSON-only worker keeps one primary per array
+                taken = replica_worker is not None and not replica_worker.binary and any(
+                    other.worker_id == replica_id for other in array.segments)
+                if replica_worker and replica_worker.alive and not taken:
+                    # Promote replica to primary
+                    promote_data = {
+                        "arrayId": array.array_id,
+                        "segmentId": segment.start_index,
+                        "makePrimary": True
+                    }
+                    
+                    promote_msg = Message(
+                        MessageType.RECOVER_DATA,
+                        "master",
+                        replica_id,
+                        promote_data
+                    )
+                    replica_worker.send(promote_msg)
+                    
+                    # Update segment assignment
+                    self.segment_index.promote(array.array_id, segment.start_index, replica_id)
+                    
+                    self.logger.info(f"Promoted replica {replica_id} for segment "
+                                   f"{segment.start_index} of array {array.array_id}")
+                    
+                    # A new replica follows once the failed worker had time to come back
+                    self.under_replicated[(array.array_id, segment_id)] = time.time()
+                    break
+            else:
+                self.logger.error(f"Segment {segment.start_index} of array {array.array_id} "
+                                  f"has no surviving copy")
     
-    def _create_new_replica_double(self, array: DArrayDouble, segment):
-        available_workers = [w for w in self.workers.values() 
-                           if w.alive and w.worker_id != segment.worker_id 
-                           and w.worker_id not in segment.replicas]
+    def _create_new_replica(self, array, segment):
+        # The least loaded worker that does not hold the segment yet
+        new_replica_id = self.segment_index.least_loaded(
+            [segment.worker_id] + segment.replicas,
+            lambda worker_id: worker_id in self.workers and self.workers[worker_id].alive)
         
-        if available_workers:
-            new_replica = available_workers[0]
+        if new_replica_id:
+            new_replica = self.workers[new_replica_id]
+            if self._copy_from_holder(array, segment, new_replica):
+                return
+            if array.data is None:
+                self.logger.warning(f"No master copy of streamed array {array.array_id}; "
+                                    f"segment {segment.start_index} stays without a new replica")
+                return
             segment_data = array.get_segment_data(segment.start_index, segment.end_index)
             
             msg_data = {
@@ -502,8 +1261,7 @@ class MasterNode:
                 "segmentId": segment.start_index,
                 "startIndex": segment.start_index,
                 "endIndex": segment.end_index,
-                "dataType": "double",
-                "data": segment_data.tolist(),
+                "dataType": array.data_type,
                 "isPrimary": False
             }
             
@@ -511,25 +1269,52 @@ class MasterNode:
                 MessageType.REPLICATE_DATA,
                 "master",
                 new_replica.worker_id,
-                msg_data
+                msg_data,
+                payload=segment_data
             )
-            new_replica.socket.send(replicate_msg.to_json().encode() + b'\n')
+            # Through the outbox, to be compressed like any other segment
+            asyncio.get_running_loop().create_task(new_replica.enqueue(replicate_msg))
             
-            segment.replicas.append(new_replica.worker_id)
-            self.segment_replicas[array.array_id][segment.start_index].append(new_replica.worker_id)
+            self.segment_index.add_replica(array.array_id, segment.start_index, new_replica.worker_id)
             
             self.logger.info(f"Created new replica on {new_replica.worker_id} "
                            f"for segment {segment.start_index}")
     
+    def _copy_from_holder(self, array, segment, new_replica: WorkerInfo) -> bool:
+        # A surviving holder sends its copy to the new replica directly
+        source = self.workers.get(segment.worker_id)
+        target = new_replica.peer_address()
+        if source is None or not source.alive or source.peer_port is None or target is None:
+            return False
+        
+        copy_msg = Message(
+            MessageType.COPY_SEGMENT,
+            "master",
+            source.worker_id,
+            {"arrayId": array.array_id, "segmentId": segment.start_index, "target": target}
+        )
+        source.send(copy_msg)
+        
+        self.segment_index.add_replica(array.array_id, segment.start_index, new_replica.worker_id)
+        self.logger.info(f"Copying segment {segment.start_index} of {array.array_id} "
+                         f"from {source.worker_id} to new replica {new_replica.worker_id}")
+        return True
+    
     def shutdown(self):
         self.running = False
-        if self.server_socket:
-            self.server_socket.close()
+        if self.server:
+            self.server.close()
         self.executor.shutdown()
 
 def main():
     port = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
-    master = MasterNode(port)
+    partitions_per_core = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    # Scheduling switches and options, e.g. "nosteal nospeculate nocompress phi=10 rereplicate=30"
+    flags = sys.argv[3:]
+    options = dict(flag.split('=', 1) for flag in flags if '=' in flag)
+    master = MasterNode(port, partitions_per_core, 'nosteal' not in flags, 'nospeculate' not in flags,
+                        float(options.get('phi', 8.0)), float(options.get('rereplicate', 5.0)),
+                        'nocompress' not in flags)
     
     try:
         master.start()
@@ -5,31 +5,92 @@ import logging
 import time
 import sys
 import os
+import shutil
+import tempfile
 import numpy as np
 import multiprocessing as mp
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
-from typing import Dict, Any
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Set, Tuple
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from common.message import Message, MessageType
+from common.message import Message, MessageType, MessageReader, send_message
+from common import kernels
+from common.plan import Plan
+from common.segment_store import SegmentStore
+from common.checkpoint import SegmentCheckpoint
+from common.backends import BACKENDS, ExecutionBackend, ThreadBackend
+from common.compression import CODECS, CodecPolicy, LinkMeter
+from common.metrics import MetricsRegistry
+from common.tracing import compute_timing
+from common.transport import TcpTransport
 
 class WorkerNode:
-    def __init__(self, worker_id: str, master_host: str, master_port: int):
+    def __init__(self, worker_id: str, master_host: str, master_port: int, peer_port: int = 0,
+                 heartbeat_interval: float = 0.5, memory_budget: Optional[int] = None,
+                 spill_dir: Optional[str] = None, checkpoint_dir: Optional[str] = None, transport=None):
         self.worker_id = worker_id
         self.master_host = master_host
         self.master_port = master_port
+        # Connections to the master and to peers; TCP unless a cluster runs
+        # in one process or over Unix sockets (see common/transport.py)
+        self.transport = transport or TcpTransport()
         self.cores = mp.cpu_count()
         self.socket = None
-        self.int_segments: Dict[str, np.ndarray] = {}
-        self.double_segments: Dict[str, np.ndarray] = {}
-        
-        # Separate storage for replicas
-        self.int_replicas: Dict[str, np.ndarray] = {}
-        self.double_replicas: Dict[str, np.ndarray] = {}
-        self.is_primary: Dict[str, bool] = {}
+        self.send_lock = threading.Lock()
+        # Advertised at registration; the master's failure detector learns
+        # the actual arrival pattern from there
+        self.heartbeat_interval = heartbeat_interval
+        # Other workers connect here to pass replicas down a replication
+        # chain; port 0 picks a free port, reported to the master
+        self.peer_port = peer_port
+        self.peer_server = None
+        self.peers: Dict[str, socket.socket] = {}
+        self.peer_locks: Dict[str, threading.Lock] = {}
+        self.peers_lock = threading.Lock()
+        # Rest of the replication chain of segments still being streamed in
+        self.chains: Dict[Tuple[str, int], List[Dict[str, Any]]] = {}
+        # Set when the master's reply to REGISTER_WORKER says it reads binary
+        # payloads (JSON lists are kept for masters that only speak JSON)
+        self.binary_results = False
+        # Payloads to the master and to peers are compressed with a codec
+        # the receiver decodes when that gets them across faster; the
+        # master names its codecs in reply to REGISTER_WORKER
+        self.codec_policy = CodecPolicy()
+        self.master_codecs: List[str] = []
+        self.master_link = LinkMeter()
+        self.peer_links: Dict[str, LinkMeter] = {}
+        # Primaries and replicas, any number of partitions per array. With a
+        # memory budget (bytes), cold segments spill to memmap files so a
+        # worker can hold more than its RAM
+        if memory_budget is not None and spill_dir is None:
+            spill_dir = tempfile.mkdtemp(prefix=f"{worker_id}-segments-")
+        self.spill_dir = spill_dir if memory_budget is not None else None
+        self.store = SegmentStore(self.spill_dir, memory_budget, on_spill=self.segments_spilled)
+        # Elements still missing from streamed segments, by (array, segment, is_primary)
+        self.filling: Dict[Tuple[str, int, bool], int] = {}
+        # Complete segments are also written to checkpoint_dir, off the
+        # receive path; a restarted worker reloads them and announces them
+        # at registration instead of having them shipped again
+        self.checkpoint = SegmentCheckpoint(checkpoint_dir) if checkpoint_dir else None
+        self.checkpoint_pool = ThreadPoolExecutor(max_workers=1)
+        self.restored: List[Dict[str, Any]] = []
         
         self.running = True
         self.thread_pool = ThreadPoolExecutor(max_workers=self.cores)
+        # Futures of submitted tasks by (jobId, segmentId), and the tasks the
+        # master cancelled because another copy finished first
+        self.tasks: Dict[Tuple[str, int], Future] = {}
+        self.cancelled: Set[Tuple[str, int]] = set()
+        self.task_lock = threading.Lock()
+        # Kernel execution backends, selectable per operation. Kernel chunks
+        # never run in thread_pool: operations running there wait on them
+        self.backends: Dict[str, ExecutionBackend] = {ThreadBackend.name: ThreadBackend(self.cores)}
+        self.backend_lock = threading.Lock()
+        # Message, compute and queue metrics, sent to the master on METRICS
+        self.metrics = MetricsRegistry()
+        self.metrics.gauge("executor.queued", lambda: self.task_count(running=False))
+        self.metrics.gauge("executor.running", lambda: self.task_count(running=True))
+        self.metrics.gauge("store.bytes", lambda: self.store.nbytes())
         self.setup_logging()
     
     def setup_logging(self):
@@ -45,9 +106,10 @@ class WorkerNode:
     
     def start(self):
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.master_host, self.master_port))
+            self.socket = self.transport.connect(self.master_host, self.master_port)
             
+            self.start_peer_server()
+            self.restore_checkpoint()
             self.register_with_master()
             
             # Start heartbeat thread
@@ -63,12 +125,22 @@ class WorkerNode:
             raise
     
     def register_with_master(self):
+        host, port = self.transport.local_address(self.socket)
         data = {
-            "host": self.socket.getsockname()[0],
-            "port": self.socket.getsockname()[1],
+            "host": host,
+            "port": port,
             "cores": self.cores,
-            "memory": os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+            "memory": os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024),
+            "freeMemory": self.free_memory(),
+            "peerPort": self.peer_port,
+            "heartbeatInterval": self.heartbeat_interval,
+            "binary": True,
+            "acks": True,
+            "metrics": True,
+            "codecs": list(CODECS)
         }
+        if self.checkpoint:
+            data["segments"] = self.restored
         
         register_msg = Message(
             MessageType.REGISTER_WORKER,
@@ -77,9 +149,124 @@ class WorkerNode:
             data
         )
         
-        self.socket.send(register_msg.to_json().encode() + b'\n')
+        self.send_message(register_msg)
         self.logger.info("Registered with master node")
     
+    def restore_checkpoint(self):
+        if not self.checkpoint:
+            return
+        loaded, corrupt = self.checkpoint.load()
+        for entry, segment in loaded:
+            self.store.put(entry['arrayId'], entry['segmentId'], segment, primary=entry['isPrimary'])
+            self.restored.append({
+                "arrayId": entry['arrayId'],
+                "segmentId": entry['segmentId'],
+                "endIndex": entry['segmentId'] + entry['length'],
+                "dataType": entry['dataType'],
+                "isPrimary": entry['isPrimary']
+            })
+        if corrupt:
+            self.logger.warning(f"Discarded {len(corrupt)} checkpointed segment(s) failing their checksum")
+        self.logger.info(f"Restored {len(loaded)} segment(s) from {self.checkpoint.directory}")
+    
+    def start_peer_server(self):
+        self.peer_server, self.peer_port = self.transport.listen(self.peer_port)
+        
+        accept_thread = threading.Thread(target=self.accept_peers)
+        accept_thread.daemon = True
+        accept_thread.start()
+        self.logger.info(f"Listening for peers on port {self.peer_port}")
+    
+    def accept_peers(self):
+        while self.running:
+            try:
+                conn, address = self.peer_server.accept()
+            except OSError:
+                break
+            peer_thread = threading.Thread(target=self.listen_to_peer, args=(conn, address))
+            peer_thread.daemon = True
+            peer_thread.start()
+    
+    def listen_to_peer(self, conn: socket.socket, address: tuple):
+        # Peers only send replicas; they are stored like ones from the master
+        reader = MessageReader(conn, metrics=self.metrics)
+        try:
+            while self.running:
+                message = reader.read_message()
+                if message is None:
+                    break
+                try:
+                    with self.metrics.timer(f"handle.{message.type}"):
+                        self.handle_message(message)
+                except Exception as e:
+                    self.logger.error(f"Error handling {message.type} from peer {message.from_node}: {e}")
+        except Exception as e:
+            self.logger.error(f"Lost peer connection from {address}: {e}")
+        finally:
+            conn.close()
+    
+    def compress(self, message: Message, accepted: List[str], link: LinkMeter):
+        if message.payload is None or message.codec is not None or not accepted:
+            return
+        start = time.perf_counter()
+        codec = self.codec_policy.choose(message.payload, link.rate, accepted)
+        if codec is not None:
+            message.compress(codec)
+        self.metrics.observe(f"compress.{message.type}", time.perf_counter() - start)
+    
+    def send_to_peer(self, peer: Dict[str, Any], message: Message) -> bool:
+        peer_id = peer['workerId']
+        with self.peers_lock:
+            lock = self.peer_locks.setdefault(peer_id, threading.Lock())
+            link = self.peer_links.setdefault(peer_id, LinkMeter())
+        self.compress(message, peer.get('codecs', []), link)
+        with lock:
+            try:
+                sock = self.peers.get(peer_id)
+                if sock is None:
+                    sock = self.transport.connect(peer['host'], peer['port'])
+                    self.peers[peer_id] = sock
+                start = time.perf_counter()
+                send_message(sock, message, self.metrics)
+                link.observe(message.wire_nbytes(), time.perf_counter() - start)
+                return True
+            except OSError as e:
+                self.logger.error(f"Could not send {message.type} to peer {peer_id}: {e}")
+                sock = self.peers.pop(peer_id, None)
+                if sock is not None:
+                    sock.close()
+                return False
+    
+    def forward(self, message: Message, chain: List[Dict[str, Any]]):
+        """Pass received segment data to the next worker of its replication
+        chain, along with the rest of the chain."""
+        if not chain:
+            return
+        data = dict(message.data, isPrimary=False, replicaChain=chain[1:])
+        msg_type = MessageType.SEGMENT_CHUNK if message.type == MessageType.SEGMENT_CHUNK else MessageType.REPLICATE_DATA
+        forwarded = Message(msg_type, self.worker_id, chain[0]['workerId'], data, payload=message.payload)
+        if message.codec in chain[0].get('codecs', []):
+            # Passed on as it arrived, without encoding it again
+            forwarded.codec, forwarded.wire = message.codec, message.wire
+        self.send_to_peer(chain[0], forwarded)
+    
+    def free_memory(self) -> int:
+        # Available physical memory in MB, reported so the master can place by
+        # capacity; a spilling store can also use the free disk behind it
+        free = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES')
+        if self.spill_dir is not None:
+            free += shutil.disk_usage(self.spill_dir).free
+        return free // (1024 * 1024)
+    
+    def send_message(self, message: Message):
+        with self.send_lock:
+            self._send_to_master(message)
+    
+    def _send_to_master(self, message: Message):
+        start = time.perf_counter()
+        send_message(self.socket, message, self.metrics)
+        self.master_link.observe(message.wire_nbytes(), time.perf_counter() - start)
+    
     def heartbeat_loop(self):
         while self.running:
             try:
@@ -87,45 +274,68 @@ class WorkerNode:
                     MessageType.HEARTBEAT,
                     self.worker_id,
                     "master",
-                    {}
+                    {"freeMemory": self.free_memory(), "storedBytes": self.store.nbytes()}
                 )
-                self.socket.send(heartbeat.to_json().encode() + b'\n')
-                time.sleep(3)
+                # A heartbeat that would queue behind a bulk send is skipped:
+                # the master takes the bulk bytes arriving as proof of life
+                if self.send_lock.acquire(timeout=self.heartbeat_interval / 2):
+                    try:
+                        self._send_to_master(heartbeat)
+                    finally:
+                        self.send_lock.release()
+                else:
+                    self.metrics.count("heartbeat.skipped")
+                time.sleep(self.heartbeat_interval)
             except Exception as e:
                 self.logger.error(f"Heartbeat failed: {e}")
                 break
     
     def listen_for_messages(self):
-        buffer = ""
+        reader = MessageReader(self.socket, metrics=self.metrics)
         while self.running:
             try:
-                data = self.socket.recv(8192).decode()
-                if not data:
+                message = reader.read_message()
+                if message is None:
                     break
-                
-                buffer += data
-                while '\n' in buffer:
-                    line, buffer = buffer.split('\n', 1)
-                    if line:
-                        message = Message.from_json(line)
-                        self.handle_message(message)
-                        
             except ConnectionAbortedError:
                 self.logger.warning("Connection aborted.")
                 break
             except Exception as e:
                 self.logger.error(f"Error receiving message: {e}")
                 break
+            
+            # Framing is intact after a failed handler, so keep listening
+            try:
+                with self.metrics.timer(f"handle.{message.type}"):
+                    self.handle_message(message)
+            except Exception as e:
+                self.logger.error(f"Error handling {message.type}: {e}")
     
     def handle_message(self, message: Message):
         if message.type == MessageType.DISTRIBUTE_ARRAY:
             self.handle_distribute_array(message)
         elif message.type == MessageType.REPLICATE_DATA:
             self.handle_replicate_data(message)
+        elif message.type == MessageType.SEGMENT_CHUNK:
+            self.handle_segment_chunk(message)
         elif message.type == MessageType.RECOVER_DATA:
             self.handle_recover_data(message)
+        elif message.type == MessageType.COPY_SEGMENT:
+            self.handle_copy_segment(message)
+        elif message.type == MessageType.RECONCILE_SEGMENTS:
+            self.handle_reconcile_segments(message)
+        elif message.type == MessageType.DROP_ARRAY:
+            self.handle_drop_array(message)
         elif message.type == MessageType.PROCESS_SEGMENT:
             self.handle_process_segment(message)
+        elif message.type == MessageType.CANCEL_TASK:
+            self.handle_cancel_task(message)
+        elif message.type == MessageType.METRICS:
+            self.send_message(Message(MessageType.METRICS, self.worker_id, "master",
+                                      {"metricsId": message.data['metricsId'], "metrics": self.metrics.snapshot()}))
+        elif message.type == MessageType.REGISTER_WORKER:
+            self.binary_results = bool(message.data.get('binary', False))
+            self.master_codecs = [codec for codec in message.data.get('codecs', []) if codec in CODECS]
         elif message.type == MessageType.SHUTDOWN:
             self.shutdown()
     
@@ -133,28 +343,44 @@ class WorkerNode:
         data = message.data
         array_id = data['arrayId']
         data_type = data['dataType']
-        segment_data = data['data']
+        dtype = np.int32 if data_type == 'int' else np.float64
+        # Binary frames carry the segment as a payload; JSON-only masters send a list.
+        # Streamed segments are preallocated here and filled by SEGMENT_CHUNKs.
+        if data.get('streaming'):
+            segment_data = np.empty(data['endIndex'] - data['startIndex'], dtype=dtype)
+        elif message.payload is not None:
+            segment_data = message.payload
+        else:
+            segment_data = data['data']
         is_primary = data.get('isPrimary', True)  # Default to primary for backwards compatibility
+        segment_id = data.get('segmentId', 0)
         
-        segment_key = f"{array_id}_{data.get('segmentId', 0)}"
-        self.is_primary[segment_key] = is_primary
+        arr = np.asarray(segment_data, dtype=dtype)
+        self.store.put(array_id, segment_id, arr, primary=is_primary)
         
-        if data_type == 'int':
-            arr = np.array(segment_data, dtype=np.int32)
-            if is_primary:
-                self.int_segments[array_id] = arr
-                self.logger.info(f"Received PRIMARY int array segment: {array_id} with {len(segment_data)} elements")
-            else:
-                self.int_replicas[segment_key] = arr
-                self.logger.info(f"Received REPLICA int array segment: {segment_key} with {len(segment_data)} elements")
+        # Replicas go on down the chain as soon as they arrive; chunks of a
+        # streamed segment follow the same chain
+        chain = data.get('replicaChain', [])
+        self.forward(message, chain)
+        if data.get('streaming') and chain:
+            self.chains[(array_id, segment_id)] = chain
+        role = "PRIMARY" if is_primary else "REPLICA"
+        self.logger.info(f"Received {role} {data_type} array segment: {array_id}_{segment_id} "
+                         f"with {len(arr)} elements")
+        
+        if data.get('streaming') and len(arr) > 0:
+            self.filling[(array_id, segment_id, is_primary)] = len(arr)
         else:
-            arr = np.array(segment_data, dtype=np.float64)
-            if is_primary:
-                self.double_segments[array_id] = arr
-                self.logger.info(f"Received PRIMARY double array segment: {array_id} with {len(segment_data)} elements")
-            else:
-                self.double_replicas[segment_key] = arr
-                self.logger.info(f"Received REPLICA double array segment: {segment_key} with {len(segment_data)} elements")
+            self.send_ack(array_id, segment_id, is_primary)
+    
+    def send_ack(self, array_id: str, segment_id: int, is_primary: bool):
+        # The master answers CREATE_ARRAY once every copy is acknowledged
+        self.send_message(Message(MessageType.SEGMENT_ACK, self.worker_id, "master",
+                                  {"arrayId": array_id, "segmentId": segment_id, "isPrimary": is_primary}))
+        if self.checkpoint:
+            segment = self.store.get(array_id, segment_id, primary=is_primary)
+            if segment is not None:
+                self.checkpoint_pool.submit(self.checkpoint.save, array_id, segment_id, segment, is_primary)
     
     def handle_replicate_data(self, message: Message):
         # Same logic as distribute but always stored as replica
@@ -162,6 +388,49 @@ class WorkerNode:
         data['isPrimary'] = False
         self.handle_distribute_array(message)
     
+    def handle_segment_chunk(self, message: Message):
+        data = message.data
+        array_id = data['arrayId']
+        segment_id = data['segmentId']
+        
+        # Written through the store: the segment may have been spilled to disk
+        if not self.store.write(array_id, segment_id, data['offset'], message.payload, primary=data['isPrimary']):
+            self.logger.warning(f"Chunk for unallocated segment {array_id}_{segment_id}")
+            return
+        
+        self.forward(message, self.chains.get((array_id, segment_id), []))
+        
+        key = (array_id, segment_id, data['isPrimary'])
+        if key in self.filling:
+            self.filling[key] -= len(message.payload)
+            if self.filling[key] <= 0:
+                del self.filling[key]
+                self.chains.pop((array_id, segment_id), None)
+                self.send_ack(array_id, segment_id, data['isPrimary'])
+    
+    def handle_copy_segment(self, message: Message):
+        # Re-replication after a failure: send our copy straight to the new replica
+        data = message.data
+        array_id = data['arrayId']
+        segment_id = data['segmentId']
+        segment = self.store.lookup(array_id, segment_id)
+        if segment is None:
+            self.logger.warning(f"Cannot copy {array_id}_{segment_id}: not held here")
+            return
+        
+        target = data['target']
+        copy_data = {
+            "arrayId": array_id,
+            "segmentId": segment_id,
+            "startIndex": segment_id,
+            "endIndex": segment_id + len(segment),
+            "dataType": "int" if segment.dtype == np.int32 else "double",
+            "isPrimary": False
+        }
+        if self.send_to_peer(target, Message(MessageType.REPLICATE_DATA, self.worker_id, target['workerId'],
+                                             copy_data, payload=segment)):
+            self.logger.info(f"Copied {array_id}_{segment_id} to {target['workerId']}")
+    
     def handle_recover_data(self, message: Message):
         data = message.data
         array_id = data['arrayId']
@@ -172,17 +441,10 @@ class WorkerNode:
         
         if make_primary:
             # Promote replica to primary
-            int_replica = self.int_replicas.get(segment_key)
-            double_replica = self.double_replicas.get(segment_key)
-            
-            if int_replica is not None:
-                self.int_segments[array_id] = int_replica
-                self.is_primary[segment_key] = True
-                self.logger.info(f"Promoted int replica to primary for {segment_key}")
-            elif double_replica is not None:
-                self.double_segments[array_id] = double_replica
-                self.is_primary[segment_key] = True
-                self.logger.info(f"Promoted double replica to primary for {segment_key}")
+            if self.store.promote(array_id, segment_id):
+                self.logger.info(f"Promoted replica to primary for {segment_key}")
+                if self.checkpoint:
+                    self.checkpoint_pool.submit(self.checkpoint.set_role, array_id, segment_id, True)
             
             # Send recovery complete message
             response_data = {
@@ -196,130 +458,268 @@ class WorkerNode:
                 "master",
                 response_data
             )
-            self.socket.send(response.to_json().encode() + b'\n')
+            self.send_message(response)
+    
+    def handle_reconcile_segments(self, message: Message):
+        # The master's verdict on the segments announced at registration
+        kept = 0
+        dropped = []
+        for entry in message.data['segments']:
+            array_id, segment_id, role = entry['arrayId'], entry['segmentId'], entry['role']
+            if role == "drop":
+                self.store.remove(array_id, segment_id)
+                dropped.append((array_id, segment_id))
+                if self.checkpoint:
+                    self.checkpoint_pool.submit(self.checkpoint.drop, array_id, segment_id)
+                continue
+            if role == "primary":
+                self.store.promote(array_id, segment_id)
+            else:
+                self.store.demote(array_id, segment_id)
+            if self.checkpoint:
+                self.checkpoint_pool.submit(self.checkpoint.set_role, array_id, segment_id, role == "primary")
+            kept += 1
+        self.release_segments(dropped)
+        self.logger.info(f"Master kept {kept} of {len(message.data['segments'])} restored segment(s)")
+    
+    def handle_drop_array(self, message: Message):
+        # An array whose creation was abandoned, e.g. a stream cut short
+        array_id = message.data['arrayId']
+        segment_ids = self.store.remove_array(array_id)
+        self.release_segments([(array_id, segment_id) for segment_id in segment_ids])
+        for key in [key for key in self.filling if key[0] == array_id]:
+            del self.filling[key]
+        # Sent after the segments this worker forwarded, so it reaches the
+        # next worker of each chain behind them
+        peers = {}
+        for key in [key for key in self.chains if key[0] == array_id]:
+            chain = self.chains.pop(key)
+            peers[chain[0]['workerId']] = chain[0]
+        for peer in peers.values():
+            self.send_to_peer(peer, Message(MessageType.DROP_ARRAY, self.worker_id, peer['workerId'],
+                                            {"arrayId": array_id}))
+        if self.checkpoint:
+            for segment_id in segment_ids:
+                self.checkpoint_pool.submit(self.checkpoint.drop, array_id, segment_id)
+        if segment_ids:
+            self.logger.info(f"Dropped {len(segment_ids)} segment(s) of {array_id}")
     
     def handle_process_segment(self, message: Message):
         data = message.data
         array_id = data['arrayId']
         operation = data['operation']
+        backend = data.get('backend', ThreadBackend.name)
+        job_id = data.get('jobId')
+        trace_id = message.trace_id
+        received = time.time()
 
-        # Find the primary segment key to identify the segmentId
-        segment_key = next((key for key, is_primary in self.is_primary.items() 
-                            if is_primary and key.startswith(f"{array_id}_")), None)
-
-        if segment_key is None:
+        # A scheduling master names the partitions to run, which may be
+        # replicas taken over from a busy primary; otherwise run every primary
+        segment_ids = data.get('segmentIds')
+        if segment_ids is None:
+            segment_ids = self.store.primary_ids(array_id)
+        if not segment_ids:
             self.logger.warning(f"No primary segment found for array {array_id} on this worker. Cannot process.")
             return
 
-        segment_id = int(segment_key.split('_')[1])
+        # Every local partition is an independent task, so all cores stay busy
+        # even when partitions differ in cost; each reports its own result
+        for segment_id in segment_ids:
+            # A traced job gets this partition's times back with its result
+            timing = {"received": received} if trace_id is not None else None
+            if 'plan' in data:
+                future = self.thread_pool.submit(self.run_plan, array_id, segment_id, data['plan'], backend, timing)
+            else:
+                future = self.thread_pool.submit(self.process_operation, array_id, segment_id, operation, backend,
+                                                 timing)
+            if job_id is not None:
+                with self.task_lock:
+                    self.tasks[(job_id, segment_id)] = future
+            future.add_done_callback(
+                lambda f, segment_id=segment_id, timing=timing: self.finish_task(f, array_id, segment_id, backend,
+                                                                                 job_id, trace_id, timing)
+            )
+    
+    def handle_cancel_task(self, message: Message):
+        data = message.data
+        job_id = data['jobId']
+        for segment_id in data['segmentIds']:
+            key = (job_id, segment_id)
+            with self.task_lock:
+                future = self.tasks.get(key)
+                if future is None:
+                    continue
+                # A task that already started runs to the end; its result is dropped
+                self.cancelled.add(key)
+            future.cancel()
+            self.logger.info(f"Cancelled {data['arrayId']}_{segment_id} of {job_id}")
+    
+    def task_count(self, running: bool) -> int:
+        # Tasks waiting for a core, or running on one
+        with self.task_lock:
+            return sum(1 for future in self.tasks.values() if future.running() == running and not future.done())
+    
+    def finish_task(self, future, array_id: str, segment_id: int, backend: str, job_id: str,
+                    trace_id: Optional[str] = None, timing: Optional[Dict[str, float]] = None):
+        with self.task_lock:
+            self.tasks.pop((job_id, segment_id), None)
+            if (job_id, segment_id) in self.cancelled:
+                self.cancelled.discard((job_id, segment_id))
+                return
+        try:
+            result = future.result()
+        except Exception as e:
+            self.logger.error(f"Processing {array_id}_{segment_id} failed: {e}")
+            result = None
+        if result is not None:
+            self.send_result(array_id, segment_id, result, backend, job_id, trace_id, timing)
+        elif job_id is not None:
+            # Let the master hand the partition to another holder
+            self.send_message(Message(MessageType.SEGMENT_RESULT, self.worker_id, "master",
+                                      {"arrayId": array_id, "segmentId": segment_id, "status": "failed",
+                                       "backend": backend, "jobId": job_id}, trace_id=trace_id))
+    
+    def get_backend(self, name: str) -> ExecutionBackend:
+        # Backends are started on first use; the process pool is not free
+        with self.backend_lock:
+            if name not in self.backends:
+                self.backends[name] = BACKENDS[name](self.cores)
+                self.logger.info(f"Started {name} execution backend with {self.cores} executors")
+            return self.backends[name]
+    
+    def process_operation(self, array_id: str, segment_id: int, operation: str,
+                          backend: str = ThreadBackend.name, timing: Optional[Dict[str, float]] = None):
+        if backend not in BACKENDS:
+            self.logger.error(f"Unknown execution backend: {backend}")
+            return None
         
-        future = self.thread_pool.submit(self.process_operation, array_id, operation)
-        future.add_done_callback(lambda f: self.send_result(array_id, segment_id, f.result()))
-    
-    def process_operation(self, array_id: str, operation: str):
-        if operation == "example1":
-            return self.process_example1(array_id)
-        elif operation == "example2":
-            return self.process_example2(array_id)
-        else:
+        if operation not in ("example1", "example2") and operation not in kernels.KERNELS:
             self.logger.error(f"Unknown operation: {operation}")
             return None
+        
+        with self.metrics.timer(f"compute.{operation}"), compute_timing(timing):
+            if operation == "example1":
+                return self.process_example1(array_id, segment_id, backend)
+            elif operation == "example2":
+                return self.process_example2(array_id, segment_id, backend)
+            return self.run_kernel(kernels.KERNELS[operation], array_id, segment_id, backend)
+    
+    def process_example1(self, array_id: str, segment_id: int, backend: str = ThreadBackend.name):
+        result = self.run_kernel(kernels.EXAMPLE1, array_id, segment_id, backend)
+        if result is not None:
+            self.logger.info(f"Completed Example 1 processing for {array_id}_{segment_id} ({backend} backend)")
+        return result
+    
+    def process_example2(self, array_id: str, segment_id: int, backend: str = ThreadBackend.name):
+        result = self.run_kernel(kernels.EXAMPLE2, array_id, segment_id, backend)
+        if result is not None:
+            self.logger.info(f"Completed Example 2 processing for {array_id}_{segment_id} ({backend} backend)")
+        return result
     
-    def process_example1(self, array_id: str):
-        segment = self.double_segments.get(array_id)
+    def release_segments(self, keys: List[Tuple[str, int]]):
+        # Spilled or removed segments must not stay pinned in a backend's shared memory
+        with self.backend_lock:
+            backends = list(self.backends.values())
+        for array_id, segment_id in keys:
+            for backend in backends:
+                backend.release(f"{array_id}_{segment_id}")
+    
+    def segments_spilled(self, keys: List[Tuple[str, int]]):
+        self.release_segments(keys)
+        self.logger.info(f"Spilled {len(keys)} segment(s) to {self.spill_dir}")
+    
+    def place_segment(self, array_id: str, segment_id: int, backend: ExecutionBackend):
+        segment = self.store.lookup(array_id, segment_id)
         if segment is None:
             return None
-        
-        # Parallel processing using threading
-        num_threads = min(self.cores, len(segment))
-        chunk_size = len(segment) // num_threads
-        results = []
-        
-        def process_chunk(start, end):
-            result = np.zeros(end - start)
-            for i in range(start, end):
-                x = segment[i]
-                result[i - start] = ((np.sin(x) + np.cos(x)) ** 2) / (np.sqrt(np.abs(x)) + 1)
-            return result
-        
-        futures = []
-        for i in range(num_threads):
-            start = i * chunk_size
-            end = len(segment) if i == num_threads - 1 else (i + 1) * chunk_size
-            future = self.thread_pool.submit(process_chunk, start, end)
-            futures.append(future)
-        
-        # Combine results
-        result = np.concatenate([f.result() for f in futures])
-        self.double_segments[f"{array_id}_result"] = result
-        
-        self.logger.info(f"Completed Example 1 processing for {array_id}")
-        return result.tolist()
+        # The backend may move the segment (e.g. into shared memory); keep its copy
+        placed = backend.place(f"{array_id}_{segment_id}", segment)
+        if placed is not segment:
+            self.store.replace(array_id, segment_id, placed)
+        return placed
     
-    def process_example2(self, array_id: str):
-        segment = self.int_segments.get(array_id)
-        if segment is None:
+    def run_kernel(self, kernel: kernels.Kernel, array_id: str, segment_id: int, backend_name: str):
+        backend = self.get_backend(backend_name)
+        segment = self.place_segment(array_id, segment_id, backend)
+        if segment is None or segment.dtype != kernel.input_dtype:
             return None
         
-        # Parallel processing using threading
-        num_threads = min(self.cores, len(segment))
-        chunk_size = len(segment) // num_threads
-        
-        def process_chunk(start, end):
-            result = np.zeros(end - start, dtype=np.int32)
-            for i in range(start, end):
-                x = segment[i]
-                if x % 3 == 0 or (500 <= x <= 1000):
-                    result[i - start] = int((x * np.log(x)) % 7)
-                else:
-                    result[i - start] = x
-            return result
-        
-        futures = []
-        for i in range(num_threads):
-            start = i * chunk_size
-            end = len(segment) if i == num_threads - 1 else (i + 1) * chunk_size
-            future = self.thread_pool.submit(process_chunk, start, end)
-            futures.append(future)
-        
-        # Combine results
-        result = np.concatenate([f.result() for f in futures])
-        self.int_segments[f"{array_id}_result"] = result
-        
-        self.logger.info(f"Completed Example 2 processing for {array_id}")
-        return result.tolist()
+        # Results go straight back to the master; only segments are kept
+        return backend.run(kernel, f"{array_id}_{segment_id}", segment)
     
-    def send_result(self, array_id: str, segment_id: int, result_data: list):
-        if result_data:
-            result_msg = Message(
-                MessageType.SEGMENT_RESULT,
-                self.worker_id,
-                "master",
-                {
-                    "arrayId": array_id,
-                    "status": "completed",
-                    "segmentId": segment_id,
-                    "data": result_data
-                }
-            )
-            self.socket.send(result_msg.to_json().encode() + b'\n')
+    def run_plan(self, array_id: str, segment_id: int, plan_spec: Dict[str, Any], backend_name: str,
+                 timing: Optional[Dict[str, float]] = None):
+        if backend_name not in BACKENDS:
+            self.logger.error(f"Unknown execution backend: {backend_name}")
+            return None
+        with compute_timing(timing):
+            backend = self.get_backend(backend_name)
+            segment = self.place_segment(array_id, segment_id, backend)
+            if segment is None:
+                return None
+            
+            plan = Plan.from_dict(plan_spec, segment.dtype)
+            with self.metrics.timer(f"compute.plan.{plan.action}"):
+                result = backend.run_plan(plan, f"{array_id}_{segment_id}", segment)
+        self.logger.info(f"Completed {len(plan.steps)}-step {plan.action} plan for {array_id}_{segment_id} "
+                         f"({backend_name} backend)")
+        return result
+    
+    def send_result(self, array_id: str, segment_id: int, result_data: np.ndarray,
+                    backend: str = ThreadBackend.name, job_id: str = None, trace_id: Optional[str] = None,
+                    timing: Optional[Dict[str, float]] = None):
+        if result_data is not None:
+            msg_data = {
+                "arrayId": array_id,
+                "status": "completed",
+                "segmentId": segment_id,
+                "backend": backend,
+                "jobId": job_id
+            }
+            if timing is not None:
+                msg_data["timing"] = timing
+            if self.binary_results:
+                result_msg = Message(MessageType.SEGMENT_RESULT, self.worker_id, "master",
+                                     msg_data, payload=result_data, trace_id=trace_id)
+                self.compress(result_msg, self.master_codecs, self.master_link)
+            else:
+                msg_data["data"] = result_data.tolist()
+                result_msg = Message(MessageType.SEGMENT_RESULT, self.worker_id, "master", msg_data,
+                                     trace_id=trace_id)
+            self.send_message(result_msg)
     
     def shutdown(self):
         self.running = False
         self.thread_pool.shutdown()
+        self.checkpoint_pool.shutdown()
+        for backend in self.backends.values():
+            backend.shutdown()
+        if self.peer_server:
+            self.peer_server.close()
+        for sock in self.peers.values():
+            sock.close()
         if self.socket:
             self.socket.close()
+        self.store.close()
 
 def main():
     if len(sys.argv) < 4:
-        print("Usage: worker_node.py <worker_id> <master_host> <master_port>")
+        print("Usage: worker_node.py <worker_id> <master_host> <master_port> [peer_port] [heartbeat_interval] "
+              "[memory_budget_mb] [spill_dir] [checkpoint_dir]")
         sys.exit(1)
     
     worker_id = sys.argv[1]
     master_host = sys.argv[2]
     master_port = int(sys.argv[3])
+    peer_port = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+    heartbeat_interval = float(sys.argv[5]) if len(sys.argv) > 5 else 0.5
+    # A budget of 0 and a spill_dir of "-" keep the defaults: no limit, a temporary directory
+    memory_budget = int(float(sys.argv[6]) * 1024 * 1024) if len(sys.argv) > 6 and float(sys.argv[6]) > 0 else None
+    spill_dir = sys.argv[7] if len(sys.argv) > 7 and sys.argv[7] != "-" else None
+    checkpoint_dir = sys.argv[8] if len(sys.argv) > 8 else None
     
-    worker = WorkerNode(worker_id, master_host, master_port)
+    worker = WorkerNode(worker_id, master_host, master_port, peer_port, heartbeat_interval,
+                        memory_budget, spill_dir, checkpoint_dir)
     
     try:
         worker.start()